@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import yaml
+
+from pipeline.allocation_pipeline import AllocationPipeline
+from pipeline.bom_cache import BomCache
+from utils.logger import EngineLogger
+
+# BOM cache of this worker process, shared by every client it runs
+_BOM_CACHE = None
+
+
+def _init_worker(bom_cache_entries):
+    # Pipeline, Polars and NumPy are imported with this module, once per
+    # worker; only the cache is created here
+    global _BOM_CACHE
+    _BOM_CACHE = BomCache(bom_cache_entries)
+
+
+def load_config(config_path) -> dict:
+    with open(config_path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def run_client(config_path) -> dict:
+    """Runs one client's pipeline; returns its summary (failures are reported, not raised)."""
+    summary = {"config": str(config_path), "client": None, "status": "failed", "error": None, "pid": os.getpid()}
+    started = time.perf_counter()
+    hits = _BOM_CACHE.hits if _BOM_CACHE is not None else 0
+    logger = None
+    try:
+        config = load_config(config_path)
+        summary["client"] = config.get("client", "UNKNOWN")
+        logger = EngineLogger.from_config(config)
+        logger.info("Starting Allocation Pipeline (batch run)...")
+
+        pipeline = AllocationPipeline(config, logger, bom_cache=_BOM_CACHE)
+        pipeline.run()
+        logger.info("Pipeline completed successfully!!!")
+
+        summary["status"] = "ok"
+        report = pipeline.stage_report or {}
+        summary["pipeline_seconds"] = report.get("wall_seconds")
+        summary["critical_path_seconds"] = report.get("critical_path_seconds")
+        summary["critical_path"] = report.get("critical_path")
+        summary["stage_seconds"] = report.get("stage_seconds")
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        if logger is not None:
+            logger.critical("Fatal pipeline error occurred", exc_info=True)
+    finally:
+        if logger is not None:
+            logger.write_run_footer()
+            # The next client of this worker may get the same logger name
+            logger.close()
+
+    summary["bom_cache_hit"] = _BOM_CACHE is not None and _BOM_CACHE.hits > hits
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def run_clients(indexed_paths) -> list:
+    return [(i, run_client(path)) for i, path in indexed_paths]
+
+
+def group_by_bom(config_paths) -> list:
+    """
+    (position, config path) pairs grouped by BOM cache key, in first-seen
+    order. A group runs on one worker, so clients with the same BOM master
+    share its BOMTree; configs without a readable BOM (or config) run on
+    their own.
+    """
+    groups = {}
+    for i, path in enumerate(config_paths):
+        try:
+            key = BomCache.key(load_config(path))
+        except Exception:
+            key = None
+        groups.setdefault(key if key is not None else ("single", i), []).append((i, path))
+    return list(groups.values())
+
+
+def run_batch(config_paths, workers=None, bom_cache_entries: int = 4) -> list:
+    """Runs every config on a persistent worker pool; returns the client summaries in config order."""
+    groups = group_by_bom(config_paths)
+    workers = max(1, min(int(workers or os.cpu_count() or 1), len(groups)))
+    summaries = [None] * len(config_paths)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(bom_cache_entries,)) as executor:
+        futures = [executor.submit(run_clients, group) for group in groups]
+        for future in as_completed(futures):
+            for i, summary in future.result():
+                summaries[i] = summary
+    return summaries
+
+
+def print_summary(summaries, wall_seconds):
+    def fmt(seconds):
+        return "-" if seconds is None else f"{seconds:.2f}"
+
+    print(f"{'Client':<16} {'Status':<7} {'Total s':>8} {'Pipeline s':>10} {'Crit. path s':>12} {'BOM cache':>9} {'PID':>7}  Config")
+    for s in summaries:
+        print(
+            f"{str(s['client']):<16} {s['status']:<7} {fmt(s['seconds']):>8} {fmt(s.get('pipeline_seconds')):>10} "
+            f"{fmt(s.get('critical_path_seconds')):>12} {'hit' if s['bom_cache_hit'] else 'miss':>9} {s['pid']:>7}  {s['config']}"
+        )
+        if s["error"]:
+            print(f"    error: {s['error']}")
+    failed = sum(s["status"] != "ok" for s in summaries)
+    print(
+        f"Batch | Clients={len(summaries)} | Failed={failed} | Wall={wall_seconds:.2f}s | "
+        f"Client total={sum(s['seconds'] for s in summaries):.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the allocation pipeline for several client configs on a warm worker pool."
+    )
+    parser.add_argument("configs", nargs="+", help="Client config files")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--bom-cache-entries", type=int, default=4, help="Compiled BOMs kept per worker")
+    parser.add_argument("--summary", help="Also write the per-client summary as JSON to this file")
+    args = parser.parse_args()
+
+    config_paths = [str(Path(p).resolve()) for p in args.configs]
+    started = time.perf_counter()
+    summaries = run_batch(config_paths, workers=args.workers, bom_cache_entries=args.bom_cache_entries)
+    wall_seconds = time.perf_counter() - started
+
+    print_summary(summaries, wall_seconds)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump({"wall_seconds": wall_seconds, "clients": summaries}, f, indent=2)
+    if any(s["status"] != "ok" for s in summaries):
+        raise SystemExit(1)
+
+
+# Worker processes (spawn start method) re-import this module; only the
+# parent runs the batch.
+if __name__ == "__main__":
+    main()
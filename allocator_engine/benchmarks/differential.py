@@ -0,0 +1,310 @@
+"""
+Differential equivalence + throughput harness for allocation strategies.
+
+Generates randomized SO / stock / BOM inputs (SFG orders, SOs without stock,
+zero quantities and blanks, SO-level stock, components shared across FGs)
+and runs every strategy registered in ORDER_ALLOCATORS / COMPONENT_ALLOCATORS
+on each of them. Outputs, SO frames, remark events and remaining stock are
+diffed against the reference (`partial`) within a float tolerance, and the
+allocate() time of every strategy is recorded, so speed and correctness
+are tracked together.
+
+Usage (from allocator_engine/):
+    python -m benchmarks.differential [--seeds 5] [--orders 500] [--fgs 40]
+        [--components 200] [--tolerance 1e-6] [--json results.jsonl]
+        [--fixed-precision 3]
+
+--fixed-precision runs every strategy (reference included) on fixed-point
+quantities with that many decimals.
+
+Exits with status 1 if any strategy differs from the reference.
+"""
+import argparse
+import json
+import logging
+import random
+import time
+
+import polars as pl
+
+from common.bom_tree import BOMTree
+from common.key_dictionary import KeyDictionary
+from common.quantities import QuantityScale
+from common.remarks import RemarkCode
+from common.stock_manager import STOCK_BUCKETS
+from common.stock_preparer import StockPreparer
+from pipeline.phase_registry import COMPONENT_ALLOCATORS, ORDER_ALLOCATORS
+
+REFERENCE = "partial"
+
+# Extra configs per strategy; every registered strategy runs at least with {}
+STRATEGY_VARIANTS = {}
+
+STOCK_KEYS = ["plant", "item_id", "order_id"]
+
+
+# ---------------- INPUTS ----------------
+def random_inputs(seed: int, n_orders: int, n_fgs: int, n_components: int, n_plants: int = 3) -> dict:
+    """
+    so_df / stock_df / bom_df in internal column names (as after SchemaResolver).
+
+    Components are only ever children of lower-numbered items, so BOMs are
+    acyclic; each FG draws from the whole component pool, so components are
+    shared between FGs and plants.
+    """
+    rng = random.Random(seed)
+    plants = [f"P{i}" for i in range(n_plants)]
+    fgs = [f"FG{i}" for i in range(n_fgs)]
+    components = [f"C{i}" for i in range(n_components)]
+
+    bom = {"root_parent": [], "parent": [], "child": [], "comp_qty": [], "plant": []}
+    internal_nodes = {}
+    for plant in plants:
+        for fg in fgs:
+            if rng.random() < 0.15:
+                continue  # FG without BOM at this plant
+            frontier, used = [fg], {fg}
+            for _ in range(rng.randint(1, 5)):
+                next_frontier = []
+                for parent in frontier:
+                    low = components.index(parent) + 1 if parent in used and parent != fg else 0
+                    for _ in range(rng.randint(0, 4)):
+                        if low >= len(components):
+                            break
+                        child = rng.choice(components[low:])
+                        if child in used:
+                            continue
+                        used.add(child)
+                        bom["root_parent"].append(fg)
+                        bom["parent"].append(parent)
+                        bom["child"].append(child)
+                        bom["comp_qty"].append(rng.choice([1.0, 2.0, 0.5, 0.1, 3.0, 0.3333, 0.0]))
+                        bom["plant"].append(plant)
+                        if parent != fg:
+                            internal_nodes.setdefault(plant, []).append(parent)
+                        next_frontier.append(child)
+                frontier = next_frontier
+
+    so = {"order_id": [], "fg_id": [], "order_qty": [], "plant": []}
+    for i in range(n_orders):
+        plant = rng.choice(plants)
+        roll = rng.random()
+        if roll < 0.15 and internal_nodes.get(plant):
+            fg = rng.choice(internal_nodes[plant])        # SFG ordered directly
+        elif roll < 0.2:
+            fg = rng.choice(components)                   # possibly unknown item
+        else:
+            fg = rng.choice(fgs)
+        so["order_id"].append(str(100_000 + i))
+        so["fg_id"].append(fg)
+        so["order_qty"].append(rng.choice([0.0, 1.0, 5.0, 10.0, 2.5, 7.0, 20.0, 100.0, None]))
+        so["plant"].append(plant)
+
+    stock = {col: [] for col in ["order_id", "item_id", "plant", *STOCK_BUCKETS]}
+
+    def add_stock(order_id, item, plant):
+        stock["order_id"].append(order_id)
+        stock["item_id"].append(item)
+        stock["plant"].append(plant)
+        stock["stock_on_hand"].append(rng.choice([0.0, 1.0, 3.0, 10.0, 50.0, None]))
+        stock["stock_in_qc"].append(rng.choice([0.0, 2.0, 5.0, None]))
+        stock["stock_in_transit"].append(rng.choice([0.0, 4.0, 7.5]))
+
+    for plant in plants:
+        for item in fgs + components:
+            if rng.random() < 0.6:                        # the rest has no stock at all
+                add_stock(rng.choice(["", None]), item, plant)
+    for i in rng.sample(range(n_orders), n_orders // 8):  # SO-level stock
+        add_stock(so["order_id"][i], rng.choice([so["fg_id"][i], *rng.sample(components, 3)]), so["plant"][i])
+
+    return {
+        "so_df": pl.DataFrame(so, schema={"order_id": pl.Utf8, "fg_id": pl.Utf8, "order_qty": pl.Float64, "plant": pl.Utf8}),
+        "stock_df": pl.DataFrame(stock, schema={
+            "order_id": pl.Utf8, "item_id": pl.Utf8, "plant": pl.Utf8, **{c: pl.Float64 for c in STOCK_BUCKETS}
+        }),
+        "bom_df": pl.DataFrame(bom, schema={
+            "root_parent": pl.Utf8, "parent": pl.Utf8, "child": pl.Utf8, "comp_qty": pl.Float64, "plant": pl.Utf8
+        }),
+    }
+
+
+# ---------------- DIFF ----------------
+def diff_frames(ref: pl.DataFrame, new: pl.DataFrame, tolerance: float, sort_by=None):
+    """Returns (None, max_abs_diff) if equal within tolerance, else (description, max_abs_diff)."""
+    if ref is None or new is None:
+        return (None if ref is None and new is None else "frame missing on one side"), 0.0
+    if ref.columns != new.columns:
+        return f"columns differ: {ref.columns} vs {new.columns}", 0.0
+    if ref.height != new.height:
+        return f"row count differs: {ref.height} vs {new.height}", 0.0
+    if sort_by:
+        ref = ref.sort(sort_by, nulls_last=True)
+        new = new.sort(sort_by, nulls_last=True)
+
+    max_diff = 0.0
+    for col in ref.columns:
+        a, b = ref[col], new[col]
+        if a.dtype.is_numeric() and b.dtype.is_numeric():
+            a, b = a.cast(pl.Float64).fill_null(0.0), b.cast(pl.Float64).fill_null(0.0)
+            delta = (a - b).abs()
+            col_max = float(delta.max() or 0.0)
+            max_diff = max(max_diff, col_max)
+            if col_max > tolerance:
+                row = int(delta.arg_max())
+                return f"{col} differs by {col_max:.3g} at row {row} ({a[row]} vs {b[row]})", max_diff
+        else:
+            mismatch = (a.cast(pl.Utf8) != b.cast(pl.Utf8)).fill_null(True) & ~(a.is_null() & b.is_null())
+            if mismatch.any():
+                row = int(mismatch.arg_max())
+                return f"{col} differs at row {row} ({a[row]!r} vs {b[row]!r})", max_diff
+    return None, max_diff
+
+
+# ---------------- RUNS ----------------
+def _quiet_logger():
+    logger = logging.getLogger("allocator_engine.differential")
+    logger.setLevel(logging.ERROR)
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def run_order(allocator_cls, inputs, config, logger, scale=None) -> dict:
+    keys = KeyDictionary()
+    stock_manager = StockPreparer(logger).build_stock_manager(inputs["stock_df"], keys, log_consumption=False, scale=scale)
+    allocator = allocator_cls(inputs["so_df"], stock_manager, config=config, logger=logger)
+    start = time.perf_counter()
+    so_df, remaining_stock_df = allocator.allocate()
+    return {
+        "seconds": time.perf_counter() - start,
+        "so_df": so_df,
+        "remarks_df": allocator.remarks_df,
+        "stock_df": remaining_stock_df,
+        "rows": so_df.height,
+    }
+
+
+def run_component(allocator_cls, inputs, config, logger, scale=None) -> dict:
+    keys = KeyDictionary()
+    stock_manager = StockPreparer(logger).build_stock_manager(inputs["stock_df"], keys, log_consumption=False, scale=scale)
+    bom_tree = BOMTree(inputs["bom_df"], logger=logger, keys=keys)
+    bom_tree.compile()
+    allocator = allocator_cls(inputs["so_df"], bom_tree, stock_manager, config=config, logger=logger)
+    start = time.perf_counter()
+    output_df = allocator.allocate()
+    return {
+        "seconds": time.perf_counter() - start,
+        "output_df": output_df,
+        "so_df": allocator.so_df,
+        "remarks_df": allocator.remarks_df,
+        "stock_df": stock_manager.remaining_stock_df(),
+        "rows": output_df.height,
+    }
+
+
+def significant_remarks(remarks_df, tolerance: float):
+    """
+    Drops "no stock" remarks for components whose demand is float residue
+    (|qty| <= tolerance): whether such a node exists depends on rounding
+    (e.g. 1.0 - 0.3 - 0.7), not on allocation logic.
+    """
+    if remarks_df is None:
+        return None
+    return remarks_df.filter(
+        ~((pl.col("Remark") == RemarkCode.COMPONENT_NO_STOCK.name) & (pl.col("Qty").abs() <= tolerance))
+    ).with_columns(pl.int_range(pl.len()).over("SO_ID").cast(pl.Int64).alias("Seq"))
+
+
+def compare(ref: dict, new: dict, tolerance: float):
+    """First difference between two runs (or None) and the largest numeric deviation seen."""
+    checks = [
+        ("output", "output_df", None),
+        ("so", "so_df", None),
+        ("remarks", "remarks_df", None),
+        ("stock", "stock_df", STOCK_KEYS),
+    ]
+    max_diff = 0.0
+    for label, key, sort_by in checks:
+        if key not in ref:
+            continue
+        ref_df, new_df = ref[key], new[key]
+        if key == "remarks_df":
+            ref_df, new_df = significant_remarks(ref_df, tolerance), significant_remarks(new_df, tolerance)
+        problem, frame_max = diff_frames(ref_df, new_df, tolerance, sort_by)
+        max_diff = max(max_diff, frame_max)
+        if problem:
+            return f"{label}: {problem}", max_diff
+    return None, max_diff
+
+
+def strategies(registry):
+    for name, allocator_cls in registry.items():
+        for variant in STRATEGY_VARIANTS.get(name, [{}]):
+            label = name + "".join(f"[{v}]" for v in variant.values())
+            yield label, allocator_cls, variant
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--fgs", type=int, default=40)
+    parser.add_argument("--components", type=int, default=200)
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    parser.add_argument("--json", help="append one JSON line per (seed, phase, strategy) to this file")
+    parser.add_argument("--fixed-precision", type=int, help="fixed-point quantities with this many decimals")
+    args = parser.parse_args()
+    scale = QuantityScale(args.fixed_precision) if args.fixed_precision is not None else None
+
+    logger = _quiet_logger()
+    # Remarks as event tables: numeric fields are compared with tolerance, not as text
+    base_config = {"remarks": "codes"}
+    phases = [
+        ("order_allocation", ORDER_ALLOCATORS, run_order),
+        ("component_allocation", COMPONENT_ALLOCATORS, run_component),
+    ]
+
+    results = []
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        inputs = random_inputs(seed, args.orders, args.fgs, args.components)
+        for phase, registry, run in phases:
+            ref = run(registry[REFERENCE], inputs, base_config, logger, scale)
+            for label, allocator_cls, variant in strategies(registry):
+                new = ref if label == REFERENCE else run(allocator_cls, inputs, {**base_config, **variant}, logger, scale)
+                problem, max_diff = compare(ref, new, args.tolerance)
+                results.append({
+                    "seed": seed,
+                    "phase": phase,
+                    "strategy": label,
+                    "status": "DIFF" if problem else "MATCH",
+                    "detail": problem,
+                    "max_abs_diff": max_diff,
+                    "seconds": round(new["seconds"], 4),
+                    "orders_per_s": round(inputs["so_df"].height / new["seconds"], 1) if new["seconds"] else None,
+                    "rows_per_s": round(new["rows"] / new["seconds"], 1) if new["seconds"] else None,
+                    "speedup": round(ref["seconds"] / new["seconds"], 2) if new["seconds"] else None,
+                })
+
+    print(f"{'seed':>4}  {'phase':<21} {'strategy':<32} {'status':<6} {'max diff':>9} {'seconds':>8} {'orders/s':>10} {'speedup':>7}")
+    for r in results:
+        print(
+            f"{r['seed']:>4}  {r['phase']:<21} {r['strategy']:<32} {r['status']:<6} {r['max_abs_diff']:>9.2g} "
+            f"{r['seconds']:>8.3f} {r['orders_per_s'] or 0:>10,.0f} {r['speedup'] or 0:>6.2f}x"
+        )
+        if r["detail"]:
+            print(f"      -> {r['detail']}")
+
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+
+    failures = sum(r["status"] == "DIFF" for r in results)
+    print(f"\n{len(results) - failures}/{len(results)} runs match the reference.")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Worker start-up cost: pickled BOMTree vs shared memory attach.
+
+Builds a synthetic BOM, then times how long a fresh (spawned) worker takes
+to receive the BOM and answer one resolve_fg, either by unpickling the
+BOMTree dicts or by attaching to the arrays of BOMTree.to_shared(). Both
+workers must resolve the FG like the parent's BOMTree, and the pickled
+BOMTree must round-trip.
+
+Usage (from allocator_engine/):
+    python -m benchmarks.shared_memory_startup [--edges 1000000] [--fanout 10]
+"""
+import argparse
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+
+from common.bom_tree import BOMTree, SharedBOMView
+from common.key_dictionary import KeyDictionary
+from common.shared_arrays import SharedArrays
+
+
+def synthetic_bom(n_edges: int, fanout: int, edges_per_tree: int = 100) -> pl.DataFrame:
+    """Trees of edges_per_tree edges; each node has up to fanout children."""
+    rows = {"root_parent": [], "plant": [], "parent": [], "child": [], "comp_qty": []}
+    n_trees = max(1, n_edges // edges_per_tree)
+    for t in range(n_trees):
+        root = f"FG{t}"
+        plant = f"P{t % 4}"
+        for e in range(edges_per_tree):
+            parent = root if e < fanout else f"C{t}_{e // fanout - 1}"
+            rows["root_parent"].append(root)
+            rows["plant"].append(plant)
+            rows["parent"].append(parent)
+            rows["child"].append(f"C{t}_{e}")
+            rows["comp_qty"].append(1.0 + e % 3)
+    return pl.DataFrame(rows)
+
+
+def _noop():
+    return None
+
+
+def _lookup_pickled(payload: bytes, fg, plant):
+    start = time.perf_counter()
+    bom_tree = pickle.loads(payload)
+    root, _, resolution = bom_tree.resolve_fg(fg, plant)
+    return time.perf_counter() - start, (root, resolution)
+
+
+def _lookup_shared(handle, fg, plant):
+    start = time.perf_counter()
+    shared = SharedArrays.attach(handle)
+    view = SharedBOMView(shared)
+    root, _, resolution = view.resolve_fg(fg, plant)
+    elapsed = time.perf_counter() - start
+    del view
+    shared.close()
+    return elapsed, (root, resolution)
+
+
+def check_pickle_round_trip(bom_tree: BOMTree, payload: bytes, fg, plant):
+    """Unpickled BOMTree resolves like the original and its KeyDictionary still interns."""
+    restored = pickle.loads(payload)
+    assert restored.resolve_fg(fg, plant) == bom_tree.resolve_fg(fg, plant), "unpickled BOMTree resolves differently"
+    assert restored.keys.encode("__pickle_check__") == len(bom_tree.keys), "unpickled KeyDictionary cannot intern"
+
+
+def _time_worker(fn, *args):
+    """Round trip of one task on a warm spawned worker (imports already done)."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        executor.submit(_noop).result()
+        start = time.perf_counter()
+        in_worker, resolved = executor.submit(fn, *args).result()
+        return time.perf_counter() - start, in_worker, resolved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, default=1_000_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    bom_df = synthetic_bom(args.edges, args.fanout)
+    keys = KeyDictionary()
+    bom_tree = BOMTree(bom_df, keys=keys)
+    print(f"BOM build        : {len(bom_df):,} edges, {len(bom_tree.bom_tree_map):,} trees in {time.perf_counter() - start:.2f}s")
+
+    fg, plant = keys.lookup("FG0"), keys.lookup("P0")
+    bom_tree.logger = None
+
+    start = time.perf_counter()
+    payload = pickle.dumps(bom_tree, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"Pickle           : {len(payload) / 1e6:,.1f} MB in {time.perf_counter() - start:.2f}s")
+    check_pickle_round_trip(bom_tree, payload, fg, plant)
+
+    start = time.perf_counter()
+    shared = bom_tree.to_shared()
+    print(f"Shared export    : {shared.nbytes / 1e6:,.1f} MB in {time.perf_counter() - start:.2f}s")
+
+    root, _, resolution = bom_tree.resolve_fg(fg, plant)
+    try:
+        total, in_worker, resolved = _time_worker(_lookup_pickled, payload, fg, plant)
+        assert resolved == (root, resolution), "pickled worker resolves differently"
+        print(f"Worker (pickled) : {total * 1e3:,.1f} ms round trip, {in_worker * 1e3:,.1f} ms unpickle + lookup")
+
+        total, in_worker, resolved = _time_worker(_lookup_shared, shared.handle, fg, plant)
+        assert resolved == (root, resolution), "shared worker resolves differently"
+        print(f"Worker (shared)  : {total * 1e3:,.1f} ms round trip, {in_worker * 1e3:,.1f} ms attach + lookup")
+    finally:
+        shared.unlink()
+
+
+if __name__ == "__main__":
+    main()
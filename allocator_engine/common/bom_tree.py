@@ -1,12 +1,82 @@
 from collections import defaultdict
+import numpy as np
+import polars as pl
+
+from common.key_dictionary import KeyDictionary
+from common.shared_arrays import SharedArrays, composite_keys
+from utils.memory import deep_sizeof, total_bytes
+
+
+class BOMCompileError(ValueError):
+    """Raised by BOMTree.compile for cyclic or too-deep BOMs."""
+
+
+class Explosion:
+    """
+    Flat BFS explosion of one BOM from a start item, in the exact order a
+    queue-based BFS visits nodes (children in BOM row order).
+    Per position: item, parent item, parent position (-1 for the start),
+    level, ratio to the parent, first child position / child count
+    (children are contiguous in BFS order) and subtree size (nodes at and
+    below the position).
+    peak_queue is the longest BFS frontier seen while building.
+    """
+
+    __slots__ = ("items", "parents", "parent_pos", "levels", "ratios",
+                 "child_start", "child_count", "subtree_sizes", "peak_queue")
+
+    def __init__(self, tree, start, max_nodes=None):
+        self.items = [start]
+        self.parents = [None]
+        self.parent_pos = [-1]
+        self.levels = [0]
+        self.ratios = [None]
+        self.child_start = []
+        self.child_count = []
+        self.peak_queue = 1
+
+        pos = 0
+        while pos < len(self.items):
+            item = self.items[pos]
+            children = tree.get(item, [])
+            self.child_start.append(len(self.items))
+            self.child_count.append(len(children))
+            for child in children:
+                self.items.append(child["child"])
+                self.parents.append(item)
+                self.parent_pos.append(pos)
+                self.levels.append(self.levels[pos] + 1)
+                self.ratios.append(child["ratio"])
+            if max_nodes is not None and len(self.items) > max_nodes:
+                raise BOMCompileError(f"BOM explosion exceeds {max_nodes} nodes (cyclic BOM?)")
+            self.peak_queue = max(self.peak_queue, len(self.items) - pos)
+            pos += 1
+
+        self.subtree_sizes = [1] * len(self.items)
+        for pos in range(len(self.items) - 1, 0, -1):
+            self.subtree_sizes[self.parent_pos[pos]] += self.subtree_sizes[pos]
+
+    def __len__(self):
+        return len(self.items)
 
 class BOMTree:
-    def __init__(self, bom_df, logger=None):
+    def __init__(self, bom_df, logger=None, keys: KeyDictionary | None = None):
         """
         BOM is uniquely identified by (Finished_Good, Plant)
+        All item / plant values are interned ids from the shared KeyDictionary.
         """
         self.bom_tree_map = {}
+        self._where_used = None
+        # Filled by compile(); (root, plant) -> {"depth", "explosion_size"}
+        self.compiled = None
+        self._explosions = {}
         self.logger = logger
+        self.keys = keys if keys is not None else KeyDictionary()
+
+        bom_df = bom_df.with_columns([
+            self.keys.encode_series(bom_df[c])
+            for c in ["root_parent", "plant", "parent", "child"]
+        ])
 
         # Group by FG + Plant
         grouped = defaultdict(list)
@@ -49,3 +119,348 @@ class BOMTree:
         # Not found
         return None, None, "NOT_FOUND"
 
+    # ---------------- COMPILE ----------------
+    def compile(self, max_depth: int | None = None, on_cycle: str = "error"):
+        """
+        Validates every (root, plant) tree once:
+        - detects parent -> child cycles (self-referencing rows included)
+        - records the tree depth (longest path from the root, over a
+          topological order) and the size of the full explosion from the
+          root, for limits and reporting
+
+        on_cycle: error -> raise BOMCompileError listing all cycles;
+                  break -> drop the BOM rows that close a cycle, with a warning.
+        max_depth: raise BOMCompileError if any tree is deeper.
+        Explosions (see explosion()) are only built on a compiled BOM, on
+        first use per start item (a root or any SFG inside it).
+        """
+        decode = self.keys.decode
+        cycles = []
+        too_deep = []
+        self.compiled = {}
+        self._explosions = {}
+
+        for (root, plant), tree in self.bom_tree_map.items():
+            order, back_edges = self._topological_order(root, tree)
+
+            for parent, child, path in back_edges:
+                cycles.append(
+                    f"FG '{decode(root)}' @ Plant '{decode(plant)}': "
+                    + " > ".join(decode(i) or "" for i in path + [child])
+                )
+                if on_cycle == "break":
+                    tree[parent] = [e for e in tree[parent] if e["child"] != child]
+            if back_edges:
+                if on_cycle != "break":
+                    continue
+                order, _ = self._topological_order(root, tree)
+
+            levels = {root: 0}
+            for item in order:
+                if item not in levels:
+                    continue
+                for e in tree.get(item, []):
+                    levels[e["child"]] = max(levels.get(e["child"], 0), levels[item] + 1)
+            depth = max(levels.values())
+
+            sizes = {}
+            for item in reversed(order):
+                sizes[item] = 1 + sum(sizes[e["child"]] for e in tree.get(item, []))
+
+            self.compiled[(root, plant)] = {
+                "depth": depth,
+                "explosion_size": sizes.get(root, 1),
+            }
+            if max_depth is not None and depth > max_depth:
+                too_deep.append(f"FG '{decode(root)}' @ Plant '{decode(plant)}': depth {depth}")
+
+        if cycles:
+            if self.logger:
+                log = self.logger.warning if on_cycle == "break" else self.logger.error
+                log("BOM contains %d cycle(s)%s:\n%s", len(cycles),
+                    "; cycle-closing rows dropped" if on_cycle == "break" else "", "\n".join(cycles[:100]))
+            if on_cycle != "break":
+                raise BOMCompileError(f"BOM contains {len(cycles)} parent/child cycle(s), e.g. {cycles[0]}")
+
+        if too_deep:
+            if self.logger:
+                self.logger.error("BOM exceeds max depth %d for %d tree(s):\n%s", max_depth, len(too_deep), "\n".join(too_deep[:100]))
+            raise BOMCompileError(f"BOM deeper than {max_depth} levels, e.g. {too_deep[0]}")
+
+        if self.logger:
+            self.logger.info(
+                "BOM compiled | Trees=%d | Max depth=%d | Largest explosion=%d nodes",
+                len(self.compiled),
+                max((c["depth"] for c in self.compiled.values()), default=0),
+                max((c["explosion_size"] for c in self.compiled.values()), default=0),
+            )
+        return self.compiled
+
+    @staticmethod
+    def _topological_order(root, tree):
+        """
+        Iterative DFS over the tree's item graph (root first, then any
+        parent not reached from it). Returns (items in topological order,
+        [(parent, child, path root -> parent)] for every edge closing a cycle).
+        """
+        state = {}  # item -> 1 on stack, 2 done
+        postorder = []
+        back_edges = []
+
+        for start in [root, *tree]:
+            if start in state:
+                continue
+            state[start] = 1
+            path = [start]
+            stack = [(start, iter(tree.get(start, [])))]
+            while stack:
+                item, children = stack[-1]
+                for e in children:
+                    child = e["child"]
+                    child_state = state.get(child)
+                    if child_state is None:
+                        state[child] = 1
+                        path.append(child)
+                        stack.append((child, iter(tree.get(child, []))))
+                        break
+                    if child_state == 1:
+                        back_edges.append((item, child, path[path.index(child):]))
+                else:
+                    state[item] = 2
+                    postorder.append(item)
+                    path.pop()
+                    stack.pop()
+
+        postorder.reverse()
+        return postorder, back_edges
+
+    def explosion(self, root, plant, start) -> Explosion:
+        """
+        Cached BFS explosion of the (root, plant) tree from start (the root
+        itself, or an SFG inside it). Built once per distinct start.
+        """
+        key = (root, plant, start)
+        explosion = self._explosions.get(key)
+        if explosion is None:
+            if self.compiled is None:
+                raise BOMCompileError("BOMTree.compile() must run before explosions are built")
+            explosion = Explosion(self.bom_tree_map.get((root, plant), {}), start)
+            self._explosions[key] = explosion
+        return explosion
+
+    # ---------------- MEMORY ----------------
+    def memory_report(self, sample_size: int = 1000) -> dict:
+        """Entry counts and (sampled) deep sizes of the tree map, indexes and cached explosions."""
+        explosions = list(self._explosions.values())
+        report = {
+            "bom_roots": len(self.bom_tree_map),
+            "bom_edges": sum(len(children) for tree in self.bom_tree_map.values() for children in tree.values()),
+            "bom_tree_map_bytes": deep_sizeof(self.bom_tree_map, sample_size),
+            "parent_index_entries": len(self.parent_index),
+            "parent_index_bytes": deep_sizeof(self.parent_index, sample_size),
+            "explosions_cached": len(explosions),
+            "explosion_nodes": sum(len(e) for e in explosions),
+            "explosions_bytes": deep_sizeof(self._explosions, sample_size),
+            "peak_bfs_queue": max((e.peak_queue for e in explosions), default=0),
+        }
+        if self.compiled is not None:
+            report["compiled_bytes"] = deep_sizeof(self.compiled, sample_size)
+        if self._where_used is not None:
+            report["where_used_bytes"] = deep_sizeof(self._where_used, sample_size)
+        report["total_bytes"] = total_bytes(report)
+        return report
+
+    # ---------------- WHERE USED ----------------
+    def build_where_used(self):
+        """
+        (item, plant) -> [(root, path, cumulative ratio)] for every occurrence
+        of an item below a root. path runs root -> item; the cumulative ratio
+        is the item quantity needed per unit of root. A child already on its
+        own path (cyclic BOM) is not followed. Built on first use unless
+        called explicitly.
+        """
+        where_used = defaultdict(list)
+        for (root, plant), tree in self.bom_tree_map.items():
+            stack = [(root, (root,), 1.0)]
+            while stack:
+                item, path, ratio = stack.pop()
+                for e in reversed(tree.get(item, [])):
+                    child = e["child"]
+                    if child in path:
+                        continue
+                    child_path = path + (child,)
+                    child_ratio = ratio * float(e["ratio"] or 0.0)
+                    where_used[(child, plant)].append((root, child_path, child_ratio))
+                    stack.append((child, child_path, child_ratio))
+        self._where_used = where_used
+        if self.logger:
+            self.logger.info("Where-used index built for %d (item, plant) pairs.", len(where_used))
+
+    def where_used(self, item, plant) -> list:
+        """(root, path, cumulative ratio) for every BOM occurrence of item at plant."""
+        if self._where_used is None:
+            self.build_where_used()
+        return self._where_used.get((item, plant), [])
+
+    def where_used_df(self) -> pl.DataFrame:
+        """Where-used index with keys decoded; path is 'ROOT > ... > ITEM'."""
+        if self._where_used is None:
+            self.build_where_used()
+
+        columns = {"item_id": [], "plant": [], "root_fg": [], "bom_level": [], "path": [], "cum_ratio": []}
+        decode = self.keys.decode
+        for (item, plant), entries in self._where_used.items():
+            for root, path, ratio in entries:
+                columns["item_id"].append(item)
+                columns["plant"].append(plant)
+                columns["root_fg"].append(root)
+                columns["bom_level"].append(len(path) - 1)
+                columns["path"].append(" > ".join(decode(p) or "" for p in path))
+                columns["cum_ratio"].append(ratio)
+
+        return pl.DataFrame([
+            self.keys.decode_series(columns["item_id"], "item_id"),
+            self.keys.decode_series(columns["plant"], "plant"),
+            self.keys.decode_series(columns["root_fg"], "root_fg"),
+            pl.Series("bom_level", columns["bom_level"], dtype=pl.Int64),
+            pl.Series("path", columns["path"], dtype=pl.Utf8),
+            pl.Series("cum_ratio", columns["cum_ratio"], dtype=pl.Float64),
+        ])
+
+    # ---------------- SHARED MEMORY ----------------
+    def to_shared(self) -> SharedArrays:
+        """
+        Exports the BOM as flat edge arrays into one shared memory block
+        (see SharedBOMView):
+        - trees sorted by (plant, root), each owning a contiguous edge range
+        - edges inside a tree sorted by parent, children in BOM order
+        - the SFG parent index as (plant, parent) -> root pairs, first match first
+        Blank (None) ids are stored as -1; trees or SFG entries keyed by a
+        blank root / plant can never be resolved and are left out.
+        """
+        tree_keys = sorted(
+            (k for k in self.bom_tree_map if None not in k), key=lambda k: (k[1], k[0])
+        )
+        tree_offsets = [0]
+        parents, children, ratios = [], [], []
+        for key in tree_keys:
+            tree = self.bom_tree_map[key]
+            for parent in sorted(tree, key=lambda p: -1 if p is None else p):
+                for e in tree[parent]:
+                    parents.append(-1 if parent is None else parent)
+                    children.append(-1 if e["child"] is None else e["child"])
+                    ratios.append(e["ratio"])
+            tree_offsets.append(len(parents))
+
+        sfg_plants, sfg_parents, sfg_roots = [], [], []
+        for (parent, plant), roots in self.parent_index.items():
+            if parent is None or plant is None:
+                continue
+            for root in roots:
+                if root is None:
+                    continue
+                sfg_plants.append(plant)
+                sfg_parents.append(parent)
+                sfg_roots.append(root)
+        sfg_keys = composite_keys(sfg_plants, sfg_parents)
+        order = np.argsort(sfg_keys, kind="stable")
+
+        return SharedArrays.create({
+            "tree_keys": composite_keys([k[1] for k in tree_keys], [k[0] for k in tree_keys]),
+            "tree_offsets": np.array(tree_offsets, dtype=np.int64),
+            "edge_parent": np.array(parents, dtype=np.int64),
+            "edge_child": np.array(children, dtype=np.int64),
+            "edge_ratio": np.array(ratios, dtype=np.float64),
+            "sfg_keys": sfg_keys[order],
+            "sfg_roots": np.array(sfg_roots, dtype=np.int64)[order],
+        })
+
+
+class _SharedTreeView:
+    """One (root, plant) tree over shared edge arrays; supports tree.get(parent, default)."""
+
+    def __init__(self, parents, children, ratios):
+        self._parents = parents
+        self._children = children
+        self._ratios = ratios
+
+    def __bool__(self):
+        return len(self._parents) > 0
+
+    def get(self, item, default=None):
+        parent = -1 if item is None else item
+        lo = int(np.searchsorted(self._parents, parent, "left"))
+        hi = int(np.searchsorted(self._parents, parent, "right"))
+        if lo == hi:
+            return default
+        return [
+            {"parent": item, "child": None if child < 0 else child, "ratio": ratio}
+            for child, ratio in zip(self._children[lo:hi].tolist(), self._ratios[lo:hi].tolist())
+        ]
+
+
+class SharedBOMView:
+    """
+    Read-only BOMTree backed by the arrays of BOMTree.to_shared(), for worker
+    processes. Attaching is O(1); lookups are binary searches over the
+    shared arrays. Offers get_tree / resolve_fg / explosion like BOMTree
+    (the exporting BOMTree is already compiled).
+    """
+
+    def __init__(self, shared: SharedArrays, keys=None):
+        self.shared = shared
+        self.keys = keys
+        self._tree_keys = shared["tree_keys"]
+        self._tree_offsets = shared["tree_offsets"]
+        self._sfg_keys = shared["sfg_keys"]
+        self._sfg_roots = shared["sfg_roots"]
+        self._trees = {}
+        self._explosions = {}
+
+    def _tree_index(self, fg, plant):
+        if fg is None or plant is None:
+            return None
+        key = (plant << 32) | fg
+        i = int(np.searchsorted(self._tree_keys, key))
+        if i < len(self._tree_keys) and self._tree_keys[i] == key:
+            return i
+        return None
+
+    def _tree(self, i):
+        tree = self._trees.get(i)
+        if tree is None:
+            start, end = self._tree_offsets[i], self._tree_offsets[i + 1]
+            tree = _SharedTreeView(
+                self.shared["edge_parent"][start:end],
+                self.shared["edge_child"][start:end],
+                self.shared["edge_ratio"][start:end],
+            )
+            self._trees[i] = tree
+        return tree
+
+    def get_tree(self, fg, plant):
+        i = self._tree_index(fg, plant)
+        return self._tree(i) if i is not None else {}
+
+    def resolve_fg(self, fg, plant):
+        i = self._tree_index(fg, plant)
+        if i is not None:
+            return fg, self._tree(i), "ROOT"
+
+        if fg is not None and plant is not None:
+            key = (plant << 32) | fg
+            j = int(np.searchsorted(self._sfg_keys, key))
+            if j < len(self._sfg_keys) and self._sfg_keys[j] == key:
+                root_fg = int(self._sfg_roots[j])
+                return root_fg, self._tree(self._tree_index(root_fg, plant)), "SFG"
+
+        return None, None, "NOT_FOUND"
+
+    def explosion(self, root, plant, start) -> Explosion:
+        key = (root, plant, start)
+        explosion = self._explosions.get(key)
+        if explosion is None:
+            explosion = Explosion(self.get_tree(root, plant), start)
+            self._explosions[key] = explosion
+        return explosion
+
@@ -0,0 +1,185 @@
+import threading
+from array import array
+from pathlib import Path
+import polars as pl
+
+from common.stock_manager import STOCK_BUCKETS
+
+LEDGER_SCHEMA = {
+    "seq": pl.Int64,
+    "plant": pl.Utf8,
+    "so_id": pl.Utf8,       # SO whose demand consumed the stock
+    "item": pl.Utf8,
+    "so_level": pl.Boolean, # True: SO-level stock key, False: ITEM-level
+    "bucket": pl.Utf8,      # one of STOCK_BUCKETS
+    "qty": pl.Float64,
+}
+
+
+class ConsumptionLedger:
+    """
+    Append-only record of every stock consumption of a phase:
+    (seq, plant, so_id, item, so_level, bucket, qty).
+
+    Rows are buffered in typed arrays (interned ids, no per-row objects) and
+    flushed every flush_rows rows: keys are decoded vectorized and the batch
+    is written as a Parquet part file into `directory`, or kept in memory
+    when no directory is given. Appends are thread-safe.
+
+    The ledger replaces the per-consume log lines as the audit trail:
+    replaying it over the initial stock must give the final stock (verify).
+    """
+
+    PART_PATTERN = "part-*.parquet"
+
+    def __init__(self, keys, directory=None, flush_rows: int = 1_000_000):
+        self.keys = keys
+        self.directory = Path(directory) if directory else None
+        self.flush_rows = max(1, int(flush_rows))
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._frames = []
+        self._parts = 0
+        self._new_buffers()
+
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # A ledger directory holds one run's ledger
+            for old_part in self.directory.glob(self.PART_PATTERN):
+                old_part.unlink()
+
+    def _new_buffers(self):
+        self._plant = array("q")
+        self._so = array("q")
+        self._item = array("q")
+        self._so_level = array("b")
+        self._bucket = array("b")
+        self._qty = array("d")
+
+    # ---------------- APPEND ----------------
+    def record(self, plant, so_id, item, so_level: bool, bucket: int, qty: float):
+        """One consumption from bucket index `bucket` (position in STOCK_BUCKETS)."""
+        with self._lock:
+            self._plant.append(-1 if plant is None else plant)
+            self._so.append(-1 if so_id is None else so_id)
+            self._item.append(-1 if item is None else item)
+            self._so_level.append(so_level)
+            self._bucket.append(bucket)
+            self._qty.append(qty)
+            if len(self._qty) >= self.flush_rows:
+                self._flush_buffers()
+
+    def record_frame(self, df: pl.DataFrame):
+        """
+        Vectorized append of already aggregated consumptions; df has id
+        columns plant / so_id / item, so_level, bucket (index) and qty.
+        """
+        with self._lock:
+            self._flush_buffers()
+            self._emit(df.filter(pl.col("qty") > 0))
+
+    # ---------------- FLUSH ----------------
+    def _flush_buffers(self):
+        if not self._qty:
+            return
+        df = pl.DataFrame({
+            "plant": pl.Series(self._plant, dtype=pl.Int64),
+            "so_id": pl.Series(self._so, dtype=pl.Int64),
+            "item": pl.Series(self._item, dtype=pl.Int64),
+            "so_level": pl.Series(self._so_level, dtype=pl.Int8).cast(pl.Boolean),
+            "bucket": pl.Series(self._bucket, dtype=pl.Int64),
+            "qty": pl.Series(self._qty, dtype=pl.Float64),
+        })
+        self._new_buffers()
+        self._emit(df)
+
+    def _emit(self, df: pl.DataFrame):
+        if df.height == 0:
+            return
+        ids = lambda col: df[col].cast(pl.Int64).replace(-1, None)
+        batch = pl.DataFrame([
+            pl.int_range(self.rows, self.rows + df.height, dtype=pl.Int64, eager=True).alias("seq"),
+            self.keys.decode_series(ids("plant"), "plant"),
+            self.keys.decode_series(ids("so_id"), "so_id"),
+            self.keys.decode_series(ids("item"), "item"),
+            df["so_level"].cast(pl.Boolean).alias("so_level"),
+            df["bucket"].cast(pl.Int64).replace_strict(
+                list(range(len(STOCK_BUCKETS))), STOCK_BUCKETS, return_dtype=pl.Utf8
+            ).alias("bucket"),
+            df["qty"].cast(pl.Float64).alias("qty"),
+        ])
+        self.rows += batch.height
+
+        if self.directory:
+            batch.write_parquet(self.directory / f"part-{self._parts:05d}.parquet")
+            self._parts += 1
+        else:
+            self._frames.append(batch)
+
+    def close(self):
+        with self._lock:
+            self._flush_buffers()
+
+    # ---------------- QUERY ----------------
+    def scan(self) -> pl.LazyFrame:
+        """All flushed rows (call close() first to include buffered ones)."""
+        if self.directory and self._parts:
+            return ConsumptionLedger.scan_directory(self.directory)
+        if self._frames:
+            return pl.concat(self._frames).lazy()
+        return pl.LazyFrame(schema=LEDGER_SCHEMA)
+
+    @classmethod
+    def scan_directory(cls, directory) -> pl.LazyFrame:
+        """Ledger of a finished run, e.g. for ad-hoc queries after the run."""
+        return pl.scan_parquet(Path(directory) / cls.PART_PATTERN)
+
+    # ---------------- REPLAY ----------------
+    @staticmethod
+    def replay(initial_stock_df: pl.DataFrame, ledger: pl.LazyFrame) -> pl.DataFrame:
+        """
+        Final stock implied by the ledger: initial stock (remaining_stock_df
+        layout) minus the consumed quantity per stock key and bucket.
+        """
+        consumed = (
+            ledger
+            .with_columns(
+                pl.when(pl.col("so_level")).then(pl.col("so_id")).otherwise(None).alias("order_id")
+            )
+            .group_by(["order_id", "item", "plant", "bucket"])
+            .agg(pl.sum("qty"))
+            .collect()
+            .pivot(on="bucket", index=["order_id", "item", "plant"], values="qty")
+            .rename({"item": "item_id"})
+        )
+        for col in STOCK_BUCKETS:
+            if col not in consumed.columns:
+                consumed = consumed.with_columns(pl.lit(0.0).alias(col))
+        consumed = consumed.select(
+            "order_id", "item_id", "plant", *[pl.col(c).alias(f"_used_{c}") for c in STOCK_BUCKETS]
+        )
+
+        return (
+            initial_stock_df
+            .join(consumed, on=["order_id", "item_id", "plant"], how="left", nulls_equal=True)
+            .with_columns([
+                (pl.col(c) - pl.col(f"_used_{c}").fill_null(0.0)).alias(c) for c in STOCK_BUCKETS
+            ])
+            .drop([f"_used_{c}" for c in STOCK_BUCKETS])
+        )
+
+    def verify(self, initial_stock_df: pl.DataFrame, final_stock_df: pl.DataFrame, tolerance: float = 1e-6) -> pl.DataFrame:
+        """
+        Stock keys whose replayed and actual final buckets differ by more
+        than tolerance. An empty frame means the ledger is complete.
+        """
+        self.close()
+        expected = self.replay(initial_stock_df, self.scan())
+        joined = expected.join(
+            final_stock_df, on=["order_id", "item_id", "plant"], how="full",
+            nulls_equal=True, suffix="_actual", coalesce=True
+        )
+        return joined.filter(pl.any_horizontal([
+            ((pl.col(c).fill_null(0.0) - pl.col(f"{c}_actual").fill_null(0.0)).abs() > tolerance)
+            for c in STOCK_BUCKETS
+        ]))
@@ -0,0 +1,87 @@
+from collections import deque
+
+
+class UnionFind:
+    """Disjoint-set forest with path halving and union by size."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> int:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+
+def reachable_items(bom_tree, start) -> list:
+    """Distinct items a BFS explosion from `start` can visit."""
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        item = queue.popleft()
+        for child in bom_tree.get(item, []):
+            if child["child"] not in seen:
+                seen.add(child["child"])
+                queue.append(child["child"])
+    return list(seen)
+
+
+def partition_orders(orders, bom_tree, stock_manager):
+    """
+    Splits sales orders into groups that share no stock.
+
+    orders: (so_idx, so_id, fg, plant, fg_qty) tuples in allocation order.
+    Builds the SO <-> stock-key contention graph (an SO uses the SO-level key
+    of an item if one exists, otherwise the ITEM-level key, exactly as
+    StockManager.consume_with_priority does) and returns its connected
+    components as (orders, stock_keys) pairs. Orders keep their original
+    relative order inside a group; groups are ordered by their first SO.
+    """
+    remaining_stock = stock_manager.remaining_stock
+    reach_cache = {}
+    uf = UnionFind(len(orders))
+    key_owner = {}
+    order_keys = []
+
+    for pos, (_, so_id, fg, plant, _) in enumerate(orders):
+        resolved_root, tree, resolution_type = bom_tree.resolve_fg(fg, plant)
+        keys = []
+        if resolution_type != "NOT_FOUND" and tree:
+            reach_key = (resolved_root, plant, fg)
+            if reach_key not in reach_cache:
+                reach_cache[reach_key] = reachable_items(tree, fg)
+
+            for item in reach_cache[reach_key]:
+                key_so = stock_manager._key(plant, so_id, item)
+                key_item = stock_manager._key(plant, None, item)
+                if key_so in remaining_stock:
+                    keys.append(key_so)
+                elif key_item in remaining_stock:
+                    keys.append(key_item)
+
+        for key in keys:
+            owner = key_owner.setdefault(key, pos)
+            if owner != pos:
+                uf.union(owner, pos)
+        order_keys.append(keys)
+
+    groups = {}
+    for pos, order in enumerate(orders):
+        members, keys = groups.setdefault(uf.find(pos), ([], set()))
+        members.append(order)
+        keys.update(order_keys[pos])
+
+    return list(groups.values())
@@ -0,0 +1,81 @@
+import threading
+
+import polars as pl
+
+
+class KeyDictionary:
+    """
+    Dictionary-encodes string keys (plants, items, SO ids) into dense integer ids.
+
+    One instance is shared by StockManager, BOMTree and the allocators of a run,
+    so every key is stripped and stored once and all lookups hash a small int.
+    Strings are decoded back only when output dataframes are built.
+    Empty strings and nulls encode to None.
+    Interning is thread-safe (pipeline stages load stock and BOM concurrently).
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._values = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    # Locks don't pickle: worker processes and BomCache entries get a new one
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    # ---------------- SCALAR ----------------
+    def encode(self, value):
+        if value is None:
+            return None
+        value = str(value).strip()
+        if not value:
+            return None
+
+        key_id = self._ids.get(value)
+        if key_id is None:
+            with self._lock:
+                key_id = self._ids.get(value)
+                if key_id is None:
+                    key_id = len(self._values)
+                    self._values.append(value)
+                    self._ids[value] = key_id
+        return key_id
+
+    def lookup(self, value):
+        """Id of an already interned value, without interning new ones."""
+        if value is None:
+            return None
+        return self._ids.get(str(value).strip())
+
+    def decode(self, key_id):
+        if key_id is None:
+            return None
+        return self._values[key_id]
+
+    # ---------------- VECTORIZED ----------------
+    def encode_series(self, series: pl.Series) -> pl.Series:
+        """
+        Encodes a key column. Only distinct values are touched in Python;
+        the mapping itself is applied by Polars.
+        """
+        cleaned = series.cast(pl.Utf8).str.strip_chars()
+        distinct = cleaned.unique().drop_nulls().to_list()
+        ids = [self.encode(v) for v in distinct]
+
+        return cleaned.replace_strict(
+            distinct, ids, default=None, return_dtype=pl.Int64
+        ).alias(series.name)
+
+    def decode_series(self, ids, name: str = "") -> pl.Series:
+        """Decodes a list / Series of ids (None allowed) back to strings."""
+        ids = pl.Series(name, ids, dtype=pl.Int64)
+        return pl.Series(name, self._values, dtype=pl.Utf8).gather(ids)
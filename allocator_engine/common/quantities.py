@@ -0,0 +1,104 @@
+import numpy as np
+import polars as pl
+
+QUANTITY_MODES = ("float", "fixed")
+MAX_PRECISION = 9
+
+
+class QuantityScale:
+    """
+    Fixed-point representation of quantities: an item's quantities are
+    stored as int64 multiples of 10**-precision, with the precision taken
+    from the item's unit of measure (default_precision otherwise).
+
+    Stock buckets, consumption and prefix sums then use exact integer math;
+    demand computed through BOM ratios is rounded to the item's precision
+    (quantize) before it meets stock, so float drift never reaches it.
+    """
+
+    def __init__(self, default_precision: int = 3, item_precision: dict | None = None):
+        self.default_precision = self._checked(default_precision)
+        # interned item id -> decimal places
+        self.item_precision = {item: self._checked(p) for item, p in (item_precision or {}).items()}
+        self._default_factor = 10 ** self.default_precision
+        self._factors = {item: 10 ** p for item, p in self.item_precision.items()}
+
+    @staticmethod
+    def _checked(precision) -> int:
+        precision = int(precision)
+        if not 0 <= precision <= MAX_PRECISION:
+            raise ValueError(f"Quantity precision must be between 0 and {MAX_PRECISION}, got {precision}")
+        return precision
+
+    @classmethod
+    def from_config(cls, quantities_cfg: dict | None, keys, stock_df: pl.DataFrame | None = None, logger=None):
+        """
+        QuantityScale for `quantities.mode: fixed`, else None.
+        Item precisions come from precision_by_uom and the stock frame's
+        optional `uom` column (highest precision wins if an item has several).
+        """
+        cfg = quantities_cfg or {}
+        mode = str(cfg.get("mode", "float")).lower()
+        if mode not in QUANTITY_MODES:
+            raise ValueError(f"Unsupported quantities mode: {mode} (expected one of {QUANTITY_MODES})")
+        if mode == "float":
+            return None
+
+        default_precision = cfg.get("default_precision", 3)
+        by_uom = {str(uom).strip().upper(): p for uom, p in (cfg.get("precision_by_uom") or {}).items()}
+        item_precision = {}
+
+        if by_uom and stock_df is not None and "uom" in stock_df.columns:
+            pairs = (
+                stock_df.select(
+                    pl.col("item_id").cast(pl.Utf8).str.strip_chars(),
+                    pl.col("uom").cast(pl.Utf8).str.strip_chars().str.to_uppercase(),
+                )
+                .drop_nulls()
+                .unique()
+            )
+            unknown = set()
+            for item_id, uom in pairs.iter_rows():
+                if uom not in by_uom:
+                    unknown.add(uom)
+                    continue
+                item = keys.encode(item_id)
+                if item is not None:
+                    item_precision[item] = max(item_precision.get(item, 0), int(by_uom[uom]))
+            if unknown and logger:
+                logger.warning("UoMs without configured precision (default %s used): %s", default_precision, sorted(unknown))
+
+        scale = cls(default_precision, item_precision)
+        if logger:
+            logger.info(
+                "Fixed-point quantities | Default precision=%d | Items with UoM precision=%d",
+                scale.default_precision, len(item_precision)
+            )
+        return scale
+
+    # ---------------- SCALAR ----------------
+    def factor(self, item) -> int:
+        return self._factors.get(item, self._default_factor)
+
+    def to_units(self, item, qty) -> int:
+        return int(round(float(qty or 0) * self.factor(item)))
+
+    def to_float(self, item, units) -> float:
+        return units / self.factor(item)
+
+    def quantize(self, item, qty) -> float:
+        """qty rounded to the item's precision."""
+        factor = self.factor(item)
+        return round(float(qty or 0) * factor) / factor
+
+    # ---------------- VECTOR ----------------
+    def factors(self, items) -> np.ndarray:
+        get, default = self._factors.get, self._default_factor
+        return np.array([get(item, default) for item in items], dtype=np.int64)
+
+    def to_units_many(self, items, qtys) -> np.ndarray:
+        return np.rint(np.asarray(qtys, dtype=np.float64) * self.factors(items)).astype(np.int64)
+
+    def quantize_many(self, items, qtys) -> np.ndarray:
+        factors = self.factors(items)
+        return np.rint(np.asarray(qtys, dtype=np.float64) * factors) / factors
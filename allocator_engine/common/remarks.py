@@ -0,0 +1,160 @@
+from enum import IntEnum
+import polars as pl
+
+
+class RemarkCode(IntEnum):
+    # Order allocation
+    FG_ALLOCATED = 1
+    FG_NO_STOCK = 2
+    # Component allocation
+    BOM_NOT_FOUND = 10
+    BOM_TREE_EMPTY = 11
+    TREATED_AS_SFG = 12
+    ZERO_ORDER_QTY = 13
+    COMPONENT_NO_STOCK = 14
+    ORDER_PROCESSED = 15
+
+
+# Text per code; {item} / {ref} / {plant} are decoded keys, {qty} / {total} quantities
+REMARK_TEMPLATES = {
+    RemarkCode.FG_ALLOCATED: "Allocated {qty} out of {total} (SOH/QC/Transit priority applied)",
+    RemarkCode.FG_NO_STOCK: "No stock available for FG '{item}'. Allocated 0 out of {total}.",
+    RemarkCode.BOM_NOT_FOUND: "No BOM found where '{item}' exists as FG or SFG at Plant '{plant}'. Order skipped.",
+    RemarkCode.BOM_TREE_EMPTY: "BOM tree empty for resolved root '{ref}' at Plant '{plant}'. Order skipped.",
+    RemarkCode.TREATED_AS_SFG: "Ordered FG '{item}' treated as SFG under BOM of '{ref}'.",
+    RemarkCode.ZERO_ORDER_QTY: "Order quantity is zero; BOM exploded without allocation.",
+    RemarkCode.COMPONENT_NO_STOCK: "No stock available for component '{item}' at plant '{plant}'.",
+    RemarkCode.ORDER_PROCESSED: "Order processed via component allocation. BOM exploded and stock allocation attempted.",
+}
+
+REMARK_SCHEMA = {
+    "so_idx": pl.Int64,   # SO position in so_df
+    "pos": pl.Int64,      # order of the remark inside the SO
+    "so_id": pl.Int64,
+    "code": pl.Int64,
+    "item": pl.Int64,
+    "ref": pl.Int64,
+    "plant": pl.Int64,
+    "qty": pl.Float64,
+    "total": pl.Float64,
+}
+
+REMARK_MODES = ("text", "codes", "off")
+
+
+class RemarkLog:
+    """
+    Append-only remark events stored column-wise (see REMARK_SCHEMA).
+    Keys stay interned ids and nothing is formatted while allocating;
+    text is rendered once, vectorized, by attach_remarks.
+    """
+
+    def __init__(self):
+        self.columns = {col: [] for col in REMARK_SCHEMA}
+
+    def __len__(self):
+        return len(self.columns["code"])
+
+    def add(self, so_idx, so_id, code: RemarkCode, pos=0, item=None, ref=None, plant=None, qty=None, total=None):
+        c = self.columns
+        c["so_idx"].append(so_idx)
+        c["pos"].append(pos)
+        c["so_id"].append(so_id)
+        c["code"].append(int(code))
+        c["item"].append(item)
+        c["ref"].append(ref)
+        c["plant"].append(plant)
+        c["qty"].append(qty)
+        c["total"].append(total)
+
+    def to_frame(self) -> pl.DataFrame:
+        return pl.DataFrame(self.columns, schema=REMARK_SCHEMA)
+
+
+def remark_mode(config) -> str:
+    mode = str((config or {}).get("remarks", "text")).lower()
+    if mode not in REMARK_MODES:
+        raise ValueError(f"Unsupported remarks mode: {mode} (expected one of {REMARK_MODES})")
+    return mode
+
+
+def _float_text(values: pl.Series) -> pl.Series:
+    """
+    Quantities as Python's str(float) writes them (1e-05, 1e+16), as the
+    remark f-strings did; Polars' cast differs in exponent notation.
+    Each distinct value is formatted once.
+    """
+    texts = {v: str(v) for v in values.drop_nulls().unique().to_list()}
+    text = values.replace_strict(texts, default=None, return_dtype=pl.Utf8)
+    # -0.0 and 0.0 are one unique value
+    negative_zero = (values == 0) & ((1 / values) < 0)
+    return text.zip_with(~negative_zero.fill_null(False), pl.Series(["-0.0"] * len(values), dtype=pl.Utf8))
+
+
+def render_remark_text(events: pl.DataFrame, keys) -> pl.Series:
+    """One text per event, built with one pl.format per code present."""
+    fields = {
+        "item": keys.decode_series(events["item"]),
+        "ref": keys.decode_series(events["ref"]),
+        "plant": keys.decode_series(events["plant"]),
+        "qty": _float_text(events["qty"]),
+        "total": _float_text(events["total"]),
+    }
+    frame = pl.DataFrame({"code": events["code"], **fields})
+
+    text = pl.lit(None, dtype=pl.Utf8)
+    for code in frame["code"].unique().to_list():
+        template = REMARK_TEMPLATES[RemarkCode(code)]
+        names = [name for name in fields if "{" + name + "}" in template]
+        fmt = template
+        for name in names:
+            fmt = fmt.replace("{" + name + "}", "{}")
+        text = pl.when(pl.col("code") == code).then(pl.format(fmt, *names) if names else pl.lit(fmt)).otherwise(text)
+
+    return frame.select(text.alias("text"))["text"]
+
+
+def remark_events_df(events: pl.DataFrame, keys) -> pl.DataFrame:
+    """Events (sorted by SO position, then pos) with keys decoded and code names, e.g. for a remarks output file."""
+    names = {int(code): code.name for code in RemarkCode}
+    # Seq numbers the SO's remarks 0, 1, ... whatever pos scheme the allocator used
+    seq = events.select(pl.int_range(pl.len()).over("so_idx").cast(pl.Int64).alias("Seq"))["Seq"]
+    return pl.DataFrame([
+        keys.decode_series(events["so_id"], "SO_ID"),
+        seq,
+        events["code"].alias("Code"),
+        events["code"].replace_strict(names, return_dtype=pl.Utf8).alias("Remark"),
+        keys.decode_series(events["item"], "Item"),
+        keys.decode_series(events["ref"], "Ref_Item"),
+        keys.decode_series(events["plant"], "Plant"),
+        events["qty"].alias("Qty"),
+        events["total"].alias("Total_Qty"),
+    ])
+
+
+def attach_remarks(so_df: pl.DataFrame, events: pl.DataFrame, keys, column: str, mode: str):
+    """
+    Applies remark events (sorted by SO position, then pos) to so_df.
+    Returns (so_df, events_df):
+    - text:  so_df gets `column`, the SO's remarks joined with " | "
+             (remarks of repeated SO ids are merged); events_df is None
+    - codes: so_df is unchanged; events_df is the decoded event table
+    - off:   both unchanged / None
+    """
+    if mode == "off" or events.height == 0:
+        return so_df, None
+
+    events = events.sort(["so_idx", "pos"], maintain_order=True)
+    if mode == "codes":
+        return so_df, remark_events_df(events, keys)
+
+    merged = (
+        events.select("so_id", render_remark_text(events, keys).alias("message"))
+        .group_by("so_id", maintain_order=True)
+        .agg(pl.col("message").str.join(" | ").alias(column))
+    )
+    remarks_df = pl.DataFrame({
+        "order_id": keys.decode_series(merged["so_id"]).cast(so_df.schema["order_id"]),
+        column: merged[column],
+    })
+    return so_df.join(remarks_df, on="order_id", how="left"), None
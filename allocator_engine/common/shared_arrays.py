@@ -0,0 +1,82 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Arrays inside a block start on cache-line boundaries
+_ALIGN = 64
+
+
+class SharedArrays:
+    """
+    A set of named NumPy arrays packed into one multiprocessing.shared_memory
+    block.
+
+    `handle` (block name + array layout) is a few hundred bytes and picklable;
+    worker processes attach to the same memory with `SharedArrays.attach`
+    instead of unpickling the data. The creating process owns the block and
+    must `unlink()` it once all workers are done.
+    """
+
+    def __init__(self, shm, layout, owner=False, readonly=True):
+        self._shm = shm
+        self._layout = layout
+        self._owner = owner
+        self.arrays = {}
+        for name, (dtype, shape, offset) in layout.items():
+            arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            if readonly:
+                arr.flags.writeable = False
+            self.arrays[name] = arr
+
+    @classmethod
+    def create(cls, arrays: dict) -> "SharedArrays":
+        layout = {}
+        size = 0
+        contiguous = {}
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            size = -(-size // _ALIGN) * _ALIGN
+            layout[name] = (arr.dtype.str, arr.shape, size)
+            contiguous[name] = arr
+            size += arr.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, arr in contiguous.items():
+            dtype, shape, offset = layout[name]
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)[...] = arr
+
+        return cls(shm, layout, owner=True, readonly=False)
+
+    @classmethod
+    def attach(cls, handle: dict, readonly=True) -> "SharedArrays":
+        try:
+            # Python 3.13+: attaching processes must not unlink the block on exit
+            shm = shared_memory.SharedMemory(name=handle["name"], track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=handle["name"])
+        return cls(shm, handle["layout"], owner=False, readonly=readonly)
+
+    @property
+    def handle(self) -> dict:
+        return {"name": self._shm.name, "layout": self._layout}
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        # Views must be dropped before the buffer can be released
+        self.arrays = {}
+        self._shm.close()
+
+    def unlink(self):
+        self.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def composite_keys(high, low) -> np.ndarray:
+    """Packs two interned-id arrays (< 2**32) into one sortable int64 key."""
+    return (np.asarray(high, dtype=np.int64) << 32) | np.asarray(low, dtype=np.int64)
@@ -0,0 +1,95 @@
+from pathlib import Path
+import polars as pl
+
+from io_modules.writer import write_parquet
+
+BLOCKED_COLUMNS = ["Plant", "Item", "SO_ID", "Parent", "BOM_Level", "Order_Qty", "Allocated_Qty", "Order_Remaining"]
+
+
+class ShortageIndex:
+    """
+    Answers "impact of a shortage of item X at plant P" from a finished run.
+
+    Two frames, both sorted by (plant, item) with a row-range lookup per
+    pair, so a query is a dict hit plus a slice:
+    - blocked: component allocation rows with Order_Remaining > 0
+      (SOs whose demand for the item is not covered)
+    - where_used: every BOM occurrence of the item (BOMTree.where_used_df)
+
+    Both are written as Parquet next to the run's outputs and can be loaded
+    without re-reading the full allocation output or rebuilding the BOM.
+    """
+
+    BLOCKED_FILE = "shortage_blocked_rows.parquet"
+    WHERE_USED_FILE = "bom_where_used.parquet"
+
+    def __init__(self, blocked_df: pl.DataFrame, where_used_df: pl.DataFrame):
+        self.blocked_df = blocked_df.sort(["Plant", "Item"], maintain_order=True)
+        self.where_used_df = where_used_df.sort(["plant", "item_id"], maintain_order=True)
+        self._blocked_ranges = self._row_ranges(self.blocked_df, "Plant", "Item")
+        self._where_used_ranges = self._row_ranges(self.where_used_df, "plant", "item_id")
+
+    @classmethod
+    def from_allocation(cls, component_df: pl.DataFrame, where_used_df: pl.DataFrame) -> "ShortageIndex":
+        blocked_df = (
+            component_df
+            .filter(pl.col("Order_Remaining") > 0)
+            .select([c for c in BLOCKED_COLUMNS if c in component_df.columns])
+        )
+        return cls(blocked_df, where_used_df)
+
+    @classmethod
+    def load(cls, directory) -> "ShortageIndex":
+        directory = Path(directory)
+        return cls(
+            pl.read_parquet(directory / cls.BLOCKED_FILE),
+            pl.read_parquet(directory / cls.WHERE_USED_FILE),
+        )
+
+    def write(self, directory) -> None:
+        directory = Path(directory)
+        write_parquet(self.blocked_df, directory / self.BLOCKED_FILE)
+        write_parquet(self.where_used_df, directory / self.WHERE_USED_FILE)
+
+    @staticmethod
+    def _row_ranges(df: pl.DataFrame, plant_col: str, item_col: str) -> dict:
+        """(plant, item) -> (offset, length) into the sorted frame."""
+        ranges = (
+            df.with_row_index("_row")
+            .group_by([plant_col, item_col], maintain_order=True)
+            .agg(pl.col("_row").first().alias("offset"), pl.len().alias("length"))
+        )
+        return {
+            (plant, item): (offset, length)
+            for plant, item, offset, length in ranges.iter_rows()
+        }
+
+    @staticmethod
+    def _slice(df, ranges, plant, item) -> pl.DataFrame:
+        offset, length = ranges.get((plant, item), (0, 0))
+        return df.slice(offset, length)
+
+    def blocked_orders(self, item_id, plant) -> pl.DataFrame:
+        return self._slice(self.blocked_df, self._blocked_ranges, plant, item_id)
+
+    def where_used(self, item_id, plant) -> pl.DataFrame:
+        return self._slice(self.where_used_df, self._where_used_ranges, plant, item_id)
+
+    def impact(self, item_id, plant) -> dict:
+        """
+        Shortage impact of item_id at plant:
+        - blocked_orders: SO rows still short of the item, with their shortfall
+        - where_used: roots / paths / cumulative ratios the item appears in
+        - affected_roots: distinct finished goods that consume the item
+        """
+        blocked = self.blocked_orders(item_id, plant)
+        where_used = self.where_used(item_id, plant)
+        return {
+            "item_id": item_id,
+            "plant": plant,
+            "blocked_so_count": blocked["SO_ID"].n_unique() if blocked.height else 0,
+            "total_shortfall": float(blocked["Order_Remaining"].sum()) if blocked.height else 0.0,
+            "blocked_orders": blocked,
+            "where_used": where_used,
+            "affected_roots": where_used["root_fg"].unique(maintain_order=True).to_list(),
+        }
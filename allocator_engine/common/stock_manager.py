@@ -1,25 +1,97 @@
+import numpy as np
+import polars as pl
+from common.key_dictionary import KeyDictionary
+from common.stock_timeline import IMMEDIATE, UNBOUNDED, StockTimeline, as_of_day, to_day
+from utils.memory import deep_sizeof, total_bytes
+
+STOCK_BUCKETS = ["stock_on_hand", "stock_in_qc", "stock_in_transit"]
+
 class StockManager:
-    def __init__(self, logger):
+    def __init__(self, logger, keys: KeyDictionary | None = None, ledger=None, log_consumption: bool = True, scale=None,
+                 as_of=None):
+        """
+        Stock is keyed by interned ids: (plant, so_id, item).
+        so_id is None for ITEM-level stock.
+
+        With a ConsumptionLedger every bucket deduction is recorded there;
+        log_consumption=False drops the per-consume log lines.
+        With a QuantityScale (fixed-point mode) buckets hold int64 units of
+        the item's precision; consume results are still returned in float
+        quantities.
+
+        Stock rows with an available_date are time-phased: each key with
+        dated rows gets a StockTimeline of its receipts (undated rows are
+        available from as_of, default today) and consume_by_date allocates
+        against a required date.
+        """
         self.remaining_stock = {}
         self.logger = logger
+        self.keys = keys if keys is not None else KeyDictionary()
+        self.ledger = ledger
+        self.log_consumption = log_consumption
+        self.scale = scale
+        # Consume requests served so far (progress reporting)
+        self.consumes = 0
+        self.as_of = as_of_day(as_of)
+        # Set when the loaded stock has an available_date column
+        self.time_phased = False
+        # StockTimeline per stock key with dated receipts
+        self.timelines = {}
 
     def _key(self, plant, so_id, item):
-        if so_id:
-            return f"{plant}__{so_id}__{item}"
-        return f"{plant}__ITEM__{item}"
+        return (plant, so_id, item)
+
+
+    def _encoded_rows(self, df, id_cols):
+        df = df.with_columns([
+            self.keys.encode_series(df[c]) for c in id_cols
+        ])
+        return df.iter_rows(named=True)
 
 
     def load_stock(self, so_stock_df, item_stock_df):
-        for r in so_stock_df.iter_rows(named=True):
+        if "available_date" in so_stock_df.columns or "available_date" in item_stock_df.columns:
+            return self._load_time_phased(so_stock_df, item_stock_df)
+
+        for r in self._encoded_rows(so_stock_df, ["plant", "order_id", "item_id"]):
             key = self._key(r["plant"], r["order_id"], r["item_id"])
-            self.remaining_stock[key] = self._extract_stock_buckets(r)
+            self.remaining_stock[key] = self._extract_stock_buckets(r, r["item_id"])
 
-        for r in item_stock_df.iter_rows(named=True):
+        for r in self._encoded_rows(item_stock_df, ["plant", "item_id"]):
             key = self._key(r["plant"], None, r["item_id"])
-            self.remaining_stock[key] = self._extract_stock_buckets(r)
+            self.remaining_stock[key] = self._extract_stock_buckets(r, r["item_id"])
+
 
+    def _load_time_phased(self, so_stock_df, item_stock_df):
+        """load_stock with one row per receipt: bucket totals per key plus a timeline for keys with dated rows."""
+        self.time_phased = True
+        receipts = {}
+        rows = [
+            (self._encoded_rows(so_stock_df, ["plant", "order_id", "item_id"]), "order_id"),
+            (self._encoded_rows(item_stock_df, ["plant", "item_id"]), None),
+        ]
+        for encoded, so_col in rows:
+            for r in encoded:
+                key = self._key(r["plant"], r[so_col] if so_col else None, r["item_id"])
+                buckets = self._extract_stock_buckets(r, r["item_id"])
+                totals = self.remaining_stock.setdefault(key, dict.fromkeys(STOCK_BUCKETS, 0 if self.scale else 0.0))
+                day = to_day(r.get("available_date"))
+                by_day = receipts.setdefault(key, {}).setdefault(IMMEDIATE if day is None else day, [0] * len(STOCK_BUCKETS))
+                for i, col in enumerate(STOCK_BUCKETS):
+                    totals[col] += buckets[col]
+                    by_day[i] += buckets[col]
 
-    def _extract_stock_buckets(self, row):
+        self.timelines = {
+            key: StockTimeline(by_day)
+            for key, by_day in receipts.items()
+            if any(day != IMMEDIATE for day in by_day)
+        }
+        self.logger.info("Time-phased stock | Keys=%d | Dated keys=%d", len(self.remaining_stock), len(self.timelines))
+
+
+    def _extract_stock_buckets(self, row, item=None):
+        if self.scale is not None:
+            return {col: self.scale.to_units(item, row.get(col, 0)) for col in STOCK_BUCKETS}
         return {
             "stock_on_hand": float(row.get("stock_on_hand", 0) or 0),
             "stock_in_qc": float(row.get("stock_in_qc", 0) or 0),
@@ -34,52 +106,201 @@ class StockManager:
         - allocation breakdown
         - unfulfilled quantity (if stock insufficient)
         """
+        return self._consume(plant, so_id, item, consume_qty)[:2]
+
+
+    def consume_by_date(self, plant, so_id, item, consume_qty, required_day=UNBOUNDED):
+        """
+        consume_with_priority against a required date (epoch day): only
+        receipts available on or before required_day are taken, earliest
+        first within each bucket. Returns (allocation, unfulfilled, ready_day,
+        feasible_day):
+        - ready_day: latest receipt the allocation comes from (IMMEDIATE
+          for undated stock, None when nothing is allocated)
+        - feasible_day: earliest day the whole quantity is covered, counting
+          later receipts for the unfulfilled rest without consuming them
+          (None: not covered by any known receipt)
+        """
+        return self._consume(plant, so_id, item, consume_qty, required_day)
+
+
+    def _resolve_key(self, plant, so_id, item):
+        """Stock key a consume uses: SO-level if present, else ITEM-level (None if neither)."""
+        key = self._key(plant, so_id, item)
+        if key in self.remaining_stock:
+            return key
+        key = self._key(plant, None, item)
+        return key if key in self.remaining_stock else None
+
+
+    def _consume(self, plant, so_id, item, consume_qty, required_day=UNBOUNDED):
+        """
+        The one scalar consume: resolves the stock key, caps each bucket by
+        the key's timeline at required_day (time-phased keys), runs
+        take_from_buckets on float quantities or fixed-point units and
+        applies the result to the buckets, the timeline and the ledger.
+        Returns consume_by_date's (allocation, unfulfilled, ready_day,
+        feasible_day).
+        """
+        self.consumes += 1
+        if self.scale is not None:
+            factor, number = self.scale.factor(item), int
+            remaining_to_consume = self.scale.to_units(item, consume_qty)
+        else:
+            factor, number = 1, float
+            remaining_to_consume = float(consume_qty or 0)
+        allocation = {col: 0.0 for col in STOCK_BUCKETS}
 
-        key_so = self._key(plant, so_id, item)
-        key_item = self._key(plant, None, item)
-        
+        key = self._resolve_key(plant, so_id, item)
         # IMPORTANT: Do NOT create stock if it never existed
-        if key_so not in self.remaining_stock and key_item not in self.remaining_stock:
+        if key is None:
             self.logger.debug(
                 "No stock entry exists. Skipping consumption | Plant=%s | SO=%s | Item=%s",
-                plant, so_id, item
+                self.keys.decode(plant), self.keys.decode(so_id), self.keys.decode(item)
             )
-            return {
-                "stock_on_hand": 0.0,
-                "stock_in_qc": 0.0,
-                "stock_in_transit": 0.0
-            }, float(consume_qty or 0)
-
-        buckets = self.get_stock_buckets(plant, so_id, item)
-        allocation = {
-            "stock_on_hand": 0.0,
-            "stock_in_qc": 0.0,
-            "stock_in_transit": 0.0
-        }
-        remaining_to_consume = float(consume_qty or 0)
-        
-        self.logger.debug("Stock consume start | Plant=%s | SO=%s | Item=%s | Consume=%s | Buckets=%s", plant, so_id, item, remaining_to_consume, buckets)
-        
-        for col in ["stock_on_hand", "stock_in_qc", "stock_in_transit"]:
-            if remaining_to_consume <= 0:
-                break
-
-            available = float(buckets.get(col, 0) or 0)
-            if available <= 0:
+            return allocation, remaining_to_consume / factor, None, IMMEDIATE if remaining_to_consume <= 0 else None
+
+        buckets = self.remaining_stock[key]
+        timeline = self.timelines.get(key)
+        available = [number(buckets.get(col, 0) or 0) for col in STOCK_BUCKETS]
+        if timeline is not None:
+            available = [min(qty, timeline.available(i, required_day)) for i, qty in enumerate(available)]
+
+        if self.log_consumption:
+            self.logger.debug("Stock consume start | Plant=%s | SO=%s | Item=%s | Consume=%s | Buckets=%s", self.keys.decode(plant), self.keys.decode(so_id), self.keys.decode(item), remaining_to_consume, buckets)
+
+        used, remaining_to_consume = take_from_buckets(available, remaining_to_consume)
+        so_level = key[1] is not None
+        ready_day = None
+        for i, col in enumerate(STOCK_BUCKETS):
+            if used[i] <= 0:
                 continue
+            allocation[col] = used[i] / factor
+            buckets[col] = number(buckets.get(col, 0) or 0) - used[i]
+            if timeline is not None:
+                day = timeline.consume(i, used[i])
+                ready_day = day if ready_day is None else max(ready_day, day)
+            else:
+                ready_day = IMMEDIATE
+            if self.ledger is not None:
+                self.ledger.record(plant, so_id, item, so_level, i, used[i] / factor)
 
-            used = min(available, remaining_to_consume)
-            allocation[col] = used
-            buckets[col] = available - used
-            remaining_to_consume -= used
+        if remaining_to_consume <= 0:
+            feasible_day = IMMEDIATE if ready_day is None else ready_day
+        elif timeline is None:
+            feasible_day = None
+        else:
+            feasible_day = timeline.earliest_day(remaining_to_consume)
+            if feasible_day is not None and ready_day is not None:
+                feasible_day = max(feasible_day, ready_day)
 
-        self.set_stock_buckets(plant, so_id, item, buckets)
+        if self.log_consumption:
+            self.logger.info(
+                "Stock consume done | Allocation=%s | Unfulfilled=%s | Ready day=%s | Feasible day=%s | Final Buckets=%s",
+                allocation, remaining_to_consume / factor, ready_day, feasible_day, buckets
+            )
+        return allocation, remaining_to_consume / factor, ready_day, feasible_day
 
-        self.logger.info("Stock consume done | Allocation=%s | Unfulfilled=%s | Final Buckets=%s", allocation, remaining_to_consume, buckets)
 
-        return allocation, remaining_to_consume
+    def quantize(self, item, qty):
+        """Demand rounded to the item's fixed-point precision (unchanged in float mode)."""
+        return qty if self.scale is None else self.scale.quantize(item, qty)
 
 
+    def quantize_many(self, items, qtys) -> np.ndarray:
+        qtys = np.asarray(qtys, dtype=np.float64)
+        return qtys if self.scale is None else self.scale.quantize_many(items, qtys)
+
+
+    def consume_many(self, plants, so_ids, items, consume_qtys):
+        """
+        Batched consume_with_priority: requests (parallel sequences of ids and
+        quantities) are applied in the given order with the same key
+        resolution (SO-level stock first, else ITEM-level) and the same
+        SOH -> QC -> Transit waterfall, but the waterfall runs for all of them
+        at once in a NumPy kernel (allocate_waterfall).
+
+        Returns (allocation, unfulfilled): an (n, 3) array of quantities taken
+        per bucket (STOCK_BUCKETS order) and an (n,) array of unfulfilled
+        quantities (exactly 0 for fully covered requests). In fixed-point
+        mode the kernel runs on int64 units and the results are converted back.
+        With time-phased stock the requests are served one by one (the kernel
+        knows no receipt dates).
+        """
+        if self.timelines:
+            results = [self.consume_with_priority(*request) for request in zip(plants, so_ids, items, consume_qtys)]
+            allocation = np.array(
+                [[alloc[col] for col in STOCK_BUCKETS] for alloc, _ in results], dtype=np.float64
+            ).reshape(len(results), len(STOCK_BUCKETS))
+            return allocation, np.array([unfulfilled for _, unfulfilled in results], dtype=np.float64)
+
+        qtys = np.array([float(q or 0) for q in consume_qtys], dtype=np.float64)
+        n = len(qtys)
+        self.consumes += n
+        if self.scale is not None:
+            factors = self.scale.factors(items)
+            demand, dtype, number = np.rint(qtys * factors).astype(np.int64), np.int64, int
+        else:
+            demand, dtype, number = qtys, np.float64, float
+
+        # Resolve each request to a stock row once; rows index `resolved`
+        rows = np.full(n, -1, dtype=np.int64)
+        so_level = np.zeros(n, dtype=bool)
+        row_of, resolved = {}, []
+        remaining = self.remaining_stock
+        for i, key in enumerate(zip(plants, so_ids, items)):
+            if key in remaining:
+                so_level[i] = key[1] is not None
+            else:
+                key = (key[0], None, key[2])
+                if key not in remaining:
+                    continue
+            row = row_of.get(key)
+            if row is None:
+                row = row_of[key] = len(resolved)
+                resolved.append(key)
+            rows[i] = row
+
+        capacity = np.array(
+            [[number(remaining[key].get(col, 0) or 0) for col in STOCK_BUCKETS] for key in resolved],
+            dtype=dtype
+        ).reshape(len(resolved), len(STOCK_BUCKETS))
+        allocation, covered = allocate_waterfall(rows, np.maximum(demand, 0), np.maximum(capacity, 0))
+
+        # Write back per stock key, in place (ITEM-level dicts may be shared)
+        used = np.zeros_like(capacity)
+        stocked = rows >= 0
+        np.add.at(used, rows[stocked], allocation[stocked])
+        for key, key_used in zip(resolved, used.tolist()):
+            buckets = remaining[key]
+            for col, qty in zip(STOCK_BUCKETS, key_used):
+                if qty > 0:
+                    buckets[col] = number(buckets.get(col, 0) or 0) - qty
+
+        if self.scale is not None:
+            unfulfilled = (demand - allocation.sum(axis=1)) / factors
+            allocation = allocation / factors[:, None]
+        else:
+            unfulfilled = np.where(covered, 0.0, qtys - allocation.sum(axis=1))
+
+        if self.ledger is not None:
+            req, bucket = np.nonzero(allocation > 0)
+            self.ledger.record_frame(pl.DataFrame({
+                "plant": pl.Series([plants[i] for i in req.tolist()], dtype=pl.Int64),
+                "so_id": pl.Series([so_ids[i] for i in req.tolist()], dtype=pl.Int64),
+                "item": pl.Series([items[i] for i in req.tolist()], dtype=pl.Int64),
+                "so_level": so_level[req],
+                "bucket": bucket.astype(np.int64),
+                "qty": allocation[req, bucket],
+            }))
+
+        if self.log_consumption:
+            self.logger.info(
+                "Stock consume batch | Requests=%d | Stock keys=%d | Allocated=%s | Unfulfilled=%s",
+                n, len(resolved), float(allocation.sum()), float(unfulfilled[unfulfilled > 0].sum())
+            )
+        return allocation, unfulfilled
+
 
     def get_stock_buckets(self, plant, so_id, item):
         return self.remaining_stock.get(
@@ -93,6 +314,157 @@ class StockManager:
         if key in self.remaining_stock:
             self.remaining_stock[key] = buckets
         else:
-            self.logger.warning("Attempted to update non-existent stock | Plant=%s | SO=%s | Item=%s", plant, so_id, item)
+            self.logger.warning("Attempted to update non-existent stock | Plant=%s | SO=%s | Item=%s", self.keys.decode(plant), self.keys.decode(so_id), self.keys.decode(item))
             return
 
+
+    def remaining_stock_df(self, receipts: bool = True) -> pl.DataFrame:
+        """
+        Remaining stock (SO + ITEM level) as a dataframe with keys
+        decoded back to strings.
+
+        Time-phased stock gets an available_date column and, with receipts,
+        one row per remaining receipt of dated keys (fully consumed receipts
+        included, so every key keeps its rows); receipts=False gives one
+        row of totals per key.
+        """
+        plants, so_ids, items, days = [], [], [], []
+        bucket_values = {col: [] for col in STOCK_BUCKETS}
+
+        for key, buckets in self.remaining_stock.items():
+            timeline = self.timelines.get(key) if receipts else None
+            rows = timeline.remaining() if timeline is not None else [(None, [buckets.get(col, 0.0) for col in STOCK_BUCKETS])]
+            for day, values in rows:
+                plants.append(key[0])
+                so_ids.append(key[1])
+                items.append(key[2])
+                days.append(None if day == IMMEDIATE else day)
+                for col, value in zip(STOCK_BUCKETS, values):
+                    bucket_values[col].append(value)
+
+        days = days if self.time_phased else None
+        if self.scale is not None:
+            return self._remaining_units_df(plants, so_ids, items, bucket_values, days)
+
+        return pl.DataFrame([
+            self.keys.decode_series(so_ids, "order_id"),
+            self.keys.decode_series(items, "item_id"),
+            self.keys.decode_series(plants, "plant"),
+            *[pl.Series(col, values, dtype=pl.Float64) for col, values in bucket_values.items()],
+            *self._date_columns(days),
+        ])
+
+
+    def _remaining_units_df(self, plants, so_ids, items, bucket_values, days=None) -> pl.DataFrame:
+        """
+        Fixed-point remaining stock in float quantities. ITEM-level keys with
+        every bucket exactly 0 are dropped; SO-level keys are kept even when
+        empty, because they shadow the ITEM-level stock for their SO.
+        """
+        units = np.array([bucket_values[col] for col in STOCK_BUCKETS], dtype=np.int64).reshape(len(STOCK_BUCKETS), -1)
+        keep = np.array([so_id is not None for so_id in so_ids], dtype=bool) | (units != 0).any(axis=0)
+        factors = self.scale.factors(items)
+        rows = np.flatnonzero(keep).tolist()
+
+        return pl.DataFrame([
+            self.keys.decode_series([so_ids[i] for i in rows], "order_id"),
+            self.keys.decode_series([items[i] for i in rows], "item_id"),
+            self.keys.decode_series([plants[i] for i in rows], "plant"),
+            *[
+                pl.Series(col, units[b][keep] / factors[keep], dtype=pl.Float64)
+                for b, col in enumerate(STOCK_BUCKETS)
+            ],
+            *self._date_columns(None if days is None else [days[i] for i in rows]),
+        ])
+
+
+    def _date_columns(self, days) -> list:
+        # Receipt days as they were loaded (no as_of clamp): a later phase
+        # rebuilds the same timelines from them
+        if days is None:
+            return []
+        return [pl.Series("available_date", days, dtype=pl.Int32).cast(pl.Date)]
+
+
+    # ---------------- MEMORY ----------------
+    def memory_report(self, sample_size: int = 1000) -> dict:
+        """Stock key counts and (sampled) deep sizes of remaining_stock and the key dictionary."""
+        so_level = sum(1 for key in self.remaining_stock if key[1] is not None)
+        report = {
+            "stock_keys": len(self.remaining_stock),
+            "so_level_keys": so_level,
+            "item_level_keys": len(self.remaining_stock) - so_level,
+            "remaining_stock_bytes": deep_sizeof(self.remaining_stock, sample_size),
+            "key_dictionary_entries": len(self.keys),
+            "key_dictionary_bytes": deep_sizeof(vars(self.keys), sample_size),
+        }
+        if self.ledger is not None:
+            report["ledger_rows"] = self.ledger.rows
+        if self.timelines:
+            report["timeline_keys"] = len(self.timelines)
+            report["timeline_bytes"] = deep_sizeof(self.timelines, sample_size)
+        report["total_bytes"] = total_bytes(report)
+        return report
+
+
+def take_from_buckets(available, demand):
+    """
+    The SOH -> QC -> Transit step of every consume: takes demand from the
+    available quantity of each bucket (STOCK_BUCKETS order; floats or int
+    units) in priority order, skipping empty and negative buckets.
+
+    Returns (used per bucket, unfulfilled demand).
+    """
+    used = [0] * len(available)
+    for i, capacity in enumerate(available):
+        if demand <= 0:
+            break
+        if capacity <= 0:
+            continue
+        used[i] = min(capacity, demand)
+        demand -= used[i]
+    return used, demand
+
+
+def allocate_waterfall(rows, want, capacity):
+    """
+    SOH -> QC -> Transit waterfall for many requests at once (the batched
+    take_from_buckets).
+
+    rows: (n,) stock row of each request (-1: no stock), want: (n,) demand
+    >= 0 in priority order, capacity: (k, 3) available quantity >= 0 per
+    stock row and bucket (float64, or int64 fixed-point units: then every
+    sum is exact). Request i covers [lo, hi) of its row's cumulative
+    demand (prefix sums grouped by stock row) and takes from each bucket the overlap with
+    that bucket's cumulative capacity range, which is exactly what serving
+    the requests one by one would give.
+
+    Returns (allocation (n, 3), covered (n,) bool: demand fully served).
+    """
+    n = len(want)
+    allocation = np.zeros((n, len(STOCK_BUCKETS)), dtype=capacity.dtype)
+    covered = np.zeros(n, dtype=bool)
+
+    stocked = np.flatnonzero(rows >= 0)
+    if stocked.size == 0:
+        return allocation, covered
+    stock_rows = rows[stocked]
+    demand = want[stocked]
+
+    # Prefix sums of demand per stock row, in request order. Summed per
+    # group (not global cumsum minus group offsets) so they carry the same
+    # rounding as serving the requests one by one
+    prefix = pl.DataFrame({"row": stock_rows, "want": demand}).select(
+        pl.col("want").shift(1, fill_value=0).cum_sum().over("row").alias("lo"),
+        pl.col("want").cum_sum().over("row").alias("hi"),
+    )
+    lo = prefix["lo"].to_numpy()
+    hi = prefix["hi"].to_numpy()
+
+    upper = np.cumsum(capacity, axis=1)[stock_rows]
+    lower = np.concatenate([np.zeros((len(stocked), 1), dtype=upper.dtype), upper[:, :-1]], axis=1)
+    allocation[stocked] = np.clip(
+        np.minimum(hi[:, None], upper) - np.maximum(lo[:, None], lower), 0, None
+    )
+    covered[stocked] = (demand > 0) & (hi <= upper[:, -1])
+    return allocation, covered
@@ -0,0 +1,98 @@
+import polars as pl
+from common.stock_manager import StockManager, STOCK_BUCKETS
+from common.stock_timeline import date_expr
+from utils.schema_resolver import SchemaResolver
+
+
+class StockPreparer:
+    """
+    Cleans and aggregates a stock dataframe into the SO-level and ITEM-level
+    frames StockManager loads.
+
+    Both aggregates come from one lazy query with a single group_by on
+    (order_id, plant, item_id), where a null order_id marks ITEM-level stock.
+    Time-phased stock (an available_date column) keeps one row per receipt
+    date: available_date joins the group keys.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        # id(stock_df) -> stock_df registered by mark_aggregated, until prepared
+        self._aggregated = {}
+
+    def validate_stock_columns(self, stock_df):
+        available_cols = [c for c in STOCK_BUCKETS if c in stock_df.columns]
+        if not available_cols:
+            self.logger.error(
+                "Stock file does not contain any valid stock columns. "
+                "Expected at least one of %s",
+                STOCK_BUCKETS
+            )
+            raise ValueError("No valid stock columns available for allocation")
+        missing = [c for c in STOCK_BUCKETS if c not in stock_df.columns]
+        if missing:
+            self.logger.warning(
+                "Stock columns missing and will be ignored: %s", missing
+            )
+        self.logger.info(
+            "Stock columns detected for allocation (priority order preserved): %s",
+            available_cols
+        )
+        return available_cols
+
+    def mark_aggregated(self, stock_df):
+        """
+        Registers a frame that is already clean and has one row per
+        (order_id, plant, item_id[, available_date]), e.g.
+        StockManager.remaining_stock_df().
+        Preparing it only splits SO-level from ITEM-level rows; the mark is
+        dropped once the frame is prepared.
+        """
+        self._aggregated[id(stock_df)] = stock_df
+
+    def prepare(self, stock_df):
+        """
+        Returns (so_stock_df, item_stock_df).
+        """
+        available_stock_cols = self.validate_stock_columns(stock_df)
+        date_cols = ["available_date"] if "available_date" in stock_df.columns else []
+
+        if self._aggregated.pop(id(stock_df), None) is stock_df:
+            stock_agg_df = stock_df.select(["order_id", "plant", "item_id", *date_cols, *available_stock_cols])
+            self.logger.info("Stock already aggregated; splitting SO and ITEM level rows.")
+        else:
+            stock_agg_df = (
+                stock_df.lazy()
+                .with_columns([
+                    *SchemaResolver.strip_key_exprs(stock_df, ["order_id", "item_id", "plant"]),
+                    *[pl.col(c).fill_null(0).cast(pl.Float64) for c in available_stock_cols],
+                    *[date_expr(c, stock_df.schema[c]) for c in date_cols],
+                ])
+                # Empty order id == ITEM-level stock
+                .with_columns(
+                    pl.when(pl.col("order_id") == "")
+                    .then(None)
+                    .otherwise(pl.col("order_id"))
+                    .alias("order_id")
+                )
+                .group_by(["order_id", "plant", "item_id", *date_cols])
+                .agg([
+                    pl.sum(c).alias(c) for c in available_stock_cols
+                ])
+                .collect()
+            )
+            self.logger.info("Stock Data Cleaned and Aggregated (rows=%d).", stock_agg_df.height)
+
+        so_stock_df = stock_agg_df.filter(pl.col("order_id").is_not_null())
+        item_stock_df = stock_agg_df.filter(pl.col("order_id").is_null()).drop("order_id")
+        return so_stock_df, item_stock_df
+
+    def build_stock_manager(self, stock_df, keys=None, ledger=None, log_consumption=True, scale=None,
+                            as_of=None) -> StockManager:
+        so_stock_df, item_stock_df = self.prepare(stock_df)
+
+        stock_manager = StockManager(
+            self.logger, keys=keys, ledger=ledger, log_consumption=log_consumption, scale=scale, as_of=as_of
+        )
+        stock_manager.load_stock(so_stock_df, item_stock_df)
+        return stock_manager
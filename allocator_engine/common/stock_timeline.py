@@ -0,0 +1,120 @@
+import bisect
+from datetime import date
+
+import polars as pl
+
+# len(STOCK_BUCKETS) of stock_manager, which imports this module
+_N_BUCKETS = 3
+
+# Epoch day of stock without an available date: available from the start
+IMMEDIATE = -(1 << 62)
+# Required day of SOs without a required date: every receipt counts
+UNBOUNDED = 1 << 62
+_EPOCH = date(1970, 1, 1)
+
+
+# ---------------- DATES ----------------
+def date_expr(col: str, dtype) -> pl.Expr:
+    """col as pl.Date: dates pass, datetimes are truncated, strings are parsed (empty = null)."""
+    if dtype == pl.Date:
+        return pl.col(col)
+    if isinstance(dtype, pl.Datetime):
+        return pl.col(col).cast(pl.Date)
+    return (
+        pl.col(col).cast(pl.Utf8).str.strip_chars()
+        .replace("", None)
+        .str.to_date()
+        .alias(col)
+    )
+
+
+def column_days(df: pl.DataFrame, col: str, missing: int) -> list:
+    """Epoch days of a date column (missing for nulls, or for every row without the column)."""
+    if col not in df.columns:
+        return [missing] * df.height
+    days = df.select(date_expr(col, df.schema[col]).cast(pl.Int32)).to_series().to_list()
+    return [missing if d is None else d for d in days]
+
+
+def to_day(value) -> int | None:
+    """Epoch day of a date (None stays None)."""
+    return None if value is None else (value - _EPOCH).days
+
+
+def as_of_day(value=None) -> int:
+    """Epoch day of the as-of date (date or ISO string; None = today)."""
+    if value is None:
+        return to_day(date.today())
+    return to_day(value if isinstance(value, date) else date.fromisoformat(str(value).strip()))
+
+
+def day_series(name: str, days, as_of: int) -> pl.Series:
+    """
+    Dates of epoch days for output; days before as_of (undated stock,
+    receipts already in) read as as_of. None stays null.
+    """
+    return pl.Series(name, [None if d is None else max(d, as_of) for d in days], dtype=pl.Int32).cast(pl.Date)
+
+
+# ---------------- TIMELINE ----------------
+class StockTimeline:
+    """
+    Receipts of one stock key in available-date order, with per-bucket
+    prefix sums of their quantities. Each bucket is consumed first in first
+    out: consumed[b] units are gone from the earliest receipts, so
+
+    - what a consume may take by a required day is one bisect on dates
+      (prefix[b][k] - consumed[b], k = receipts on or before that day),
+    - the receipt a consume ends in is one bisect on the prefix sums,
+    - the earliest day an unfulfilled rest is covered is a binary search
+      over receipts,
+
+    and no consume scans the receipts. Quantities are floats, or int64
+    units in fixed-point mode (exact prefix sums).
+    """
+    __slots__ = ("dates", "prefix", "consumed")
+
+    def __init__(self, receipts: dict):
+        """receipts: {epoch day (IMMEDIATE for undated stock): [qty per bucket]}."""
+        self.dates = sorted(receipts)
+        self.prefix = []
+        for b in range(_N_BUCKETS):
+            running, prefix = 0, [0]
+            for day in self.dates:
+                # Negative rows never add availability (as in the waterfall)
+                running += max(receipts[day][b] or 0, 0)
+                prefix.append(running)
+            self.prefix.append(prefix)
+        self.consumed = [0] * _N_BUCKETS
+
+    def available(self, bucket: int, day: int):
+        """Unconsumed quantity of bucket in receipts available on or before day."""
+        k = bisect.bisect_right(self.dates, day)
+        return max(self.prefix[bucket][k] - self.consumed[bucket], 0)
+
+    def consume(self, bucket: int, qty) -> int:
+        """Takes qty from the earliest unconsumed receipts of bucket; returns the day of the last one touched."""
+        self.consumed[bucket] += qty
+        k = bisect.bisect_left(self.prefix[bucket], self.consumed[bucket])
+        return self.dates[min(max(k, 1), len(self.dates)) - 1]
+
+    def earliest_day(self, qty):
+        """First receipt day by which unconsumed receipts of all buckets cover qty, or None."""
+        def covered(k):
+            return sum(max(p[k] - c, 0) for p, c in zip(self.prefix, self.consumed)) >= qty
+
+        lo, hi = 1, len(self.dates)
+        if not self.dates or not covered(hi):
+            return None
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if covered(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return self.dates[lo - 1]
+
+    def remaining(self):
+        """(day, [unconsumed qty per bucket]) per receipt, in date order."""
+        for j, day in enumerate(self.dates):
+            yield day, [max(p[j + 1] - max(c, p[j]), 0) for p, c in zip(self.prefix, self.consumed)]
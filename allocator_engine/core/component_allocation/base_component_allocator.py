@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 import polars as pl
 from common.bom_tree import BOMTree
 from common.stock_manager import StockManager
+from utils.memory import frame_size, total_bytes
 
 class BaseComponentAllocator(ABC):
     """
@@ -9,17 +10,24 @@ class BaseComponentAllocator(ABC):
     Defines the interface that every allocator must implement.
     """
 
-    def __init__(self, so_df: pl.DataFrame, bom_tree: BOMTree, stock_manager: StockManager, config=None, logger=None) -> None:
+    def __init__(self, so_df: pl.DataFrame, bom_tree: BOMTree, stock_manager: StockManager, config=None, logger=None, progress=None) -> None:
         """
         :param so_df: Sales order dataframe
         :param bom_tree: BOMTree object with precomputed BOM
         :param stock_manager: StockManager object to get/set stock
+        :param progress: optional ProgressReporter, advanced once per SO
         """
         self.so_df = so_df
         self.bom_tree = bom_tree
         self.stock_manager = stock_manager
+        self.keys = stock_manager.keys
         self.config = config or {}
         self.logger = logger
+        # Remark event table, set by allocators running with `remarks: codes`
+        self.remarks_df = None
+        self.progress = progress
+        # Strategy-specific sizes of intermediate structures, filled while allocating
+        self.memory_stats = {}
 
     @abstractmethod
     def allocate(self) -> pl.DataFrame:
@@ -31,6 +39,21 @@ class BaseComponentAllocator(ABC):
         """
         pass
     
+    def memory_report(self, sample_size: int = 1000) -> dict:
+        """
+        Sizes of the allocator's own data: SO / remarks frames plus whatever
+        the strategy recorded in memory_stats (output buffers, node frames).
+        BOMTree and StockManager report separately.
+        """
+        report = {
+            "so_rows": self.so_df.height,
+            "so_df_bytes": frame_size(self.so_df),
+            "remarks_df_bytes": frame_size(self.remarks_df),
+            **self.memory_stats,
+        }
+        report["total_bytes"] = total_bytes(report)
+        return report
+
     @classmethod
     def base_required_schemas(cls):
         return {
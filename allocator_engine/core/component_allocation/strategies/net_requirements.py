@@ -0,0 +1,320 @@
+import polars as pl
+from collections import deque, defaultdict
+
+from common.remarks import RemarkCode, RemarkLog, attach_remarks, remark_mode
+from core.component_allocation.base_component_allocator import BaseComponentAllocator
+from core.component_allocation.strategies.partial import PartialComponentAllocator
+from utils.memory import frame_size
+
+# Remark ordering inside one SO: resolution remarks, node remarks (by BFS index), final remark
+_FINAL_REMARK_POS = 1 << 62
+
+
+class NetRequirementsComponentAllocator(BaseComponentAllocator):
+    """
+    MRP-style net-requirements allocation.
+
+    Every SO's BOM is exploded structurally, then items are processed by
+    low-level code (an item is only processed after all of its parent items).
+    For each level, the demand of all SO nodes goes to
+    StockManager.consume_many in one batch, which pegs stock to the nodes
+    with a grouped prefix-sum split over the SOH -> QC -> Transit buckets.
+
+    Each stock key still sees its demands in (SO, BFS) order, so output rows,
+    remarks and remaining stock match PartialComponentAllocator (within float
+    tolerance), while the allocation work scales with levels and distinct
+    items instead of SO x BOM nodes.
+    """
+
+    @classmethod
+    def extra_required_schemas(cls):
+        return {}
+
+
+    def allocate(self) -> pl.DataFrame:
+        self.logger.info("Starting net-requirements component allocation for all sales orders.")
+
+        if self.stock_manager.time_phased or "required_date" in self.so_df.columns:
+            self.logger.warning(
+                "Time-phased stock / required dates: net-requirements allocation nets quantities without "
+                "receipt dates; falling back to per-node partial component allocation."
+            )
+            return self._allocate_with_partial()
+
+        if self.config.get("prune_zero_demand", False):
+            self.logger.warning("prune_zero_demand is not supported by net-requirements allocation and is ignored.")
+
+        so_ids = self.keys.encode_series(self.so_df["order_id"]).to_list()
+        fg_ids = self.keys.encode_series(self.so_df["fg_id"]).to_list()
+        plant_ids = self.keys.encode_series(self.so_df["plant"]).to_list()
+        order_qtys = self.so_df["order_qty"].to_list()
+
+        # ---------------- RESOLVE ORDERS & EXPLOSION TEMPLATES ----------------
+        templates = {}
+        tpl_columns = {c: [] for c in ["tpl_id", "bfs_idx", "parent_bfs_idx", "item", "parent", "level", "ratio"]}
+        order_columns = {c: [] for c in ["so_idx", "so_id", "plant", "tpl_id", "fg_qty"]}
+        remarks = RemarkLog()
+
+        for so_idx, (so_id, fg, plant, fg_qty) in enumerate(zip(so_ids, fg_ids, plant_ids, order_qtys)):
+            fg_qty = float(fg_qty or 0.0)
+            resolved_root, bom_tree, resolution_type = self.bom_tree.resolve_fg(fg, plant)
+
+            if resolution_type == "NOT_FOUND":
+                remarks.add(so_idx, so_id, RemarkCode.BOM_NOT_FOUND, pos=-3, item=fg, plant=plant)
+                continue
+
+            if not bom_tree:
+                remarks.add(so_idx, so_id, RemarkCode.BOM_TREE_EMPTY, pos=-3, ref=resolved_root, plant=plant)
+                continue
+
+            if resolution_type == "SFG":
+                remarks.add(so_idx, so_id, RemarkCode.TREATED_AS_SFG, pos=-2, item=fg, ref=resolved_root)
+
+            if fg_qty <= 0:
+                remarks.add(so_idx, so_id, RemarkCode.ZERO_ORDER_QTY, pos=-1)
+
+            tpl_key = (resolved_root, plant, fg)
+            if tpl_key not in templates:
+                templates[tpl_key] = len(templates)
+                self._add_template(templates[tpl_key], self.bom_tree.explosion(resolved_root, plant, fg), tpl_columns)
+
+            order_columns["so_idx"].append(so_idx)
+            order_columns["so_id"].append(so_id)
+            order_columns["plant"].append(plant)
+            order_columns["tpl_id"].append(templates[tpl_key])
+            order_columns["fg_qty"].append(fg_qty)
+            remarks.add(so_idx, so_id, RemarkCode.ORDER_PROCESSED, pos=_FINAL_REMARK_POS)
+
+        # ---------------- LOW-LEVEL CODES ----------------
+        plant_of_tpl = {tpl_id: plant for (_, plant, _), tpl_id in templates.items()}
+        edges = {
+            (plant_of_tpl[t], p, c)
+            for t, p, c in zip(tpl_columns["tpl_id"], tpl_columns["parent"], tpl_columns["item"])
+            if p is not None
+        }
+        codes = self._low_level_codes(edges)
+        if codes is None:
+            self.logger.warning(
+                "Item graph contains a parent/child cycle across BOMs; "
+                "falling back to per-node partial component allocation."
+            )
+            return self._allocate_with_partial()
+
+        # ---------------- NODE TABLE ----------------
+        orders_df = pl.DataFrame(order_columns, schema={
+            "so_idx": pl.Int64, "so_id": pl.Int64, "plant": pl.Int64, "tpl_id": pl.Int64, "fg_qty": pl.Float64
+        })
+        tpl_df = pl.DataFrame(tpl_columns, schema={
+            "tpl_id": pl.Int64, "bfs_idx": pl.Int64, "parent_bfs_idx": pl.Int64, "item": pl.Int64,
+            "parent": pl.Int64, "level": pl.Int64, "ratio": pl.Float64
+        })
+        codes_df = pl.DataFrame(
+            {
+                "plant": [k[0] for k in codes],
+                "item": [k[1] for k in codes],
+                "code": list(codes.values()),
+            },
+            schema={"plant": pl.Int64, "item": pl.Int64, "code": pl.Int64}
+        )
+
+        # Nodes of one SO are contiguous and in BFS order, so a node's parent
+        # sits at (node - bfs_idx + parent_bfs_idx)
+        nodes = (
+            orders_df
+            .join(tpl_df, on="tpl_id", how="inner")
+            .sort(["so_idx", "bfs_idx"])
+            .with_row_index("node")
+            .with_columns(pl.col("node").cast(pl.Int64))
+            .with_columns(
+                (pl.col("node") - pl.col("bfs_idx") + pl.col("parent_bfs_idx")).alias("parent_node")
+            )
+            .join(codes_df, on=["plant", "item"], how="left")
+            .with_columns(pl.col("code").fill_null(0))
+            .sort("node")
+        )
+
+        self.logger.info(
+            "Exploded %d SO(s) into %d BOM node(s) across %d level(s).",
+            orders_df.height, nodes.height, (nodes["code"].max() + 1) if nodes.height else 0
+        )
+
+        # ---------------- LEVEL-BY-LEVEL NET ALLOCATION ----------------
+        remaining = pl.Series("remaining", [0.0] * nodes.height, dtype=pl.Float64)
+        results = []
+
+        for code in range(nodes["code"].max() + 1 if nodes.height else 0):
+            lvl = nodes.filter(pl.col("code") == code)
+            if lvl.height == 0:
+                continue
+
+            parent_remaining = remaining.gather(lvl["parent_node"])
+            lvl = lvl.with_columns(
+                pl.when(pl.col("parent_node").is_null())
+                .then(pl.col("fg_qty"))
+                .otherwise(parent_remaining * pl.col("ratio"))
+                .alias("order_qty")
+            )
+            if self.stock_manager.scale is not None:
+                # Fixed-point: demand rounded to the item precision before it meets stock
+                lvl = lvl.with_columns(pl.Series(
+                    "order_qty", self.stock_manager.quantize_many(lvl["item"].to_list(), lvl["order_qty"].fill_null(0.0))
+                ))
+            lvl = lvl.with_columns(
+                pl.when(pl.col("order_qty") > 0).then(pl.col("order_qty")).otherwise(0.0).alias("want")
+            )
+
+            # All demand for a stock key sits on one level, so the whole level
+            # is one batched waterfall in (SO, BFS) order. A fully covered
+            # node leaves exactly 0 remaining, as the serial waterfall does,
+            # so prefix-sum rounding never leaks tiny demand into the children
+            allocation, unfulfilled = self.stock_manager.consume_many(
+                lvl["plant"].to_list(), lvl["so_id"].to_list(), lvl["item"].to_list(), lvl["want"].to_list()
+            )
+            lvl_result = lvl.select(
+                "node", "order_qty", "want",
+                pl.Series("alloc_soh", allocation[:, 0]),
+                pl.Series("alloc_qc", allocation[:, 1]),
+                pl.Series("alloc_transit", allocation[:, 2]),
+                (pl.col("want") - pl.Series(unfulfilled)).alias("allocated"),
+                pl.Series("remaining", unfulfilled),
+            )
+
+            remaining.scatter(lvl_result["node"], lvl_result["remaining"])
+            results.append(lvl_result)
+            if self.progress is not None:
+                # SOs only complete with the last level; nodes advance per level
+                self.progress.advance(0, lvl.height)
+
+        if self.progress is not None:
+            self.progress.advance(len(so_ids))
+
+        # ---------------- OUTPUT ----------------
+        output_df = self._build_output(nodes, results)
+
+        node_remarks = (
+            nodes.select("node", "so_idx", "bfs_idx", "so_id", "plant", "item")
+            .join(output_df.select(pl.int_range(pl.len()).alias("node"), "Order_Qty", "Allocated_Qty"), on="node")
+            .filter((pl.col("Order_Qty") > 0) & ~(pl.col("Allocated_Qty") > 0))
+        )
+        remarks_df = pl.concat([
+            remarks.to_frame(),
+            node_remarks.select(
+                "so_idx",
+                pl.col("bfs_idx").alias("pos"),
+                "so_id",
+                pl.lit(int(RemarkCode.COMPONENT_NO_STOCK), dtype=pl.Int64).alias("code"),
+                "item",
+                pl.lit(None, dtype=pl.Int64).alias("ref"),
+                "plant",
+                pl.col("Order_Qty").alias("qty"),
+                pl.lit(None, dtype=pl.Float64).alias("total"),
+            ),
+        ])
+        self._merge_remarks(remarks_df)
+
+        self.memory_stats = {
+            "output_rows": output_df.height,
+            "node_frame_bytes": frame_size(nodes),
+            "level_results_bytes": sum(frame_size(r) for r in results),
+            "output_df_bytes": frame_size(output_df),
+        }
+        self.stats = {
+            "orders": orders_df.height,
+            "nodes_visited": nodes.height,
+            "nodes_allocated": int((output_df["Allocated_Qty"] > 0).sum()),
+        }
+        self.logger.info(
+            "Net-requirements component allocation completed | Nodes=%d | Nodes allocated=%d",
+            self.stats["nodes_visited"], self.stats["nodes_allocated"]
+        )
+        return output_df
+
+
+    # ---------------- HELPERS ----------------
+    def _allocate_with_partial(self) -> pl.DataFrame:
+        """Allocates with PartialComponentAllocator and adopts its so_df, remarks and memory stats."""
+        fallback = PartialComponentAllocator(
+            self.so_df, self.bom_tree, self.stock_manager, config=self.config, logger=self.logger,
+            progress=self.progress
+        )
+        output_df = fallback.allocate()
+        self.so_df = fallback.so_df
+        self.remarks_df = fallback.remarks_df
+        self.memory_stats = fallback.memory_stats
+        return output_df
+
+
+    @staticmethod
+    def _add_template(tpl_id, explosion, tpl_columns):
+        """Template rows from the compiled BFS explosion, in the order PartialComponentAllocator visits nodes."""
+        n = len(explosion)
+        tpl_columns["tpl_id"].extend([tpl_id] * n)
+        tpl_columns["bfs_idx"].extend(range(n))
+        tpl_columns["parent_bfs_idx"].extend(p if p >= 0 else None for p in explosion.parent_pos)
+        tpl_columns["item"].extend(explosion.items)
+        tpl_columns["parent"].extend(explosion.parents)
+        tpl_columns["level"].extend(explosion.levels)
+        tpl_columns["ratio"].extend(explosion.ratios)
+
+    @staticmethod
+    def _low_level_codes(edges):
+        """
+        Longest-path level per (plant, item) over parent -> child edges.
+        Returns None if the item graph has a cycle.
+        """
+        children = defaultdict(set)
+        indegree = defaultdict(int)
+        items = set()
+        for plant, parent, child in edges:
+            items.add((plant, parent))
+            items.add((plant, child))
+            if (plant, child) not in children[(plant, parent)]:
+                children[(plant, parent)].add((plant, child))
+                indegree[(plant, child)] += 1
+
+        codes = {n: 0 for n in items}
+        ready = deque(n for n in items if indegree[n] == 0)
+        processed = 0
+        while ready:
+            n = ready.popleft()
+            processed += 1
+            for c in children[n]:
+                codes[c] = max(codes[c], codes[n] + 1)
+                indegree[c] -= 1
+                if indegree[c] == 0:
+                    ready.append(c)
+
+        if processed < len(items):
+            return None
+        return codes
+
+    def _build_output(self, nodes, results):
+        empty = pl.DataFrame(schema={
+            "node": pl.Int64, "order_qty": pl.Float64, "want": pl.Float64,
+            "alloc_soh": pl.Float64, "alloc_qc": pl.Float64, "alloc_transit": pl.Float64,
+            "allocated": pl.Float64, "remaining": pl.Float64,
+        })
+        allocated = pl.concat(results) if results else empty
+        out = nodes.select("node", "so_id", "plant", "parent", "level", "item").join(
+            allocated, on="node", how="left"
+        ).sort("node")
+
+        return pl.DataFrame({
+            "SO_ID": self.keys.decode_series(out["so_id"]),
+            "Plant": self.keys.decode_series(out["plant"]),
+            "Parent": self.keys.decode_series(out["parent"]).fill_null(""),
+            "BOM_Level": out["level"].cast(pl.Int64),
+            "Item": self.keys.decode_series(out["item"]),
+            "Order_Qty": out["order_qty"].cast(pl.Float64),
+            "Allocated_Qty": out["allocated"].cast(pl.Float64),
+            "Alloc_StockOnHand": out["alloc_soh"].cast(pl.Float64),
+            "Alloc_StockInQC": out["alloc_qc"].cast(pl.Float64),
+            "Alloc_StockInTransit": out["alloc_transit"].cast(pl.Float64),
+            "Order_Remaining": out["remaining"].cast(pl.Float64),
+        })
+
+    def _merge_remarks(self, remarks_df):
+        self.so_df, self.remarks_df = attach_remarks(
+            self.so_df, remarks_df, self.keys, "component_allocation_remarks", remark_mode(self.config)
+        )
+        self.logger.debug("Remarks merged into SO dataframe.")
@@ -0,0 +1,36 @@
+import polars as pl
+
+from common.contention import partition_orders
+from core.component_allocation.strategies.partial import PartialComponentAllocator
+
+
+class ParallelComponentAllocator(PartialComponentAllocator):
+    """
+    Partial component allocation that first splits sales orders into groups
+    that share no stock key (connected components of the SO <-> stock-key
+    contention graph) and reports how much independent work the run has.
+    Orders are then allocated in SO order on this thread, so the result is
+    identical to PartialComponentAllocator.
+
+    There is no worker pool: allocation is pure Python, and neither a thread
+    pool (GIL) nor spawned shared-memory workers beat serial allocation on
+    `python -m benchmarks.differential --seeds 3 --orders 300` (thread
+    0.52-0.82x, shared_memory 0.03-0.04x of serial partial).
+    """
+
+    def allocate(self) -> pl.DataFrame:
+        self.logger.info("Starting component allocation for all sales orders (contention partitioned).")
+        if self.config.get("parallel_executor") not in (None, "serial"):
+            self.logger.warning("parallel_executor '%s' was removed; allocating serially.", self.config["parallel_executor"])
+        self._setup_allocation()
+
+        orders = self._encoded_orders()
+        groups = partition_orders(orders, self.bom_tree, self.stock_manager)
+        self.logger.info(
+            "Contention partitioning | Orders=%d | Independent groups=%d | Largest group=%d",
+            len(orders), len(groups), max((len(g[0]) for g in groups), default=0)
+        )
+
+        buffer = self._new_buffer()
+        self._allocate_orders(orders, buffer, self.progress)
+        return self._finalize([buffer])
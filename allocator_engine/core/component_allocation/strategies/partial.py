@@ -1,13 +1,59 @@
 import polars as pl
-from collections import deque
 
+from common.remarks import RemarkCode, RemarkLog, attach_remarks, remark_mode
+from common.stock_timeline import IMMEDIATE, UNBOUNDED, column_days, date_expr, day_series
 from core.component_allocation.base_component_allocator import BaseComponentAllocator
+from utils.memory import deep_sizeof, frame_size
+
+OUTPUT_COLUMNS = [
+    "SO_ID", "Plant", "Parent", "BOM_Level",
+    "Item", "Order_Qty", "Stock_Before",
+    "Allocated_Qty", "Order_Remaining", "Remaining_Stock",
+    "Alloc_StockOnHand", "Alloc_StockInQC", "Alloc_StockInTransit"
+]
+PRUNED_SUMMARY_COLUMNS = ["Covered_By_Parent", "Pruned_Nodes"]
+
+
+class AllocationBuffer:
+    """
+    Output rows, remark events and node-visit counts collected for a set of
+    sales orders. Every row and remark carries the SO's position in so_df,
+    so buffers filled independently can be merged back in SO order.
+    """
+
+    def __init__(self, extra_columns=()):
+        self.columns = {col: [] for col in [*OUTPUT_COLUMNS, *extra_columns]}
+        self.so_index = []
+        self.remarks = RemarkLog()
+        self.stats = {"nodes_visited": 0, "subtrees_pruned": 0, "nodes_pruned": 0}
+        # Stock consumes made by a worker process (progress reporting)
+        self.consumes = 0
+        # Earliest feasible epoch day per SO position (time-phased runs)
+        self.feasible = {}
+
 
 class PartialComponentAllocator(BaseComponentAllocator):
     """
     Partial allocation strategy using BFS on BOM tree.
     Performs component explosion and allocates stock where available.
     Adds order-level component allocation remarks into so_df.
+
+    Config options (component_allocation phase):
+    - prune_zero_demand: do not explode children of a node whose demand is
+      fully covered; their demand would be 0 all the way down.
+    - emit_pruned_summary: with pruning, emit one "covered by parent" row per
+      pruned subtree (Covered_By_Parent / Pruned_Nodes columns).
+    - remarks: text | codes | off. Remarks are recorded as coded events;
+      text is rendered into so_df only in `text` mode, `codes` keeps the
+      event table in self.remarks_df.
+    Node-visit counts are kept in self.stats.
+
+    With time-phased stock or a required_date column every consume takes
+    only receipts available by the SO's required date, and so_df gets
+    earliest_feasible_date: the day every leaf's demand is covered (the
+    latest receipt used or expected below the FG, and not before an
+    allocated_ready_date from order allocation), null when a leaf's demand
+    exceeds all known receipts.
     """
 
     @classmethod
@@ -17,111 +63,178 @@ class PartialComponentAllocator(BaseComponentAllocator):
 
     def allocate(self) -> pl.DataFrame:
         self.logger.info("Starting component allocation for all sales orders.")
-        order_remarks: dict[str, str] = {}
-
-        def add_remark(order_id: str, message: str) -> None:
-            """Append-safe remark writer."""
-            order_remarks[order_id] = f"{order_remarks.get(order_id, '')}{' | ' if order_id in order_remarks else ''}{message}"
-            self.logger.debug(f"Remark for SO '{order_id}': {message}")
-
-        # Output storage
-        output_columns = {col: [] for col in [
-            "SO_ID", "Plant", "Parent", "BOM_Level",
-            "Item", "Order_Qty", "Stock_Before",
-            "Allocated_Qty", "Order_Remaining", "Remaining_Stock",
-            "Alloc_StockOnHand", "Alloc_StockInQC", "Alloc_StockInTransit"
-        ]}
+        self._setup_allocation()
+
+        buffer = self._new_buffer()
+        self._allocate_orders(self._encoded_orders(), buffer, self.progress)
+
+        return self._finalize([buffer])
+
+
+    def _allocate_orders(self, orders, buffer: AllocationBuffer, progress=None) -> None:
+        if progress is None:
+            for order in orders:
+                self._allocate_order(*order, buffer)
+            return
+
+        stats = buffer.stats
+        for order in orders:
+            visited = stats["nodes_visited"]
+            self._allocate_order(*order, buffer)
+            progress.advance(1, stats["nodes_visited"] - visited)
+
+
+    # ---------------- SETUP ----------------
+    def _setup_allocation(self):
+        self._prune_zero_demand = bool(self.config.get("prune_zero_demand", False))
+        self._emit_pruned_summary = self._prune_zero_demand and bool(self.config.get("emit_pruned_summary", False))
+        # Worker processes build allocators without so_df; they never run dated
+        self._dated = self.so_df is not None and (
+            self.stock_manager.time_phased or "required_date" in self.so_df.columns
+        )
+        if self._dated:
+            self._required_days = column_days(self.so_df, "required_date", UNBOUNDED)
+            self._prior_days = column_days(self.so_df, "allocated_ready_date", IMMEDIATE)
+
+    def _new_buffer(self) -> AllocationBuffer:
+        return AllocationBuffer(PRUNED_SUMMARY_COLUMNS if self._emit_pruned_summary else ())
+
+    def _encoded_orders(self):
+        """
+        (so_idx, so_id, fg, plant, fg_qty) per SO row.
+        Keys are interned once; the BFS only touches int ids.
+        """
+        so_ids = self.keys.encode_series(self.so_df["order_id"]).to_list()
+        fg_ids = self.keys.encode_series(self.so_df["fg_id"]).to_list()
+        plant_ids = self.keys.encode_series(self.so_df["plant"]).to_list()
+        order_qtys = self.so_df["order_qty"].to_list()
+
+        return [
+            (so_idx, so_id, fg, plant, float(fg_qty or 0.0))
+            for so_idx, (so_id, fg, plant, fg_qty) in enumerate(zip(so_ids, fg_ids, plant_ids, order_qtys))
+        ]
+
+
+    # ---------------- PER ORDER ----------------
+    def _allocate_order(self, so_idx, so_id, fg, plant, fg_qty, buffer: AllocationBuffer) -> None:
+        decode = self.keys.decode
+        quantize = self.stock_manager.quantize
+        output_columns = buffer.columns
+        stats = buffer.stats
+
+        def add_remark(code: RemarkCode, **fields) -> None:
+            buffer.remarks.add(so_idx, so_id, code, **fields)
+            self.logger.debug(f"Remark for SO '{decode(so_id)}': {code.name}")
 
         def append_row(**kwargs):
+            if self._emit_pruned_summary:
+                kwargs.setdefault("Covered_By_Parent", False)
+                kwargs.setdefault("Pruned_Nodes", 0)
             for k, v in kwargs.items():
                 output_columns[k].append(v)
+            buffer.so_index.append(so_idx)
             self.logger.debug(f"Appended row: {kwargs}")
 
-        # Iterate Sales Orders
-        for r in self.so_df.iter_rows(named=True):
-            so_id = str(r["order_id"]).strip()
-            fg = str(r["fg_id"]).strip()
-            plant = str(r["plant"]).strip()
-            fg_qty = float(r.get("order_qty") or 0.0)
-
-            self.logger.info(f"Processing SO '{so_id}' | FG '{fg}' | Plant '{plant}' | Order Qty {fg_qty}")
-
-            resolved_root, bom_tree, resolution_type = self.bom_tree.resolve_fg(fg, plant)
-
-            self.logger.debug(f"BOM resolution - FG: '{fg}', Resolved Root: '{resolved_root}', Type: '{resolution_type}'")
-
-            if resolution_type == "NOT_FOUND":
-                add_remark(
-                    so_id,
-                    f"No BOM found where '{fg}' exists as FG or SFG at Plant '{plant}'. Order skipped."
-                )
-                self.logger.warning(f"SO '{so_id}' skipped: BOM not found for FG '{fg}' at plant '{plant}'")
-                continue
-
-            if not bom_tree:
-                add_remark(
-                    so_id,
-                    f"BOM tree empty for resolved root '{resolved_root}' at Plant '{plant}'. Order skipped."
-                )
-                self.logger.warning(f"SO '{so_id}' skipped: BOM tree empty for root '{resolved_root}'")
-                continue
-
-            if resolution_type == "SFG":
-                add_remark(
-                    so_id,
-                    f"Ordered FG '{fg}' treated as SFG under BOM of '{resolved_root}'."
-                )
-                self.logger.info(f"SO '{so_id}': FG '{fg}' treated as SFG under '{resolved_root}'")
-
-            if fg_qty <= 0:
-                add_remark(so_id, "Order quantity is zero; BOM exploded without allocation.")
-                self.logger.warning(f"SO '{so_id}' has zero order quantity")
-
-            # BFS initialization
-            queue = deque([{
-                "item": fg,          # always start from ordered item
-                "parent": "",
-                "level": 0,
-                "order_qty": fg_qty
-            }])
-
-            while queue:
-                current = queue.popleft()
-                item = current["item"]
-                parent = current["parent"]
-                level = current["level"]
-                order_qty = float(current["order_qty"] or 0.0)
-
-                self.logger.debug(f"BFS processing - Item: '{item}', Parent: '{parent}', Level: {level}, Order Qty: {order_qty}")
-
-                # if order_qty > 0:
-                #     if not self.stock_manager.has_stock(plant, so_id, item):
-                #         add_remark(
-                #             so_id,
-                #             f"No stock data for child component '{item}' at plant '{plant}'."
-                #         )
-                #         available = 0
-                #         self.logger.warning(f"No stock data for SO '{so_id}' | Item '{item}' at Plant '{plant}'")
-                #     else:
-                #         available = self.stock_manager.get_stock(plant, so_id, item)
-                #         self. logger.debug(f"Stock available for SO '{so_id}' | Item '{item}' at Plant '{plant}': {available}")
-                #     allocated = min(order_qty, available)
-                #     if self.config.get("round_allocation", False):
-                #         allocated = round(allocated, 2)
-                #     remaining = order_qty - allocated
-                #     stock_remaining = available - allocated
-                #     self.stock_manager.set_stock(plant, so_id, item, stock_remaining)
-                #     self.logger.info(f"Allocated {allocated} units for SO '{so_id}' | Item '{item}' | Remaining stock: {stock_remaining}")
-                # else:
-                #     available = allocated = remaining = stock_remaining = 0.0
-
-                if order_qty > 0:
-                    # --------------------------------------------
-                    # STRATEGY DECIDES QTY TO CONSUME
-                    # Partial component strategy = try full demand
-                    # --------------------------------------------
-                    qty_to_consume = order_qty
-
+        self.logger.info(f"Processing SO '{decode(so_id)}' | FG '{decode(fg)}' | Plant '{decode(plant)}' | Order Qty {fg_qty}")
+
+        dated = self._dated
+        if dated:
+            required_day = self._required_days[so_idx]
+            # Latest day any covered demand is ready (None: a leaf never is)
+            feasible_day = self._prior_days[so_idx]
+            buffer.feasible[so_idx] = feasible_day if fg_qty <= 0 else None
+
+        resolved_root, bom_tree, resolution_type = self.bom_tree.resolve_fg(fg, plant)
+
+        self.logger.debug(f"BOM resolution - FG: '{decode(fg)}', Resolved Root: '{decode(resolved_root)}', Type: '{resolution_type}'")
+
+        if resolution_type == "NOT_FOUND":
+            add_remark(RemarkCode.BOM_NOT_FOUND, item=fg, plant=plant)
+            self.logger.warning(f"SO '{decode(so_id)}' skipped: BOM not found for FG '{decode(fg)}' at plant '{decode(plant)}'")
+            return
+
+        if not bom_tree:
+            add_remark(RemarkCode.BOM_TREE_EMPTY, ref=resolved_root, plant=plant)
+            self.logger.warning(f"SO '{decode(so_id)}' skipped: BOM tree empty for root '{decode(resolved_root)}'")
+            return
+
+        if resolution_type == "SFG":
+            add_remark(RemarkCode.TREATED_AS_SFG, item=fg, ref=resolved_root)
+            self.logger.info(f"SO '{decode(so_id)}': FG '{decode(fg)}' treated as SFG under '{decode(resolved_root)}'")
+
+        if fg_qty <= 0:
+            add_remark(RemarkCode.ZERO_ORDER_QTY)
+            self.logger.warning(f"SO '{decode(so_id)}' has zero order quantity")
+
+        # Walk the precompiled BFS explosion: demand of a node is its
+        # parent's remaining demand times the BOM ratio
+        explosion = self.bom_tree.explosion(resolved_root, plant, fg)
+        items = explosion.items
+        parent_pos = explosion.parent_pos
+        levels = explosion.levels
+        ratios = explosion.ratios
+        child_start = explosion.child_start
+        child_count = explosion.child_count
+        remaining_at = [0.0] * len(items)
+        # Nodes below a pruned node are never visited
+        skipped = [False] * len(items)
+
+        for pos, item in enumerate(items):
+            up = parent_pos[pos]
+            if up < 0:
+                parent = None
+                order_qty = quantize(item, float(fg_qty or 0.0))
+            else:
+                if skipped[up]:
+                    skipped[pos] = True
+                    continue
+                parent = items[up]
+                order_qty = quantize(item, float(remaining_at[up] * ratios[pos] or 0.0))
+            level = levels[pos]
+            stats["nodes_visited"] += 1
+
+            self.logger.debug(f"BFS processing - Item: '{decode(item)}', Parent: '{decode(parent)}', Level: {level}, Order Qty: {order_qty}")
+
+            # if order_qty > 0:
+            #     if not self.stock_manager.has_stock(plant, so_id, item):
+            #         add_remark(
+            #             so_id,
+            #             f"No stock data for child component '{item}' at plant '{plant}'."
+            #         )
+            #         available = 0
+            #         self.logger.warning(f"No stock data for SO '{so_id}' | Item '{item}' at Plant '{plant}'")
+            #     else:
+            #         available = self.stock_manager.get_stock(plant, so_id, item)
+            #         self. logger.debug(f"Stock available for SO '{so_id}' | Item '{item}' at Plant '{plant}': {available}")
+            #     allocated = min(order_qty, available)
+            #     if self.config.get("round_allocation", False):
+            #         allocated = round(allocated, 2)
+            #     remaining = order_qty - allocated
+            #     stock_remaining = available - allocated
+            #     self.stock_manager.set_stock(plant, so_id, item, stock_remaining)
+            #     self.logger.info(f"Allocated {allocated} units for SO '{so_id}' | Item '{item}' | Remaining stock: {stock_remaining}")
+            # else:
+            #     available = allocated = remaining = stock_remaining = 0.0
+
+            if order_qty > 0:
+                # --------------------------------------------
+                # STRATEGY DECIDES QTY TO CONSUME
+                # Partial component strategy = try full demand
+                # --------------------------------------------
+                qty_to_consume = order_qty
+
+                if dated:
+                    allocation, unfulfilled, ready_day, leaf_day = self.stock_manager.consume_by_date(
+                        plant, so_id, item, qty_to_consume, required_day
+                    )
+                    # A parent's shortfall is exploded to its children, so
+                    # only what it got counts; a leaf's has to wait for
+                    # later receipts
+                    if child_count[pos]:
+                        leaf_day = IMMEDIATE if ready_day is None else ready_day
+                    if feasible_day is not None:
+                        feasible_day = None if leaf_day is None else max(feasible_day, leaf_day)
+                else:
                     allocation, unfulfilled = self.stock_manager.consume_with_priority(
                         plant=plant,
                         so_id=so_id,
@@ -129,85 +242,164 @@ class PartialComponentAllocator(BaseComponentAllocator):
                         consume_qty=qty_to_consume
                     )
 
-                    allocated = qty_to_consume - unfulfilled
-                    remaining = order_qty - allocated
-
-                    if allocated > 0:
-                        self.logger.info(
-                            "Allocated %s units for SO '%s' | Item '%s' | Remaining demand: %s",
-                            allocated, so_id, item, remaining
-                        )
-                    else:
-                        add_remark(
-                            so_id,
-                            f"No stock available for component '{item}' at plant '{plant}'."
-                        )
-                        self.logger.warning(
-                            "No allocation for SO '%s' | Item '%s'",
-                            so_id, item
-                        )
+                allocated = qty_to_consume - unfulfilled
+                remaining = quantize(item, order_qty - allocated)
 
+                if allocated > 0:
+                    self.logger.info(
+                        "Allocated %s units for SO '%s' | Item '%s' | Remaining demand: %s",
+                        allocated, decode(so_id), decode(item), remaining
+                    )
                 else:
-                    allocation = {"stock_on_hand": 0, "stock_in_qc": 0, "stock_in_transit": 0}
-                    allocated = remaining = 0.0
-
-                # Capture output row
-                append_row(
-                    SO_ID=so_id,
-                    Plant=plant,
-                    Parent=parent,
-                    BOM_Level=level,
-                    Item=item,
-                    Order_Qty=order_qty,
-                    # Stock_Before=available,
-                    Allocated_Qty=allocated,
-                    Alloc_StockOnHand=allocation.get("stock_on_hand", 0),
-                    Alloc_StockInQC=allocation.get("stock_in_qc", 0),
-                    Alloc_StockInTransit=allocation.get("stock_in_transit", 0),
-                    Order_Remaining=remaining,
-                    # Remaining_Stock=stock_remaining
-                )
-
-                # Always explode children
-                for child in bom_tree.get(item, []):
-                    queue.append({
-                        "item": child["child"],
-                        "parent": item,
-                        "level": level + 1,
-                        "order_qty": remaining * child["ratio"]
-                    })
-                    self.logger.debug(f"Queued child component '{child['child']}' | Parent '{item}' | Qty {remaining * child['ratio']}")
-
-            # Successful processing remark
-            add_remark(so_id, "Order processed via component allocation. BOM exploded and stock allocation attempted.")
-            self.logger.info(f"Completed allocation for SO '{so_id}'")
-
-        # Create output DataFrame
-        output_df = pl.DataFrame({
-            "SO_ID": pl.Series(output_columns["SO_ID"], dtype=pl.Utf8),
-            "Plant": pl.Series(output_columns["Plant"], dtype=pl.Utf8),
-            "Parent": pl.Series(output_columns["Parent"], dtype=pl.Utf8),
-            "BOM_Level": pl.Series(output_columns["BOM_Level"], dtype=pl.Int64),
-            "Item": pl.Series(output_columns["Item"], dtype=pl.Utf8),
-            "Order_Qty": pl.Series(output_columns["Order_Qty"], dtype=pl.Float64),
-            # "Stock_Before": pl.Series(output_columns["Stock_Before"], dtype=pl.Float64),
-            "Allocated_Qty": pl.Series(output_columns["Allocated_Qty"], dtype=pl.Float64),
-            "Alloc_StockOnHand": pl.Series(output_columns["Alloc_StockOnHand"], dtype=pl.Float64),
-            "Alloc_StockInQC": pl.Series(output_columns["Alloc_StockInQC"], dtype=pl.Float64),
-            "Alloc_StockInTransit": pl.Series(output_columns["Alloc_StockInTransit"], dtype=pl.Float64),
-            "Order_Remaining": pl.Series(output_columns["Order_Remaining"], dtype=pl.Float64),
-            # "Remaining_Stock": pl.Series(output_columns["Remaining_Stock"], dtype=pl.Float64),
-        })
+                    add_remark(RemarkCode.COMPONENT_NO_STOCK, item=item, plant=plant, qty=order_qty)
+                    self.logger.warning(
+                        "No allocation for SO '%s' | Item '%s'",
+                        decode(so_id), decode(item)
+                    )
 
-        self.logger.info("Component allocation completed for all sales orders. Merging remarks into SO dataframe.")
+            else:
+                allocation = {"stock_on_hand": 0, "stock_in_qc": 0, "stock_in_transit": 0}
+                allocated = remaining = 0.0
+
+            # Capture output row
+            append_row(
+                SO_ID=so_id,
+                Plant=plant,
+                Parent=parent,
+                BOM_Level=level,
+                Item=item,
+                Order_Qty=order_qty,
+                # Stock_Before=available,
+                Allocated_Qty=allocated,
+                Alloc_StockOnHand=allocation.get("stock_on_hand", 0),
+                Alloc_StockInQC=allocation.get("stock_in_qc", 0),
+                Alloc_StockInTransit=allocation.get("stock_in_transit", 0),
+                Order_Remaining=remaining,
+                # Remaining_Stock=stock_remaining
+            )
+
+            remaining_at[pos] = remaining
+            first_child = child_start[pos]
+            children = range(first_child, first_child + child_count[pos])
+
+            # Demand fully covered here: every node below would get 0
+            if self._prune_zero_demand and remaining <= 0 and children:
+                skipped[pos] = True
+                for child_pos in children:
+                    pruned = explosion.subtree_sizes[child_pos]
+                    stats["subtrees_pruned"] += 1
+                    stats["nodes_pruned"] += pruned
+                    if self._emit_pruned_summary:
+                        append_row(
+                            SO_ID=so_id,
+                            Plant=plant,
+                            Parent=item,
+                            BOM_Level=level + 1,
+                            Item=items[child_pos],
+                            Order_Qty=0.0,
+                            Allocated_Qty=0.0,
+                            Alloc_StockOnHand=0.0,
+                            Alloc_StockInQC=0.0,
+                            Alloc_StockInTransit=0.0,
+                            Order_Remaining=0.0,
+                            Covered_By_Parent=True,
+                            Pruned_Nodes=pruned
+                        )
+                self.logger.debug(f"Pruned {len(children)} zero-demand subtree(s) below '{decode(item)}'")
+                continue
 
-        # Merge remarks into so_df
-        if order_remarks:
-            remarks_df = pl.DataFrame({
-                "order_id": list(order_remarks.keys()),
-                "component_allocation_remarks": list(order_remarks.values())
+            if children:
+                self.logger.debug(f"Exploding {len(children)} child component(s) of '{decode(item)}' | Demand {remaining}")
+
+        if dated:
+            buffer.feasible[so_idx] = feasible_day
+
+        # Successful processing remark
+        add_remark(RemarkCode.ORDER_PROCESSED)
+        self.logger.info(f"Completed allocation for SO '{decode(so_id)}'")
+
+
+    # ---------------- OUTPUT ----------------
+    def _finalize(self, buffers: list) -> pl.DataFrame:
+        """
+        Merges buffers back into SO order, builds the output dataframe
+        (keys decoded back to strings only here) and joins remarks into so_df.
+        """
+        self.stats = {
+            k: sum(b.stats[k] for b in buffers) for k in buffers[0].stats
+        } if buffers else {"nodes_visited": 0, "subtrees_pruned": 0, "nodes_pruned": 0}
+
+        # Output lists are the largest structure of a serial run; sized before they are framed
+        self.memory_stats = {
+            "output_rows": sum(len(b.so_index) for b in buffers),
+            "output_buffer_bytes": sum(deep_sizeof(b.columns) + deep_sizeof(b.so_index) for b in buffers),
+            "remark_events": sum(len(b.remarks) for b in buffers),
+            "remark_buffer_bytes": sum(deep_sizeof(b.remarks.columns) for b in buffers),
+        }
+
+        frames = []
+        for buffer in buffers:
+            output_columns = buffer.columns
+            frame = pl.DataFrame({
+                "_so_idx": pl.Series(buffer.so_index, dtype=pl.Int64),
+                "SO_ID": pl.Series(output_columns["SO_ID"], dtype=pl.Int64),
+                "Plant": pl.Series(output_columns["Plant"], dtype=pl.Int64),
+                "Parent": pl.Series(output_columns["Parent"], dtype=pl.Int64),
+                "BOM_Level": pl.Series(output_columns["BOM_Level"], dtype=pl.Int64),
+                "Item": pl.Series(output_columns["Item"], dtype=pl.Int64),
+                "Order_Qty": pl.Series(output_columns["Order_Qty"], dtype=pl.Float64),
+                # "Stock_Before": pl.Series(output_columns["Stock_Before"], dtype=pl.Float64),
+                "Allocated_Qty": pl.Series(output_columns["Allocated_Qty"], dtype=pl.Float64),
+                "Alloc_StockOnHand": pl.Series(output_columns["Alloc_StockOnHand"], dtype=pl.Float64),
+                "Alloc_StockInQC": pl.Series(output_columns["Alloc_StockInQC"], dtype=pl.Float64),
+                "Alloc_StockInTransit": pl.Series(output_columns["Alloc_StockInTransit"], dtype=pl.Float64),
+                "Order_Remaining": pl.Series(output_columns["Order_Remaining"], dtype=pl.Float64),
+                # "Remaining_Stock": pl.Series(output_columns["Remaining_Stock"], dtype=pl.Float64),
             })
-            self.so_df = self.so_df.join(remarks_df, on="order_id", how="left")
-            self.logger.debug("Remarks merged into SO dataframe.")
+            if self._emit_pruned_summary:
+                frame = frame.with_columns(
+                    pl.Series("Covered_By_Parent", output_columns["Covered_By_Parent"], dtype=pl.Boolean),
+                    pl.Series("Pruned_Nodes", output_columns["Pruned_Nodes"], dtype=pl.Int64),
+                )
+            frames.append(frame)
+
+        output_df = pl.concat(frames)
+        if len(frames) > 1:
+            output_df = output_df.sort("_so_idx", maintain_order=True)
+        output_df = output_df.drop("_so_idx")
+        self.memory_stats["output_df_bytes"] = frame_size(output_df)
+
+        # Create output DataFrame (keys decoded back to strings only here)
+        output_df = output_df.with_columns(
+            self.keys.decode_series(output_df["SO_ID"], "SO_ID"),
+            self.keys.decode_series(output_df["Plant"], "Plant"),
+            self.keys.decode_series(output_df["Parent"], "Parent").fill_null(""),
+            self.keys.decode_series(output_df["Item"], "Item"),
+        )
+
+        self.logger.info(
+            "BOM node visits | Visited=%d | Pruned subtrees=%d | Pruned nodes=%d",
+            self.stats["nodes_visited"], self.stats["subtrees_pruned"], self.stats["nodes_pruned"]
+        )
+        self.logger.info("Component allocation completed for all sales orders. Merging remarks into SO dataframe.")
 
-        return output_df
\ No newline at end of file
+        # Merge remarks into so_df (rendered only here, if configured)
+        events = pl.concat([buffer.remarks.to_frame() for buffer in buffers]) if buffers else RemarkLog().to_frame()
+        self.so_df, self.remarks_df = attach_remarks(
+            self.so_df, events, self.keys, "component_allocation_remarks", remark_mode(self.config)
+        )
+        self.logger.debug("Remarks merged into SO dataframe.")
+
+        if self._dated:
+            feasible = {}
+            for buffer in buffers:
+                feasible.update(buffer.feasible)
+            self.so_df = self.so_df.with_columns(day_series(
+                "earliest_feasible_date",
+                [feasible.get(so_idx) for so_idx in range(self.so_df.height)],
+                self.stock_manager.as_of
+            ))
+            if "required_date" in self.so_df.columns:
+                self.so_df = self.so_df.with_columns(date_expr("required_date", self.so_df.schema["required_date"]))
+
+        return output_df
@@ -3,15 +3,20 @@ import polars as pl
 from common.stock_manager import StockManager
 
 class BaseOrderAllocator(ABC):
-    def __init__(self, so_df: pl.DataFrame, stock_manager: StockManager, config=None, logger=None) -> None:
+    def __init__(self, so_df: pl.DataFrame, stock_manager: StockManager, config=None, logger=None, progress=None) -> None:
         """
         :param so_df: Sales order dataframe
         :param stock_manager: StockManager object to get/set stock
+        :param progress: optional ProgressReporter, advanced once per SO
         """
         self.so_df = so_df
         self.stock_manager = stock_manager
+        self.keys = stock_manager.keys
         self.config = config or {}
         self.logger = logger
+        # Remark event table, set by allocators running with `remarks: codes`
+        self.remarks_df = None
+        self.progress = progress
 
     @abstractmethod
     def allocate(self, logger) -> pl.DataFrame:
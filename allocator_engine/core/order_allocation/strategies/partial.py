@@ -90,6 +90,8 @@
 
 
 import polars as pl
+from common.remarks import RemarkCode, RemarkLog, remark_mode, render_remark_text, remark_events_df
+from common.stock_timeline import UNBOUNDED, column_days, date_expr, day_series
 from core.order_allocation.base_order_allocator import BaseOrderAllocator
 
 
@@ -99,6 +101,17 @@ class PartialOrderAllocator(BaseOrderAllocator):
     Strategy:
     - Try to allocate as much as possible
     - Allocation priority: SOH -> QC -> Transit
+
+    Config option `remarks` (text | codes | off): one remark event per SO,
+    rendered as the order_allocation_remarks column (text), kept as an
+    event table in self.remarks_df (codes) or dropped (off).
+
+    With time-phased stock or a required_date column, each SO only takes
+    receipts available by its required date, one consume per SO in SO
+    order, and the output gets required_date, earliest_feasible_date
+    (whole order covered, null: never with the known receipts) and
+    allocated_ready_date (latest receipt of the allocated part,
+    null when nothing is allocated).
     """
 
     @classmethod
@@ -108,63 +121,89 @@ class PartialOrderAllocator(BaseOrderAllocator):
     def allocate(self):
         self.logger.info("Partial Order Allocation started")
 
-        so_rows = []
+        # Keys are interned once; the loop below only touches int ids
+        so_ids = self.keys.encode_series(self.so_df["order_id"]).to_list()
+        fg_ids = self.keys.encode_series(self.so_df["fg_id"]).to_list()
+        plant_ids = self.keys.encode_series(self.so_df["plant"]).to_list()
+        order_qtys = self.so_df["order_qty"].to_list()
 
-        for r in self.so_df.iter_rows(named=True):
-            so_id = str(r["order_id"]).strip()
-            fg = str(r["fg_id"]).strip()
-            plant = str(r["plant"]).strip()
-            order_qty = float(r["order_qty"] or 0)
+        remaining_orders = []
+        remarks = RemarkLog()
 
+        # --------------------------------------------
+        # STRATEGY DECIDES QTY TO CONSUME
+        # Partial strategy = try to fulfill full demand.
+        # SOs never depend on each other's result, so all of them
+        # consume in one batch, in SO order (= priority order)
+        # --------------------------------------------
+        qtys_to_consume = [self.stock_manager.quantize(fg, float(q or 0)) for fg, q in zip(fg_ids, order_qtys)]
+        dated = self.stock_manager.time_phased or "required_date" in self.so_df.columns
+        if dated:
+            required_days = column_days(self.so_df, "required_date", UNBOUNDED)
+            results = [
+                self.stock_manager.consume_by_date(plant, so_id, fg, qty, required)
+                for plant, so_id, fg, qty, required in zip(plant_ids, so_ids, fg_ids, qtys_to_consume, required_days)
+            ]
+            unfulfilled_qtys = [result[1] for result in results]
+        else:
+            _, unfulfilled_qtys = self.stock_manager.consume_many(plant_ids, so_ids, fg_ids, qtys_to_consume)
+
+        for so_idx, (so_id, fg, plant, order_qty) in enumerate(zip(so_ids, fg_ids, plant_ids, qtys_to_consume)):
             self.logger.debug(
                 "Processing SO | SO=%s | FG=%s | Plant=%s | OrderQty=%s",
-                so_id, fg, plant, order_qty
+                self.keys.decode(so_id), self.keys.decode(fg), self.keys.decode(plant), order_qty
             )
 
-            # --------------------------------------------
-            # STRATEGY DECIDES QTY TO CONSUME
-            # Partial strategy = try to fulfill full demand
-            # --------------------------------------------
             qty_to_consume = order_qty
-
-            allocation, unfulfilled = self.stock_manager.consume_with_priority(
-                plant=plant,
-                so_id=so_id,
-                item=fg,
-                consume_qty=qty_to_consume
-            )
+            unfulfilled = float(unfulfilled_qtys[so_idx])
 
             allocated_qty = qty_to_consume - unfulfilled
-            remaining_order = order_qty - allocated_qty
+            remaining_order = self.stock_manager.quantize(fg, order_qty - allocated_qty)
 
             if allocated_qty > 0:
-                remark = (
-                    f"Allocated {allocated_qty} out of {order_qty} "
-                    f"(SOH/QC/Transit priority applied)"
-                )
+                remarks.add(so_idx, so_id, RemarkCode.FG_ALLOCATED, item=fg, qty=allocated_qty, total=order_qty)
                 self.logger.info(
                     "SO=%s | FG=%s | Allocated=%s | RemainingOrder=%s",
-                    so_id, fg, allocated_qty, remaining_order
+                    self.keys.decode(so_id), self.keys.decode(fg), allocated_qty, remaining_order
                 )
             else:
-                remark = (
-                    f"No stock available for FG '{fg}'. "
-                    f"Allocated 0 out of {order_qty}."
-                )
+                remarks.add(so_idx, so_id, RemarkCode.FG_NO_STOCK, item=fg, qty=0.0, total=order_qty)
                 self.logger.warning(
                     "SO=%s | FG=%s | No allocation possible",
-                    so_id, fg
+                    self.keys.decode(so_id), self.keys.decode(fg)
                 )
 
-            so_rows.append({
-                "order_id": so_id,
-                "plant": plant,
-                "fg_id": fg,
-                "order_qty": remaining_order,
-                "order_allocation_remarks": remark
-            })
+            remaining_orders.append(remaining_order)
+            if self.progress is not None:
+                self.progress.advance()
+
+        # Keys are decoded back to strings only for the output
+        updated_so_df = pl.DataFrame([
+            self.keys.decode_series(so_ids, "order_id"),
+            self.keys.decode_series(plant_ids, "plant"),
+            self.keys.decode_series(fg_ids, "fg_id"),
+            pl.Series("order_qty", remaining_orders, dtype=pl.Float64),
+        ])
+        if dated:
+            as_of = self.stock_manager.as_of
+            if "required_date" in self.so_df.columns:
+                updated_so_df = updated_so_df.with_columns(
+                    self.so_df.select(date_expr("required_date", self.so_df.schema["required_date"])).to_series()
+                )
+            updated_so_df = updated_so_df.with_columns(
+                day_series("earliest_feasible_date", [result[3] for result in results], as_of),
+                day_series("allocated_ready_date", [result[2] for result in results], as_of),
+            )
 
-        updated_so_df = pl.DataFrame(so_rows)
+        # Exactly one event per SO row, in so_df order
+        mode = remark_mode(self.config)
+        events = remarks.to_frame()
+        if mode == "text":
+            updated_so_df = updated_so_df.with_columns(
+                render_remark_text(events, self.keys).alias("order_allocation_remarks")
+            )
+        elif mode == "codes":
+            self.remarks_df = remark_events_df(events, self.keys)
 
         self.logger.info(
             "Partial Order Allocation completed. Preparing remaining stock dataframe."
@@ -173,28 +212,7 @@ class PartialOrderAllocator(BaseOrderAllocator):
         # --------------------------------------------
         # BUILD REMAINING STOCK DF (MULTI-BUCKET)
         # --------------------------------------------
-        stock_rows = []
-
-        for key, buckets in self.stock_manager.remaining_stock.items():
-            plant, scope, item = key.split("__")
-
-            row = {
-                "order_id": None if scope == "ITEM" else scope,
-                "item_id": item,
-                "plant": plant
-            }
-
-            for col, qty in buckets.items():
-                row[col] = qty
-
-            stock_rows.append(row)
-
-            self.logger.debug(
-                "Remaining stock | Plant=%s | Scope=%s | Item=%s | Buckets=%s",
-                plant, scope, item, buckets
-            )
-
-        remaining_stock_df = pl.DataFrame(stock_rows)
+        remaining_stock_df = self.stock_manager.remaining_stock_df()
 
         self.logger.info("Remaining stock dataframe created successfully.")
 
@@ -1,10 +1,46 @@
 import polars as pl
+from functools import lru_cache
 from pathlib import Path
 
-def read_csv(file_path: Path, logger=None):
+def read_csv(file_path: Path, logger=None, schema_overrides: dict | None = None, predicate: pl.Expr | None = None):
+    """Reads a CSV file; with a predicate, rows are filtered while the file is scanned."""
     try:
-        return pl.read_csv(file_path)
+        if predicate is not None:
+            return pl.scan_csv(file_path, schema_overrides=schema_overrides).filter(predicate).collect()
+        return pl.read_csv(file_path, schema_overrides=schema_overrides)
     except Exception:
         if logger:
             logger.error(f"Failed to read CSV: {file_path}", exc_info=True)
         raise
+
+
+@lru_cache(maxsize=64)
+def _cached_header(path: str, mtime_ns: int, size: int) -> tuple:
+    return tuple(pl.read_csv(path, n_rows=0).columns)
+
+
+def read_csv_header(file_path: Path, logger=None) -> list:
+    """
+    Reads only the header row of a CSV file. Cached per (path, mtime, size),
+    so preflight and the actual read parse each header once.
+    """
+    try:
+        stat = Path(file_path).stat()
+        return list(_cached_header(str(file_path), stat.st_mtime_ns, stat.st_size))
+    except Exception:
+        if logger:
+            logger.error(f"Failed to read CSV header: {file_path}", exc_info=True)
+        raise
+
+
+def read_csv_sample(file_path: Path, n_rows: int, schema_overrides: dict | None = None):
+    """
+    Parses the header and the first n_rows records of a CSV file (quoted
+    fields may span lines). Returns (sample frame, bytes of the sampled
+    records as re-serialized CSV, whether the sample covers the whole file).
+    """
+    # One record past the sample tells whether the file has more
+    df = pl.read_csv(file_path, n_rows=n_rows + 1, schema_overrides=schema_overrides)
+    complete = df.height <= n_rows
+    df = df.head(n_rows)
+    return df, len(df.write_csv(include_header=False).encode("utf-8")), complete
@@ -3,3 +3,7 @@ from pathlib import Path
 
 def write_csv(df: pl.DataFrame, path: Path):
     df.write_csv(path)
+
+
+def write_parquet(df: pl.DataFrame, path: Path):
+    df.write_parquet(path)
@@ -1,3 +1,4 @@
+import argparse
 from pathlib import Path
 import yaml
 
@@ -10,40 +11,45 @@ from utils.logger import EngineLogger
 BASE_DIR = Path(__file__).resolve().parent
 CONFIG_PATH = BASE_DIR / "config" / "config.yaml"
 
-if not CONFIG_PATH.exists():
-    raise FileNotFoundError(f"Config file not found: {CONFIG_PATH}")
 
-# --------------------------------------------------
-# Load config
-# --------------------------------------------------
-with open(CONFIG_PATH, "r") as f:
-    config = yaml.safe_load(f)
+def main(config_path=CONFIG_PATH):
+    config_path = Path(config_path)
+    if not config_path.exists():
+        raise FileNotFoundError(f"Config file not found: {config_path}")
 
-# --------------------------------------------------
-# Setup logger (ONCE)
-# --------------------------------------------------
-log_level = config.get("logging", {}).get("level", "INFO")
+    # --------------------------------------------------
+    # Load config
+    # --------------------------------------------------
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
 
-logger = EngineLogger(
-    base_path=config["base_path"],
-    client=config.get("client", "UNKNOWN"),
-    level=log_level
-)
+    # --------------------------------------------------
+    # Setup logger (ONCE)
+    # --------------------------------------------------
+    logger = EngineLogger.from_config(config)
 
-# --------------------------------------------------
-# Run pipeline
-# --------------------------------------------------
-try:
-    logger.info("Starting Allocation Pipeline...")
+    # --------------------------------------------------
+    # Run pipeline
+    # --------------------------------------------------
+    try:
+        logger.info("Starting Allocation Pipeline...")
+
+        pipeline = AllocationPipeline(config, logger)
+        pipeline.run()
+
+        logger.info("Pipeline completed successfully!!!")
 
-    pipeline = AllocationPipeline(config, logger)
-    pipeline.run()
+    except Exception:
+        logger.critical("Fatal pipeline error occurred", exc_info=True)
+        raise
 
-    logger.info("Pipeline completed successfully!!!")
+    finally:
+        logger.write_run_footer()
 
-except Exception:
-    logger.critical("Fatal pipeline error occurred", exc_info=True)
-    raise
 
-finally:
-    logger.write_run_footer()
+# Worker processes (spawn start method) re-import this module; only the
+# parent runs the pipeline.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the allocation pipeline for one config.")
+    parser.add_argument("config", nargs="?", default=str(CONFIG_PATH), help="Config file (default: config/config.yaml)")
+    main(parser.parse_args().config)
@@ -1,17 +1,50 @@
-from io_modules.reader import read_csv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io_modules.reader import read_csv, read_csv_header
 from io_modules.writer import write_csv
 from pathlib import Path
 import polars as pl
 from pipeline.phase_registry import COMPONENT_ALLOCATORS
 from pipeline.phase_registry import ORDER_ALLOCATORS
-from common.stock_manager import StockManager
+from pipeline.preflight import InputPreflight
+from pipeline.scope import RunScope
+from pipeline.stage_scheduler import Stage, StageScheduler
 from common.bom_tree import BOMTree
+from common.consumption_ledger import ConsumptionLedger
+from common.key_dictionary import KeyDictionary
+from common.quantities import QuantityScale
+from common.shortage_index import ShortageIndex
+from common.stock_preparer import StockPreparer
+from utils.logger import category_logger
+from utils.memory import MemoryBudgetError, check_memory_budget, format_bytes, process_memory
+from utils.progress import ProgressReporter
 from utils.schema_resolver import SchemaResolver
 
 class AllocationPipeline:
-    def __init__(self, config, logger):
+    # Schema keys kept when configured and present in the file (not required)
+    OPTIONAL_COLUMNS = {"stock": ["uom", "available_date"], "so": ["required_date"]}
+
+    def __init__(self, config, logger, bom_cache=None):
+        """
+        bom_cache: optional BomCache shared by the pipelines of one process
+        (batch runs); a client with an already compiled BOM reuses it.
+        """
         self.config = config
         self.logger = logger
+        self._io_executor = None
+        # Shared across phases so ids stay stable from load to output
+        self.keys = KeyDictionary()
+        self.stock_preparer = StockPreparer(category_logger(self.logger, "stock"))
+        # Fixed-point precision per item; built with the first phase's stock
+        self.quantity_scale = None
+        # Stage timings and critical path of the last run (StageScheduler.report)
+        self.stage_report = None
+        # Per-input row / memory estimates of the last preflight
+        self.preflight_report = None
+        # Plant / FG slice of a scoped run (None = everything)
+        self.scope = RunScope.from_config(config.get("scope"))
+        self.bom_cache = bom_cache
+        self._bom_cache_key = None
+        self._cached_bom_tree = None
 
 
     def run(self):
@@ -26,133 +59,198 @@ class AllocationPipeline:
             return
 
 
-        data = {}
+        # Categorical keys from SO, stock and BOM must share one dictionary
+        # so joins / group_bys across inputs work on the integer codes
+        if SchemaResolver.uses_categorical(self.config["schemas"]):
+            pl.enable_string_cache()
+
+        io_cfg = self.config.get("io", {})
+        scheduler_cfg = self.config.get("scheduler") or {}
+        if self.scope is not None:
+            self.logger.info("Scoped run | %s", self.scope.describe())
+        if self.bom_cache is not None:
+            self._adopt_cached_bom()
+
+        # Polars releases the GIL while parsing, so input files are read
+        # concurrently in a shared thread pool
+        with ThreadPoolExecutor(
+            max_workers=max(1, int(io_cfg.get("read_workers", 3))),
+            thread_name_prefix="input_reader"
+        ) as executor:
+            self._io_executor = executor
+            scheduler = StageScheduler(
+                self._declare_stages(phases, io_cfg), self.logger,
+                workers=scheduler_cfg.get("workers", 4)
+            )
+            scheduler.run()
+
+        self.stage_report = scheduler.log_report() if scheduler_cfg.get("report", True) else scheduler.report()
+
+
+    def _declare_stages(self, phases, io_cfg) -> list:
+        """
+        The run as a stage DAG. BOM read / clean / BOMTree build depend only
+        on the component inputs, and each phase's output writes only on its
+        own allocation, so they overlap with order allocation and with the
+        next phase. Without io.prefetch_component_inputs the component
+        inputs are read after order allocation, as a strictly phased run.
+        """
+        order_on = phases["order_allocation"]["enabled"]
+        comp_on = phases["component_allocation"]["enabled"]
+        stages = []
+
+        # -------- PREFLIGHT --------
+        # Headers + a small sample of every input, before any phase runs
+        preflight_cfg = self.config.get("preflight") or {}
+        root_deps = []
+        if preflight_cfg.get("enabled", True):
+            phase_allocators = {}
+            if order_on:
+                phase_allocators["order_allocation"] = ORDER_ALLOCATORS[phases["order_allocation"]["type"]]
+            if comp_on:
+                phase_allocators["component_allocation"] = COMPONENT_ALLOCATORS[phases["component_allocation"]["type"]]
+
+            def preflight(_):
+                checker = InputPreflight(self.config, self.logger, preflight_cfg.get("sample_rows", 1000))
+                self.preflight_report = checker.run(phase_allocators, produced={"order_allocation": ("so", "stock")})
+                return self.preflight_report
+
+            stages.append(Stage("preflight", preflight))
+            root_deps = ["preflight"]
+
         # -------- ORDER ALLOCATION --------
-        if phases["order_allocation"]["enabled"]:
-            alloc_type = phases["order_allocation"]["type"]
-            allocator_cls = ORDER_ALLOCATORS[alloc_type]
-            self.logger.info("Order Allocation Phase started for %s Allocation", alloc_type.capitalize())
-            
-            self._read_phase_inputs("order_allocation", allocator_cls, data)
-            data = self._run_order_allocation(data)
+        if order_on:
+            order_cls = ORDER_ALLOCATORS[phases["order_allocation"]["type"]]
+
+            def read_order_inputs(_):
+                self.logger.info(
+                    "Order Allocation Phase started for %s Allocation", phases["order_allocation"]["type"].capitalize()
+                )
+                return self._read_phase_inputs("order_allocation", order_cls, {})
+
+            stages += [
+                Stage("order.read_inputs", read_order_inputs, deps=root_deps),
+                Stage("order.allocate", lambda r: self._run_order_allocation(dict(r["order.read_inputs"])),
+                      deps=["order.read_inputs"]),
+                Stage("order.write_outputs", lambda r: self._write_order_outputs(r["order.allocate"]),
+                      deps=["order.allocate"]),
+            ]
+        else:
+            self.logger.info("Order allocation output skipped (phase disabled).")
 
         # -------- COMPONENT ALLOCATION --------
-        if phases["component_allocation"]["enabled"]:
-            alloc_type = phases["component_allocation"]["type"]
-            allocator_cls = COMPONENT_ALLOCATORS[alloc_type]
-            self.logger.info("Component Allocation Phase started for %s Allocation", alloc_type.capitalize())
-
-            self._read_phase_inputs("component_allocation", allocator_cls, data)
-            data = self._run_component_allocation(data)
+        if comp_on:
+            comp_cls = COMPONENT_ALLOCATORS[phases["component_allocation"]["type"]]
+            # SO and stock come from order allocation when it runs
+            produced = {"so", "stock"} if order_on else set()
+            prefetch = not order_on or io_cfg.get("prefetch_component_inputs", False)
+
+            def read_component_inputs(_):
+                self.logger.info(
+                    "Component Allocation Phase started for %s Allocation", phases["component_allocation"]["type"].capitalize()
+                )
+                if order_on and prefetch:
+                    self.logger.info("Reading component allocation inputs alongside order allocation.")
+                skip = produced | ({"bom"} if self._cached_bom_tree is not None else set())
+                return self._read_phase_inputs("component_allocation", comp_cls, {}, skip=skip)
+
+            def allocate_components(r):
+                data = {**r.get("order.allocate", {}), **r["component.read_inputs"]}
+                return self._run_component_allocation(data, r["component.build_bom_tree"])
+
+            order_deps = ["order.allocate"] if order_on else []
+            stages += [
+                Stage("component.read_inputs", read_component_inputs, deps=root_deps if prefetch else order_deps),
+                Stage("component.build_bom_tree", lambda r: self._build_component_bom_tree(r["component.read_inputs"].get("bom_df")),
+                      deps=["component.read_inputs"]),
+                Stage("component.allocate", allocate_components,
+                      deps=["component.read_inputs", "component.build_bom_tree", *order_deps]),
+                Stage("component.write_outputs", lambda r: self._write_component_outputs(r["component.allocate"]),
+                      deps=["component.allocate"]),
+            ]
+        else:
+            self.logger.info("Component allocation output skipped (phase disabled).")
 
-        self._write_outputs(data)
+        return stages
 
 
-    def _read_phase_inputs(self, phase_name: str, allocator_cls, data: dict) -> None:
-        self.logger.info("Reading Input Files...")
+    def _submit_phase_reads(self, phase_name: str, allocator_cls, data: dict, skip=()) -> dict:
+        """
+        Schedules CSV reads for every input the phase still needs.
+        Returns {future: (src, required_cols)}.
+        """
         phase_cfg = self.config["phases"][phase_name]
         base_path = Path(self.config["base_path"])
-        schemas = self.config["schemas"]
 
         input_root = base_path / phase_cfg["input_source"]
         csv_cfg = phase_cfg["csv_inputs"]
 
         required_schemas = allocator_cls.resolved_required_schemas()
 
+        pending = {}
         for src, cols in required_schemas.items():
             key = f"{src}_df"
 
             # DO NOT overwrite outputs from previous phases
-            if key in data:
+            if key in data or src in skip:
                 continue
 
             # This phase does not provide this input
             if src not in csv_cfg:
                 continue
 
-            raw_df = read_csv(input_root / csv_cfg[src])
+            file_path = input_root / csv_cfg[src]
+            self.logger.debug("Scheduling read of %s input: %s", src.upper(), file_path)
+            future = self._io_executor.submit(self._read_input, src, file_path, cols)
+            pending[future] = (src, cols)
+        return pending
+
+
+    def _read_input(self, src: str, file_path: Path, cols: list) -> pl.DataFrame:
+        """
+        Reads one input CSV, parsing configured columns directly into
+        their schema dtypes instead of relying on inference. In a scoped run
+        only the scope's rows are kept, filtered during the scan.
+        """
+        schema_cfg = self.config["schemas"][src]
+        header = read_csv_header(file_path, self.logger)
+        overrides = SchemaResolver.read_overrides(header, schema_cfg, cols)
+        predicate = self.scope.read_predicate(src, header, schema_cfg) if self.scope is not None else None
+        return read_csv(file_path, self.logger, schema_overrides=overrides or None, predicate=predicate)
+
+
+    def _read_phase_inputs(self, phase_name: str, allocator_cls, data: dict, skip=()) -> None:
+        self.logger.info("Reading Input Files...")
+        schemas = self.config["schemas"]
 
-            data[key] = SchemaResolver.resolve(
+        pending = self._submit_phase_reads(phase_name, allocator_cls, data, skip=set(skip))
+
+        # Schema-resolve each input as soon as its read completes
+        for future in as_completed(pending):
+            src, cols = pending[future]
+            raw_df = future.result()
+            optional = SchemaResolver.present_keys(raw_df.columns, schemas[src], self.OPTIONAL_COLUMNS.get(src, []))
+
+            data[f"{src}_df"] = SchemaResolver.resolve(
                 df=raw_df,
                 schema_cfg=schemas[src],
-                required_keys=cols,
+                required_keys=[*cols, *(k for k in optional if k not in cols)],
                 df_name=f"{src.upper()} FILE",
                 logger=self.logger
-            )    
-        self.logger.info("All Input Files Read Successfully")    
+            )
+        self.logger.info("All Input Files Read Successfully")
         return data
     
 
-    def _validate_stock_columns(self, stock_df):
-        STOCK_COLS = ["stock_on_hand", "stock_in_qc", "stock_in_transit"]
-        available_cols = [c for c in STOCK_COLS if c in stock_df.columns]
-        if not available_cols:
-            self.logger.error(
-                "Stock file does not contain any valid stock columns. "
-                "Expected at least one of %s",
-                STOCK_COLS
-            )
-            raise ValueError("No valid stock columns available for allocation")
-        missing = [c for c in STOCK_COLS if c not in stock_df.columns]
-        if missing:
-            self.logger.warning(
-                "Stock columns missing and will be ignored: %s", missing
-            )
-        self.logger.info(
-            "Stock columns detected for allocation (priority order preserved): %s",
-            available_cols
-        )
-        return available_cols
-
-
     # -------- internal pipeline steps --------
 
     def _run_order_allocation(self, data):
         so_df = data["so_df"]
         stock_df = data["stock_df"]
 
-        # Validate stock columns
-        available_stock_cols = self._validate_stock_columns(stock_df)
-
-        # Clean stock
-        stock_df = stock_df.with_columns([
-            pl.col("order_id").cast(pl.Utf8).str.strip_chars(),
-            pl.col("item_id").cast(pl.Utf8).str.strip_chars(),
-            pl.col("plant").cast(pl.Utf8).str.strip_chars(),
-            *[
-                pl.when(pl.col(c).is_null())
-                .then(0)
-                .otherwise(pl.col(c))
-                .cast(pl.Float64)
-                .alias(c)
-                for c in available_stock_cols
-            ]
-        ])
-        self.logger.info("Stock Data Cleaned")
-
-        # SO-level FG stock
-        so_stock_df = (
-            stock_df
-            .filter(pl.col("order_id").is_not_null() & (pl.col("order_id") != ""))
-            .group_by(["order_id", "plant", "item_id"])
-            .agg([
-                pl.sum(c).alias(c) for c in available_stock_cols
-            ])
-        )
-
-        # ITEM-level FG stock
-        item_stock_df = (
-            stock_df
-            .filter(pl.col("order_id").is_null() | (pl.col("order_id") == ""))
-            .group_by(["plant", "item_id"])
-            .agg([
-                pl.sum(c).alias(c) for c in available_stock_cols
-            ])
-        )
-        self.logger.info("Stock Aggregation Completed.")
-        stock_manager = StockManager(self.logger)
-        stock_manager.load_stock(so_stock_df, item_stock_df)
+        stock_manager, initial_stock_df = self._build_phase_stock(stock_df, "order_allocation")
         self.logger.info("Loaded Stock Data in Stock Manager.")
+        self._report_memory("order_allocation.load", stock_manager=stock_manager)
 
         alloc_type = self.config["phases"]["order_allocation"]["type"]
         allocator_cls = ORDER_ALLOCATORS.get(alloc_type)
@@ -160,83 +258,50 @@ class AllocationPipeline:
             self.logger.error("Unsupported Order Allocation type: %s", alloc_type)
             raise ValueError(f"Unsupported Order Allocation type: {alloc_type}")
 
-        allocator = allocator_cls(so_df, stock_manager, logger=self.logger)
+        progress = self._progress("order_allocation", so_df.height, stock_manager)
+        allocator = allocator_cls(
+            so_df,
+            stock_manager,
+            config=self.config["phases"]["order_allocation"],
+            logger=category_logger(self.logger, "allocator"),
+            progress=progress
+        )
         self.logger.info("Running %s Order Allocation...", alloc_type.capitalize())
         updated_so_df, remaining_stock_df = allocator.allocate()
+        if progress is not None:
+            progress.finish()
         self.logger.info("%s Order Allocation Completed.", alloc_type.capitalize())
+        self._close_ledger(stock_manager, initial_stock_df, "order_allocation")
+        self._report_memory("order_allocation", stock_manager=stock_manager)
 
         data["so_df"] = updated_so_df
         data["stock_df"] = remaining_stock_df
+        if allocator.remarks_df is not None:
+            data["order_allocation_remarks_df"] = allocator.remarks_df
+        # Remaining stock comes out of StockManager already clean and aggregated
+        self.stock_preparer.mark_aggregated(remaining_stock_df)
 
         self.logger.info("Updated SO and Stock Data Stored in Pipeline Data.")
         self.logger.info("Order Allocation Phase Completed.")
 
         return data
 
-    def _run_component_allocation(self, data):
+    def _run_component_allocation(self, data, bom_tree_obj):
         """
         Component allocation phase
         Replicates the logic that previously lived in main.py
+        bom_tree_obj comes from _build_component_bom_tree (its own stage).
         """
         # Extract dataframes from pipeline data
-        bom_df = data["bom_df"]
         so_df = data["so_df"]
         stock_df = data["stock_df"]
 
-        # Validate stock columns
-        available_stock_cols = self._validate_stock_columns(stock_df)
-
-        # Clean data
-        bom_df = bom_df.with_columns([
-            pl.col("root_parent").cast(pl.Utf8).str.strip_chars(),
-            pl.col("plant").cast(pl.Utf8).str.strip_chars(),
-            pl.col("parent").cast(pl.Utf8).str.strip_chars(),
-            pl.col("child").cast(pl.Utf8).str.strip_chars(),
-            pl.col("comp_qty").fill_null(0).cast(pl.Float64)
-        ])
-        stock_df = stock_df.with_columns([
-            pl.col("order_id").cast(pl.Utf8).str.strip_chars(),
-            pl.col("item_id").cast(pl.Utf8).str.strip_chars(),
-            pl.col("plant").cast(pl.Utf8).str.strip_chars(),
-            *[
-                pl.when(pl.col(c).is_null())
-                .then(0)
-                .otherwise(pl.col(c))
-                .cast(pl.Float64)
-                .alias(c)
-                for c in available_stock_cols
-            ]
-        ])
-
-        self.logger.info("BOM & STOCK Data Cleaned.")
-
-        # Aggregate stock
-        so_stock_df = (
-            stock_df
-            .filter(pl.col("order_id").is_not_null() & (pl.col("order_id") != ""))
-            .group_by(["order_id", "plant", "item_id"])
-            .agg([
-                pl.sum(c).alias(c) for c in available_stock_cols
-            ])
-        )
-        item_stock_df = (
-            stock_df
-            .filter(pl.col("order_id").is_null() | (pl.col("order_id") == ""))
-            .group_by(["plant", "item_id"])
-            .agg([
-                pl.sum(c).alias(c) for c in available_stock_cols
-            ])
-        )
-
-        self.logger.info("Stock Aggregation Completed.")
-
-        # Initialize StockManager & BOMTree
-        stock_manager = StockManager(self.logger)
-        stock_manager.load_stock(so_stock_df, item_stock_df)
+        # Initialize StockManager
+        stock_manager, initial_stock_df = self._build_phase_stock(stock_df, "component_allocation")
         self.logger.info("Loaded Stock Data in Stock Manager.")
-        bom_tree_obj = BOMTree(bom_df)
-        self.logger.info("BOMTree initialized successfully with %d BOM roots.",len(bom_tree_obj.bom_tree_map))
+        comp_cfg = self.config["phases"]["component_allocation"]
 
+        self._report_memory("component_allocation.load", bom_tree=bom_tree_obj, stock_manager=stock_manager)
 
         # Choose allocator from config
         alloc_type = self.config["phases"]["component_allocation"]["type"]
@@ -246,70 +311,323 @@ class AllocationPipeline:
             self.logger.error("Unsupported Component Allocation type: %s", alloc_type)
             raise ValueError(f"Unsupported Component Allocation type: {alloc_type}")
 
+        progress = self._progress("component_allocation", so_df.height, stock_manager)
         allocator = allocator_cls(
             so_df,
             bom_tree_obj,
             stock_manager,
-            logger=self.logger
+            config=self.config["phases"]["component_allocation"],
+            logger=category_logger(self.logger, "allocator"),
+            progress=progress
         )
         self.logger.info("Running %s Partial Allocation...", alloc_type.capitalize())
         output_df = allocator.allocate()
+        if progress is not None:
+            progress.finish()
         self.logger.info("%s Partial Allocation Completed.", alloc_type.capitalize())
+        self._close_ledger(stock_manager, initial_stock_df, "component_allocation")
+        self._report_memory(
+            "component_allocation", bom_tree=bom_tree_obj, stock_manager=stock_manager, component_allocator=allocator
+        )
         data["so_df"] = allocator.so_df
         data["component_allocation_df"] = output_df
+        if allocator.remarks_df is not None:
+            data["component_allocation_remarks_df"] = allocator.remarks_df
+        if comp_cfg.get("shortage_index", False):
+            data["shortage_index"] = ShortageIndex.from_allocation(output_df, bom_tree_obj.where_used_df())
+            self.logger.info(
+                "Shortage index built | Blocked rows=%d | Where-used rows=%d",
+                data["shortage_index"].blocked_df.height, data["shortage_index"].where_used_df.height
+            )
         self.logger.info("Updated SO and Component Allocation Data")
         self.logger.info("Component Allocation Phase Completed.")
         return data
 
 
-    def _write_outputs(self, data):
-        try: 
+    def _build_phase_stock(self, stock_df, phase):
+        """
+        StockManager for a phase, recording into a ConsumptionLedger when
+        stock_ledger is enabled and holding fixed-point quantities when
+        quantities.mode is fixed. Returns (stock_manager, initial stock frame
+        for ledger verification or None).
+        """
+        if self.quantity_scale is None:
+            self.quantity_scale = QuantityScale.from_config(self.config.get("quantities"), self.keys, stock_df, self.logger)
+
+        ledger_cfg = self.config.get("stock_ledger") or {}
+        ledger = None
+        if ledger_cfg.get("enabled", False):
+            ledger = ConsumptionLedger(
+                self.keys,
+                Path(self.config["base_path"]) / ledger_cfg.get("path", "ledger") / phase,
+                flush_rows=ledger_cfg.get("flush_rows", 1_000_000)
+            )
+
+        stock_manager = self.stock_preparer.build_stock_manager(
+            stock_df, self.keys, ledger=ledger,
+            log_consumption=self.config.get("logging", {}).get("stock_consume_lines", True),
+            scale=self.quantity_scale,
+            as_of=(self.config.get("time_phased") or {}).get("as_of")
+        )
+        verify = ledger is not None and ledger_cfg.get("verify", True)
+        # The ledger replays per stock key, so receipts are verified as key totals
+        return stock_manager, stock_manager.remaining_stock_df(receipts=False) if verify else None
+
+    def _progress(self, phase, total_orders, stock_manager):
+        """ProgressReporter for a phase's allocation loop, or None when progress is disabled."""
+        progress_cfg = self.config.get("progress") or {}
+        if not progress_cfg.get("enabled", False):
+            return None
+        metrics_file = progress_cfg.get("metrics_file")
+        return ProgressReporter(
+            self.logger,
+            phase,
+            total_orders,
+            interval_s=progress_cfg.get("interval_s", 10),
+            metrics_path=Path(self.config["base_path"]) / metrics_file if metrics_file else None,
+            consumes=lambda: stock_manager.consumes,
+            run_id=getattr(self.logger, "run_ts", None),
+        )
+
+
+    def _close_ledger(self, stock_manager, initial_stock_df, phase):
+        """Flushes the phase's ledger and, if requested, replays it against the final stock."""
+        ledger = stock_manager.ledger
+        if ledger is None:
+            return
+        ledger.close()
+        self.logger.info("Stock ledger written | Phase=%s | Rows=%d | Path=%s", phase, ledger.rows, ledger.directory)
+        if initial_stock_df is None:
+            return
+
+        tolerance = float((self.config.get("stock_ledger") or {}).get("tolerance", 1e-6))
+        mismatches = ledger.verify(initial_stock_df, stock_manager.remaining_stock_df(receipts=False), tolerance)
+        if mismatches.height:
+            self.logger.error(
+                "Stock ledger replay does not match final stock | Phase=%s | Keys=%d | First=%s",
+                phase, mismatches.height, mismatches.head(5).to_dicts()
+            )
+            raise ValueError(f"Stock ledger verification failed for {phase}: {mismatches.height} stock key(s) differ")
+        self.logger.info("Stock ledger verified | Phase=%s | Stock keys=%d", phase, initial_stock_df.height)
+
+
+    def _report_memory(self, stage, **components):
+        """
+        Logs memory_report() of each component (bom_tree / stock_manager /
+        component_allocator) and the process RSS after a stage, and fails
+        fast when one exceeds its budget in memory.budgets_mb.
+        """
+        mem_cfg = self.config.get("memory") or {}
+        if not mem_cfg.get("report", True):
+            return
+        sample_size = int(mem_cfg.get("sample_size", 1000))
+        budgets = mem_cfg.get("budgets_mb") or {}
+
+        checks = []
+        for name, component in components.items():
+            report = component.memory_report(sample_size)
+            self.logger.info(
+                "Memory | Stage=%s | %s=%s | %s", stage, name, format_bytes(report["total_bytes"]),
+                " | ".join(
+                    f"{k}={format_bytes(v) if k.endswith('_bytes') else v}"
+                    for k, v in report.items() if k != "total_bytes"
+                )
+            )
+            checks.append((name, report["total_bytes"]))
+
+        process = process_memory()
+        self.logger.info(
+            "Memory | Stage=%s | process RSS=%s | Peak RSS=%s",
+            stage, format_bytes(process["rss_bytes"]), format_bytes(process["peak_rss_bytes"])
+        )
+        checks.append(("process_rss", process["rss_bytes"]))
+
+        for name, used in checks:
+            try:
+                check_memory_budget(name, used, budgets, stage)
+            except MemoryBudgetError as e:
+                self.logger.error(str(e))
+                raise
+
+
+    def _adopt_cached_bom(self):
+        """
+        Looks the component BOM up in bom_cache before anything is interned:
+        on a hit the run takes over the cached tree's KeyDictionary and the
+        BOM is neither read nor built.
+        """
+        self._bom_cache_key = self.bom_cache.key(self.config)
+        cached = self.bom_cache.get(self._bom_cache_key)
+        if cached is None:
+            return
+        self.keys, self._cached_bom_tree = cached
+        self._cached_bom_tree.logger = self.logger
+        self.logger.info("Reusing compiled BOMTree from the batch BOM cache (content hash %s).", self._bom_cache_key[:12])
+
+
+    def _build_component_bom_tree(self, bom_df) -> BOMTree:
+        """Cleaned, compiled BOMTree for the component phase (+ where-used for the shortage index)."""
+        if self._cached_bom_tree is not None:
+            return self._cached_bom_tree
+        bom_tree_obj = self._build_bom_tree(bom_df)
+        if self.config["phases"]["component_allocation"].get("shortage_index", False):
+            bom_tree_obj.build_where_used()
+        if self.bom_cache is not None:
+            self.bom_cache.put(self._bom_cache_key, self.keys, bom_tree_obj)
+        return bom_tree_obj
+
+
+    def _build_bom_tree(self, bom_df) -> BOMTree:
+        # Clean data
+        bom_df = bom_df.with_columns([
+            *SchemaResolver.strip_key_exprs(bom_df, ["root_parent", "plant", "parent", "child"]),
+            pl.col("comp_qty").fill_null(0).cast(pl.Float64)
+        ])
+        self.logger.info("BOM Data Cleaned.")
+
+        bom_tree_obj = BOMTree(bom_df, logger=self.logger, keys=self.keys)
+        self.logger.info("BOMTree initialized successfully with %d BOM roots.",len(bom_tree_obj.bom_tree_map))
+
+        # Structure (cycles, depth, levels) is resolved once, before allocation
+        comp_cfg = self.config["phases"]["component_allocation"]
+        bom_tree_obj.compile(
+            max_depth=comp_cfg.get("bom_max_depth"),
+            on_cycle=comp_cfg.get("bom_cycle_policy", "error")
+        )
+        return bom_tree_obj
+
+
+    def load_component_state(self):
+        """
+        Reads the component phase's BOM and stock inputs and returns
+        (BOMTree, StockManager) without allocating anything.
+        Used by long-running services that query a warm state.
+        """
+        if SchemaResolver.uses_categorical(self.config["schemas"]):
+            pl.enable_string_cache()
+
+        allocator_cls = COMPONENT_ALLOCATORS[self.config["phases"]["component_allocation"]["type"]]
+        data = {}
+        with ThreadPoolExecutor(
+            max_workers=max(1, int(self.config.get("io", {}).get("read_workers", 3))),
+            thread_name_prefix="input_reader"
+        ) as executor:
+            self._io_executor = executor
+            self._read_phase_inputs("component_allocation", allocator_cls, data, skip={"so"})
+
+        stock_manager = self.stock_preparer.build_stock_manager(data["stock_df"], self.keys)
+        self.logger.info("Loaded Stock Data in Stock Manager.")
+        return self._build_bom_tree(data["bom_df"]), stock_manager
+
+
+    def _scoped_so_rows(self, so_file, so_df) -> tuple:
+        """
+        (rows of an SO output, rows of a per-SO output) replaced by a scoped
+        run; (None, None) for a full run. Read before so_file is rewritten.
+        """
+        if self.scope is None:
+            return None, None
+        so_ids = self.scope.scoped_so_ids(so_file, so_df)
+        return self.scope.so_rows(), self.scope.so_keyed_rows(so_ids)
+
+
+    def _write_frame(self, df, file, scope_rows=None):
+        """
+        Writes df to file. In a scoped run df is spliced into the previous
+        file instead, replacing the rows scope_rows selects (None: the
+        previous file is kept).
+        """
+        if self.scope is not None:
+            df = self.scope.splice(file, df, scope_rows, self.logger)
+            if df is None:
+                return
+        write_csv(df, file)
+
+
+    def _splice_shortage_index(self, index, directory, so_keyed_rows):
+        """Scoped shortage index merged into the previous run's index files, if any."""
+        try:
+            previous = ShortageIndex.load(directory)
+        except FileNotFoundError:
+            return index
+        blocked = pl.concat([
+            previous.blocked_df.filter(~so_keyed_rows), index.blocked_df
+        ], how="vertical_relaxed")
+        where_used = pl.concat([
+            previous.where_used_df.filter(~pl.col("plant").cast(pl.Utf8).is_in(self.scope.plants)), index.where_used_df
+        ], how="vertical_relaxed")
+        return ShortageIndex(blocked, where_used)
+
+
+    def _write_order_outputs(self, data):
+        try:
             base_path = Path(self.config["base_path"])
-            self.logger.info("Starting output write phase.")
-
-            # ---------------- ORDER ALLOCATION OUTPUTS ----------------
-            if self.config["phases"]["order_allocation"]["enabled"]:
-                order_cfg = self.config["phases"]["order_allocation"]
-                order_out_dir = base_path / order_cfg["output_path"]
-                order_out_dir.mkdir(parents=True, exist_ok=True)
-                self.logger.debug("Order allocation output directory ready: %s", order_out_dir)
-
-                so_filename = order_cfg["csv_inputs"]["so"]
-                so_file = order_out_dir / so_filename
-                write_csv(data["so_df"], so_file)
-                self.logger.info("Order allocation SO written: %s (rows=%d)", so_file, data["so_df"].height)
-
-                stock_file = order_out_dir / order_cfg["csv_inputs"]["stock"]
-                write_csv(data["stock_df"], stock_file)
-                self.logger.info("Remaining stock written: %s (rows=%d)", stock_file, data["stock_df"].height)
-
-            else:
-                self.logger.info("Order allocation output skipped (phase disabled).")
-
-            # ---------------- COMPONENT ALLOCATION OUTPUTS ----------------
-            if self.config["phases"]["component_allocation"]["enabled"]:
-                comp_cfg = self.config["phases"]["component_allocation"]
-                comp_out_dir = base_path / comp_cfg["output_path"]
-                comp_out_dir.mkdir(parents=True, exist_ok=True)
-                self.logger.debug("Component allocation output directory ready: %s", comp_out_dir)
-
-                comp_file = comp_out_dir / "component_allocation_output.csv"
-                write_csv(data["component_allocation_df"], comp_file)
-                self.logger.info("Component Allocation output written: %s (rows=%d)", comp_file, data["component_allocation_df"].height)
-
-                so_file = comp_out_dir / "orders_after_component_allocation.csv"
-                write_csv(data["so_df"], so_file)
-                self.logger.info("SO Data after Component Allocation written: %s (rows=%d)", so_file, data["so_df"].height)
-
-                stock_file = comp_out_dir / "remaining_stock_after_component_allocation.csv"
-                write_csv(data["stock_df"], stock_file)
-                self.logger.info("Remaining stock after Component Allocation written: %s (rows=%d)", stock_file, data["stock_df"].height)
-            
-            else:
-                self.logger.info("Component allocation output skipped (phase disabled).")
-
-            self.logger.info("Output write phase completed.")
+            self.logger.info("Starting order allocation output write.")
+
+            order_cfg = self.config["phases"]["order_allocation"]
+            order_out_dir = base_path / order_cfg["output_path"]
+            order_out_dir.mkdir(parents=True, exist_ok=True)
+            self.logger.debug("Order allocation output directory ready: %s", order_out_dir)
+
+            so_filename = order_cfg["csv_inputs"]["so"]
+            so_file = order_out_dir / so_filename
+            so_rows = self._scoped_so_rows(so_file, data["so_df"])
+            self._write_frame(data["so_df"], so_file, so_rows[0])
+            self.logger.info("Order allocation SO written: %s (rows=%d)", so_file, data["so_df"].height)
+
+            stock_file = order_out_dir / order_cfg["csv_inputs"]["stock"]
+            self._write_frame(data["stock_df"], stock_file, self.scope and self.scope.stock_rows())
+            self.logger.info("Remaining stock written: %s (rows=%d)", stock_file, data["stock_df"].height)
+
+            if "order_allocation_remarks_df" in data:
+                remarks_file = order_out_dir / "order_allocation_remarks.csv"
+                self._write_frame(data["order_allocation_remarks_df"], remarks_file, so_rows[1])
+                self.logger.info("Order allocation remarks written: %s (rows=%d)", remarks_file, data["order_allocation_remarks_df"].height)
+
+            self.logger.info("Order allocation output write completed.")
+
+        except Exception as e:
+            self.logger.critical("Failed to write output files: %s", str(e), exc_info=True)
+            raise
+
+
+    def _write_component_outputs(self, data):
+        try:
+            base_path = Path(self.config["base_path"])
+            self.logger.info("Starting component allocation output write.")
+
+            comp_cfg = self.config["phases"]["component_allocation"]
+            comp_out_dir = base_path / comp_cfg["output_path"]
+            comp_out_dir.mkdir(parents=True, exist_ok=True)
+            self.logger.debug("Component allocation output directory ready: %s", comp_out_dir)
+
+            so_file = comp_out_dir / "orders_after_component_allocation.csv"
+            so_rows = self._scoped_so_rows(so_file, data["so_df"])
+
+            comp_file = comp_out_dir / "component_allocation_output.csv"
+            self._write_frame(data["component_allocation_df"], comp_file, so_rows[1])
+            self.logger.info("Component Allocation output written: %s (rows=%d)", comp_file, data["component_allocation_df"].height)
+
+            self._write_frame(data["so_df"], so_file, so_rows[0])
+            self.logger.info("SO Data after Component Allocation written: %s (rows=%d)", so_file, data["so_df"].height)
+
+            stock_file = comp_out_dir / "remaining_stock_after_component_allocation.csv"
+            self._write_frame(data["stock_df"], stock_file, self.scope and self.scope.stock_rows())
+            self.logger.info("Remaining stock after Component Allocation written: %s (rows=%d)", stock_file, data["stock_df"].height)
+
+            if "component_allocation_remarks_df" in data:
+                remarks_file = comp_out_dir / "component_allocation_remarks.csv"
+                self._write_frame(data["component_allocation_remarks_df"], remarks_file, so_rows[1])
+                self.logger.info("Component allocation remarks written: %s (rows=%d)", remarks_file, data["component_allocation_remarks_df"].height)
+
+            if "shortage_index" in data:
+                if self.scope is not None:
+                    data["shortage_index"] = self._splice_shortage_index(data["shortage_index"], comp_out_dir, so_rows[1])
+                data["shortage_index"].write(comp_out_dir)
+                self.logger.info("Shortage index written: %s", comp_out_dir)
+
+            self.logger.info("Component allocation output write completed.")
 
         except Exception as e:
             self.logger.critical("Failed to write output files: %s", str(e), exc_info=True)
-            raise
\ No newline at end of file
+            raise
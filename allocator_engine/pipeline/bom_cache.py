@@ -0,0 +1,68 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class BomCache:
+    """
+    Compiled BOMTrees shared by the pipelines run in one process (batch
+    runs), keyed by a content hash of the component phase's BOM file plus the
+    settings that shape the tree. Clients with an identical BOM master skip
+    reading, cleaning and compiling it.
+
+    A BOMTree holds interned ids, so it is cached with its KeyDictionary and
+    a pipeline reusing the tree adopts that dictionary for its whole run.
+    Interning is append-only, so ids of earlier clients never change.
+    """
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(config: dict) -> str | None:
+        """Cache key of the component phase's BOM, or None if that phase reads no BOM file."""
+        comp_cfg = config["phases"].get("component_allocation") or {}
+        bom_file = (comp_cfg.get("csv_inputs") or {}).get("bom")
+        if not comp_cfg.get("enabled") or not bom_file:
+            return None
+        path = Path(config["base_path"]) / comp_cfg["input_source"] / bom_file
+        if not path.is_file():
+            return None
+
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256")
+        settings = {
+            "schema": config["schemas"].get("bom"),
+            "bom_max_depth": comp_cfg.get("bom_max_depth"),
+            "bom_cycle_policy": comp_cfg.get("bom_cycle_policy", "error"),
+            "shortage_index": comp_cfg.get("shortage_index", False),
+            "scope": config.get("scope"),
+        }
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """(KeyDictionary, BOMTree) cached under key, or None."""
+        with self._lock:
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, keys, bom_tree) -> None:
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (keys, bom_tree)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -3,6 +3,8 @@ from core.order_allocation.strategies.partial import PartialOrderAllocator
 
 # Component Allocation strategies
 from core.component_allocation.strategies.partial import PartialComponentAllocator
+from core.component_allocation.strategies.net_requirements import NetRequirementsComponentAllocator
+from core.component_allocation.strategies.parallel import ParallelComponentAllocator
 
 
 
@@ -13,4 +15,6 @@ ORDER_ALLOCATORS = {
 
 COMPONENT_ALLOCATORS = {
     "partial": PartialComponentAllocator,
+    "net_requirements": NetRequirementsComponentAllocator,
+    "parallel": ParallelComponentAllocator,
 }
@@ -0,0 +1,122 @@
+from pathlib import Path
+
+from io_modules.reader import read_csv_header, read_csv_sample
+from utils.memory import format_bytes
+from utils.schema_resolver import SchemaResolver
+
+
+class PreflightError(ValueError):
+    """Raised when inputs of an enabled phase cannot be read as configured."""
+
+
+class InputPreflight:
+    """
+    Validates every CSV input an enabled phase will read before anything
+    runs: the file exists, the header has all required columns (case /
+    space insensitive, as SchemaResolver.resolve matches them) and the first
+    sample_rows lines parse with the configured dtypes. Row count and
+    in-memory size are extrapolated from the sample and the file size.
+
+    Inputs produced by an earlier phase (SO and stock after order
+    allocation) are not checked. All problems are collected, so one failed
+    preflight lists everything that needs fixing.
+    """
+
+    def __init__(self, config, logger, sample_rows: int = 1000):
+        self.config = config
+        self.logger = logger
+        self.sample_rows = max(1, int(sample_rows))
+
+    def inputs(self, phase_allocators: dict, produced: dict):
+        """
+        (phase, src, path, required columns) for every file read.
+        phase_allocators: {phase: allocator class} of enabled phases in run
+        order; produced: {phase: sources it hands to later phases}.
+        """
+        base_path = Path(self.config["base_path"])
+        available = set()
+        for phase, allocator_cls in phase_allocators.items():
+            phase_cfg = self.config["phases"][phase]
+            csv_cfg = phase_cfg.get("csv_inputs", {})
+            for src, cols in allocator_cls.resolved_required_schemas().items():
+                if src in available or src not in csv_cfg:
+                    continue
+                yield phase, src, base_path / phase_cfg["input_source"] / csv_cfg[src], cols
+            available |= set(produced.get(phase, ()))
+
+    def check(self, phase, src, path: Path, cols) -> tuple:
+        """(problems, estimate dict or None) for one input file."""
+        schema_cfg = self.config["schemas"].get(src)
+        if schema_cfg is None:
+            return [f"{phase}: no schemas.{src} configured"], None
+        missing_cfg = [k for k in cols if k not in schema_cfg]
+        if missing_cfg:
+            return [f"{phase}: schemas.{src} is missing keys {missing_cfg}"], None
+        if not path.is_file():
+            return [f"{phase}: {src.upper()} file not found: {path}"], None
+
+        try:
+            header = read_csv_header(path)
+        except Exception as e:
+            return [f"{phase}: cannot read header of {path}: {e}"], None
+
+        normalized = SchemaResolver.normalized_columns(header)
+        missing = [
+            SchemaResolver.column_name(schema_cfg[k]) for k in cols
+            if SchemaResolver._normalize(SchemaResolver.column_name(schema_cfg[k])) not in normalized
+        ]
+        if missing:
+            return [f"{phase}: {path.name} lacks columns {missing} (found {header})"], None
+
+        try:
+            overrides = SchemaResolver.read_overrides(header, schema_cfg, cols)
+        except ValueError as e:
+            return [f"{phase}: schemas.{src}: {e}"], None
+        try:
+            sample, sample_bytes, complete = read_csv_sample(path, self.sample_rows, overrides or None)
+        except Exception as e:
+            return [f"{phase}: first {self.sample_rows} rows of {path.name} do not parse with the configured dtypes: {str(e).splitlines()[0]}"], None
+
+        file_size = path.stat().st_size
+        if complete or not sample.height:
+            rows = sample.height
+        else:
+            rows = int(sample.height * max(file_size, 1) / max(sample_bytes, 1))
+        per_row = sample.estimated_size() / sample.height if sample.height else 0
+        return [], {
+            "phase": phase,
+            "src": src,
+            "file": str(path),
+            "file_bytes": file_size,
+            "rows": rows,
+            "rows_exact": complete,
+            "memory_bytes": int(per_row * rows),
+        }
+
+    def run(self, phase_allocators: dict, produced: dict) -> list:
+        """Checks all inputs; returns their estimates or raises PreflightError."""
+        problems, estimates = [], []
+        for phase, src, path, cols in self.inputs(phase_allocators, produced):
+            found, estimate = self.check(phase, src, path, cols)
+            problems += found
+            if estimate is not None:
+                estimates.append(estimate)
+                self.logger.info(
+                    "Preflight | %s | %s | %s | rows%s%d | file=%s | est. memory=%s",
+                    phase, src.upper(), Path(estimate["file"]).name, "=" if estimate["rows_exact"] else "~",
+                    estimate["rows"], format_bytes(estimate["file_bytes"]), format_bytes(estimate["memory_bytes"])
+                )
+
+        budget = ((self.config.get("memory") or {}).get("budgets_mb") or {}).get("process_rss")
+        total = sum(e["memory_bytes"] for e in estimates)
+        if budget is not None and total > float(budget) * 1024 * 1024:
+            problems.append(
+                f"inputs need an estimated {format_bytes(total)}, over memory.budgets_mb.process_rss ({budget} MB)"
+            )
+
+        if problems:
+            for problem in problems:
+                self.logger.error(f"Preflight failed | {problem}")
+            raise PreflightError(f"Input preflight failed with {len(problems)} problem(s): {problems[0]}")
+        self.logger.info("Preflight passed | Inputs=%d | Est. input memory=%s", len(estimates), format_bytes(total))
+        return estimates
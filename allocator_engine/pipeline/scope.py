@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import polars as pl
+
+from utils.schema_resolver import SchemaResolver
+
+# Schema keys filtered at read time per input
+READ_FILTERS = {
+    "so": {"plant": "plants"},
+    "stock": {"plant": "plants"},
+    "bom": {"plant": "plants"},
+}
+
+
+class RunScope:
+    """
+    Restricts a run to some plants (`scope:` in config.yaml).
+
+    Inputs are filtered while they are read (predicate pushdown into the
+    CSV scan), so only the slice is parsed and allocated. Outputs are then
+    spliced into the previous run's files at the same paths: rows of the
+    scope's partitions are replaced, everything else is kept.
+
+    Plants are independent partitions (stock, SO-level stock and BOMs are
+    keyed by plant), so a plant-scoped run gives exactly the rows a full run
+    would. FGs are not: they share component stock with the other FGs of
+    their plant, so an FG slice would allocate stock other SOs already hold
+    and is rejected.
+    """
+
+    def __init__(self, plants=None):
+        self.plants = sorted({str(p).strip() for p in plants or []}) or None
+
+    @classmethod
+    def from_config(cls, scope_cfg: dict | None):
+        """RunScope for a `scope:` block, or None when it selects everything."""
+        if (scope_cfg or {}).get("fg_ids"):
+            raise ValueError(
+                "scope.fg_ids is not supported: FGs share component stock within a plant, so an FG "
+                "slice would re-allocate stock held by other SOs. Scope the run by plant instead."
+            )
+        scope = cls((scope_cfg or {}).get("plants"))
+        return scope if scope.plants else None
+
+    def describe(self) -> str:
+        return f"Plants={self.plants}"
+
+    @staticmethod
+    def _in(col: str, values) -> pl.Expr:
+        return pl.col(col).cast(pl.Utf8).str.strip_chars().is_in(values)
+
+    # ---------------- READ ----------------
+    def read_predicate(self, src: str, header: list, schema_cfg: dict):
+        """Filter on the raw CSV columns of src, or None if the input is read whole."""
+        normalized = SchemaResolver.normalized_columns(header)
+        conditions = []
+        for key, attr in READ_FILTERS.get(src, {}).items():
+            values = getattr(self, attr)
+            if not values or key not in schema_cfg:
+                continue
+            actual = normalized.get(SchemaResolver._normalize(SchemaResolver.column_name(schema_cfg[key])))
+            if actual is not None:
+                conditions.append(self._in(actual, values))
+        return pl.all_horizontal(conditions) if conditions else None
+
+    # ---------------- SPLICE ----------------
+    def so_rows(self, plant_col: str = "plant") -> pl.Expr:
+        """Rows of an SO frame inside the scope."""
+        return self._in(plant_col, self.plants)
+
+    def so_keyed_rows(self, so_ids, so_col: str = "SO_ID", plant_col: str = "Plant") -> pl.Expr:
+        """
+        Rows of a per-SO output (allocation rows, remark events) inside the
+        scope: those of the scope's SO ids, at a scoped plant (or without one:
+        some remark events carry no plant).
+        """
+        return self._in(so_col, sorted(so_ids)) & (pl.col(plant_col).is_null() | self._in(plant_col, self.plants))
+
+    def stock_rows(self, plant_col: str = "plant") -> pl.Expr:
+        """Rows of a stock output inside the scope."""
+        return self._in(plant_col, self.plants)
+
+    def scoped_so_ids(self, previous_file: Path, so_df: pl.DataFrame) -> set:
+        """SO ids of the scope in the previous SO output and in this run."""
+        ids = set(so_df["order_id"].cast(pl.Utf8).str.strip_chars().drop_nulls().to_list())
+        previous = self.read_previous(previous_file)
+        if previous is not None and {"order_id", "plant"} <= set(previous.columns):
+            ids.update(previous.filter(self.so_rows())["order_id"].str.strip_chars().drop_nulls().to_list())
+        return ids
+
+    @staticmethod
+    def read_previous(path: Path):
+        path = Path(path)
+        return pl.read_csv(path, infer_schema_length=0) if path.is_file() else None
+
+    def splice(self, path: Path, df: pl.DataFrame, scope_rows, logger) -> pl.DataFrame | None:
+        """
+        df spliced into the previous file at path: previous rows selected by
+        scope_rows are replaced by df. Returns None when the previous file
+        must be kept: columns that differ from this run (e.g. another remarks
+        mode; a full run is needed). Without a previous file df is returned
+        as is.
+        """
+        previous = self.read_previous(path)
+        if previous is None:
+            logger.warning(f"Scoped run: no previous output at {path}; writing the scoped rows only.")
+            return df
+        if set(previous.columns) != set(df.columns):
+            logger.error(
+                f"Scoped run: columns of {path} differ from this run ({previous.columns} vs {df.columns}); "
+                "previous file kept, run without scope to rebuild it."
+            )
+            return None
+
+        kept = previous.filter(~scope_rows.fill_null(False)).select(df.columns)
+        kept = kept.with_columns([
+            pl.col(c).cast(dtype) for c, dtype in df.schema.items() if dtype != pl.Utf8
+        ])
+        logger.info(
+            "Scoped output spliced | %s | Kept=%d | Replaced=%d | New=%d",
+            Path(path).name, kept.height, previous.height - kept.height, df.height
+        )
+        return pl.concat([kept, df], how="vertical_relaxed")
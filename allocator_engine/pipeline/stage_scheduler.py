@@ -0,0 +1,167 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+STAGE_EXECUTORS = ("thread", "process")
+
+
+class Stage:
+    """
+    One node of the pipeline DAG: fn(inputs) runs once every stage in deps
+    has finished; inputs maps each dependency's name to its result.
+    executor: thread (shares the pipeline's state) | process (fn and its
+    inputs / result must be picklable).
+    """
+    __slots__ = ("name", "fn", "deps", "executor")
+
+    def __init__(self, name: str, fn, deps=(), executor: str = "thread"):
+        if executor not in STAGE_EXECUTORS:
+            raise ValueError(f"Unsupported stage executor: {executor} (expected one of {STAGE_EXECUTORS})")
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.executor = executor
+
+
+class StageScheduler:
+    """
+    Runs a DAG of Stages on an asyncio event loop: each stage starts as soon
+    as its dependencies are done and runs on a thread (or process) pool, so
+    independent stages overlap. The first failing stage cancels everything
+    not yet started and its exception is re-raised once running stages end.
+
+    After run(), timings holds {stage: (start, end)} in seconds from the
+    start of the run; report() adds the critical path.
+    """
+
+    def __init__(self, stages, logger, workers: int = 4, process_workers: int | None = None):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate pipeline stage: {stage.name}")
+            self.stages[stage.name] = stage
+        self.logger = logger
+        self.workers = max(1, int(workers))
+        self.process_workers = process_workers
+        self.order = self._topological_order()
+        self.timings = {}
+        self.results = {}
+
+    def _topological_order(self) -> list:
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Pipeline stages form a cycle: {' -> '.join(path + [name])}")
+            stage = self.stages.get(name)
+            if stage is None:
+                raise ValueError(f"Unknown pipeline stage dependency: {name} (needed by {path[-1]})")
+            state[name] = "visiting"
+            for dep in stage.deps:
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    # ---------------- RUN ----------------
+    def run(self) -> dict:
+        """Runs all stages; returns {stage: result}."""
+        self.timings = {}
+        self.results = {}
+        self._t0 = time.perf_counter()
+
+        uses_processes = any(s.executor == "process" for s in self.stages.values())
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline_stage") as threads:
+            processes = ProcessPoolExecutor(max_workers=self.process_workers) if uses_processes else None
+            try:
+                self._executors = {"thread": threads, "process": processes}
+                asyncio.run(self._run_all())
+            finally:
+                if processes is not None:
+                    processes.shutdown()
+        self.wall_seconds = time.perf_counter() - self._t0
+        return self.results
+
+    async def _run_all(self):
+        tasks = {}
+        for name in self.order:
+            tasks[name] = asyncio.create_task(self._run_stage(self.stages[name], tasks), name=name)
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # Stages already on a pool cannot be interrupted; let them end
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+    async def _run_stage(self, stage: Stage, tasks: dict):
+        if stage.deps:
+            await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+        inputs = {dep: self.results[dep] for dep in stage.deps}
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter() - self._t0
+        self.logger.debug("Stage started | %s | t=%.3fs", stage.name, start)
+        try:
+            result = await loop.run_in_executor(self._executors[stage.executor], stage.fn, inputs)
+        except Exception:
+            self.logger.error(f"Stage failed | {stage.name}")
+            raise
+        finally:
+            self.timings[stage.name] = (start, time.perf_counter() - self._t0)
+        self.results[stage.name] = result
+        self.logger.debug("Stage done | %s | %.3fs", stage.name, self.timings[stage.name][1] - start)
+        return result
+
+    # ---------------- TIMING ----------------
+    def critical_path(self) -> tuple:
+        """
+        (stage names, seconds) of the dependency chain with the largest
+        summed stage duration: the lower bound on wall time however many
+        workers run the other stages.
+        """
+        best = {}
+        for name in self.order:
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            prev = max(
+                (best[d] for d in self.stages[name].deps if d in best),
+                key=lambda b: b[1], default=((), 0.0)
+            )
+            best[name] = (prev[0] + (name,), prev[1] + (end - start))
+        path, seconds = max(best.values(), key=lambda b: b[1], default=((), 0.0))
+        return list(path), seconds
+
+    def report(self) -> dict:
+        path, seconds = self.critical_path()
+        durations = {name: end - start for name, (start, end) in self.timings.items()}
+        return {
+            "wall_seconds": self.wall_seconds,
+            "stage_seconds": durations,
+            "busy_seconds": sum(durations.values()),
+            "critical_path": path,
+            "critical_path_seconds": seconds,
+        }
+
+    def log_report(self) -> dict:
+        report = self.report()
+        for name in self.order:
+            if name in self.timings:
+                start, end = self.timings[name]
+                self.logger.info(
+                    "Stage timing | %-28s | start=%7.3fs | end=%7.3fs | %7.3fs%s",
+                    name, start, end, end - start, " *" if name in report["critical_path"] else ""
+                )
+        self.logger.info(
+            "Pipeline timing | Wall=%.3fs | Stage total=%.3fs | Critical path=%.3fs (%s)",
+            report["wall_seconds"], report["busy_seconds"], report["critical_path_seconds"],
+            " -> ".join(report["critical_path"])
+        )
+        return report
@@ -0,0 +1,62 @@
+import copy
+from pathlib import Path
+import yaml
+
+from pipeline.allocation_pipeline import AllocationPipeline
+from service.atp_engine import ATPEngine
+from service.atp_server import ATPServer
+from utils.logger import EngineLogger
+
+# --------------------------------------------------
+# Resolve paths
+# --------------------------------------------------
+BASE_DIR = Path(__file__).resolve().parent
+CONFIG_PATH = BASE_DIR / "config" / "config.yaml"
+
+
+def main():
+    if not CONFIG_PATH.exists():
+        raise FileNotFoundError(f"Config file not found: {CONFIG_PATH}")
+
+    with open(CONFIG_PATH, "r") as f:
+        config = yaml.safe_load(f)
+
+    logger = EngineLogger.from_config(config)
+    atp_cfg = config.get("atp", {})
+
+    try:
+        # --------------------------------------------------
+        # Load BOM + stock ONCE, then serve queries
+        # --------------------------------------------------
+        logger.info("Starting ATP service...")
+        # Component phase inputs, optionally read from another folder
+        # (e.g. `input` when no order allocation run precedes the service)
+        service_config = copy.deepcopy(config)
+        if atp_cfg.get("input_source"):
+            service_config["phases"]["component_allocation"]["input_source"] = atp_cfg["input_source"]
+
+        bom_tree, stock_manager = AllocationPipeline(service_config, logger).load_component_state()
+        engine = ATPEngine(bom_tree, stock_manager, logger, max_nodes=int(atp_cfg.get("max_nodes", 100_000)))
+
+        address = (atp_cfg.get("host", "127.0.0.1"), int(atp_cfg.get("port", 8765)))
+        server = ATPServer(
+            address, engine, logger,
+            batch_window_ms=float(atp_cfg.get("batch_window_ms", 2.0)),
+            max_batch_size=int(atp_cfg.get("max_batch_size", 256))
+        )
+        logger.info("ATP service listening on http://%s:%d", *address)
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        logger.info("ATP service stopped.")
+
+    except Exception:
+        logger.critical("Fatal ATP service error occurred", exc_info=True)
+        raise
+
+    finally:
+        logger.write_run_footer()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+from collections import defaultdict
+
+from common.bom_tree import BOMTree
+from common.stock_manager import StockManager, STOCK_BUCKETS
+
+
+class ATPEngine:
+    """
+    Available-to-promise answers over a warm BOMTree and a stock snapshot.
+
+    A query ("can we ship qty of FG at plant?") is a dry run of the partial
+    component allocation for that single SO: every BOM node consumes what it
+    can from stock (SO-level stock first if so_id is given, else ITEM-level)
+    and passes its remaining demand to its children. Consumption is tracked
+    in a per-query overlay, so the snapshot is never mutated and queries are
+    independent of each other. Leaf components left with demand are the
+    shortages.
+
+    - Stock is reduced to one available total per stock key at load time
+      (per-item availability index).
+    - Queries walk the compiled BFS explosion of the BOM (BOMTree.explosion),
+      flattened once per (FG, plant) into a template.
+    """
+
+    def __init__(self, bom_tree: BOMTree, stock_manager: StockManager, logger, max_nodes: int = 100_000):
+        self.bom_tree = bom_tree
+        self.keys = stock_manager.keys
+        self.logger = logger
+        self.max_nodes = max_nodes
+
+        # stock key -> buckets copy / positive available total
+        self._snapshot = {
+            key: {col: float(buckets.get(col, 0) or 0) for col in STOCK_BUCKETS}
+            for key, buckets in stock_manager.remaining_stock.items()
+        }
+        self.availability = {
+            key: sum(max(v, 0.0) for v in buckets.values())
+            for key, buckets in self._snapshot.items()
+        }
+        # (plant, item) -> stock keys, for availability lookups
+        self._item_index = defaultdict(list)
+        for key in self._snapshot:
+            self._item_index[(key[0], key[2])].append(key)
+
+        # (fg, plant) -> (resolution_type, resolved_root, nodes, leaf positions)
+        self._templates = {}
+
+        self.logger.info(
+            "ATP engine ready | Stock keys=%d | BOM roots=%d",
+            len(self._snapshot), len(bom_tree.bom_tree_map)
+        )
+
+    # ---------------- TEMPLATES ----------------
+    def _template(self, fg, plant):
+        """
+        BFS explosion order from fg as (item, parent_pos, ratio, level) tuples;
+        parent_pos indexes the same list (-1 for the ordered item).
+        Leaf positions are where unmet demand becomes a shortage.
+        """
+        cache_key = (fg, plant)
+        template = self._templates.get(cache_key)
+        if template is not None:
+            return template
+
+        resolved_root, tree, resolution_type = self.bom_tree.resolve_fg(fg, plant)
+        nodes = []
+        if resolution_type != "NOT_FOUND" and tree:
+            explosion = self.bom_tree.explosion(resolved_root, plant, fg)
+            if len(explosion) > self.max_nodes:
+                raise ValueError(
+                    f"BOM explosion of '{self.keys.decode(fg)}' at plant "
+                    f"'{self.keys.decode(plant)}' exceeds {self.max_nodes} nodes"
+                )
+            nodes = list(zip(
+                explosion.items, explosion.parent_pos,
+                [1.0 if r is None else r for r in explosion.ratios], explosion.levels
+            ))
+
+        has_children = set(parent_pos for _, parent_pos, _, _ in nodes)
+        leaves = [pos for pos in range(len(nodes)) if pos not in has_children]
+        template = (resolution_type, resolved_root, nodes, leaves)
+        self._templates[cache_key] = template
+        return template
+
+    # ---------------- QUERIES ----------------
+    def _dry_run(self, nodes, plant, so_id, qty):
+        """Returns (allocated per node, remaining per node)."""
+        availability = self.availability
+        consumed = {}
+        allocated = [0.0] * len(nodes)
+        remaining = [0.0] * len(nodes)
+
+        for pos, (item, parent_pos, ratio, _) in enumerate(nodes):
+            demand = qty if parent_pos < 0 else remaining[parent_pos] * ratio
+            if demand <= 0:
+                continue
+
+            key = (plant, so_id, item)
+            if key not in availability:
+                key = (plant, None, item)
+            available = availability.get(key, 0.0) - consumed.get(key, 0.0)
+            used = min(max(available, 0.0), demand)
+            if used > 0:
+                consumed[key] = consumed.get(key, 0.0) + used
+            allocated[pos] = used
+            remaining[pos] = demand - used
+
+        return allocated, remaining
+
+    def query(self, fg_id, plant, qty, so_id=None, max_qty=False) -> dict:
+        """
+        Answers one ATP query. Ids are strings as they appear in the inputs.
+        With max_qty, also returns the largest feasible quantity (<= qty),
+        found by bisection over dry runs.
+        """
+        qty = float(qty or 0)
+        result = {"fg_id": fg_id, "plant": plant, "qty": qty, "so_id": so_id}
+
+        fg = self.keys.lookup(fg_id)
+        plant_key = self.keys.lookup(plant)
+        so_key = self.keys.lookup(so_id) if so_id is not None else None
+        resolution_type, resolved_root, nodes, leaves = (
+            self._template(fg, plant_key) if fg is not None and plant_key is not None
+            else ("NOT_FOUND", None, [], [])
+        )
+
+        result["resolution"] = resolution_type
+        result["resolved_root"] = self.keys.decode(resolved_root)
+        if not nodes:
+            result.update(feasible=False, shortages=[], status="NO_BOM")
+            return result
+
+        def shortages_for(q):
+            allocated, remaining = self._dry_run(nodes, plant_key, so_key, q)
+            return allocated, [pos for pos in leaves if remaining[pos] > 1e-9], remaining
+
+        allocated, short_positions, remaining = shortages_for(qty)
+        result["feasible"] = not short_positions
+        result["status"] = "OK" if not short_positions else "SHORT"
+        result["allocated_from_stock"] = sum(allocated)
+        result["shortages"] = [
+            {
+                "item": self.keys.decode(nodes[pos][0]),
+                "parent": self.keys.decode(nodes[nodes[pos][1]][0]) if nodes[pos][1] >= 0 else None,
+                "level": nodes[pos][3],
+                "short_qty": remaining[pos],
+            }
+            for pos in short_positions
+        ]
+
+        if max_qty:
+            if not short_positions:
+                result["max_qty"] = qty
+            else:
+                lo, hi = 0.0, qty
+                for _ in range(40):
+                    mid = (lo + hi) / 2
+                    if shortages_for(mid)[1]:
+                        hi = mid
+                    else:
+                        lo = mid
+                    if hi - lo <= 1e-6 * max(qty, 1.0):
+                        break
+                result["max_qty"] = lo
+        return result
+
+    def query_batch(self, queries: list) -> list:
+        """Answers a list of query dicts; a bad query yields an error entry instead of failing the batch."""
+        results = []
+        for q in queries:
+            try:
+                results.append(self.query(
+                    q["fg_id"], q["plant"], q["qty"],
+                    so_id=q.get("so_id"), max_qty=bool(q.get("max_qty", False))
+                ))
+            except (KeyError, TypeError, ValueError) as e:
+                results.append({"query": q, "error": f"{type(e).__name__}: {e}"})
+        return results
+
+    def item_availability(self, item_id, plant) -> list:
+        """Snapshot buckets of every stock key (SO- and ITEM-level) for an item at a plant."""
+        item = self.keys.lookup(item_id)
+        plant_key = self.keys.lookup(plant)
+        return [
+            {
+                "order_id": self.keys.decode(key[1]),
+                "item_id": item_id,
+                "plant": plant,
+                **self._snapshot[key],
+                "available": self.availability[key],
+            }
+            for key in self._item_index.get((plant_key, item), [])
+        ]
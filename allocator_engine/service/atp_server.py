@@ -0,0 +1,195 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from service.atp_engine import ATPEngine
+
+
+class LatencyStats:
+    """Rolling request latencies (last `window` requests) and batch counters."""
+
+    def __init__(self, window: int = 10_000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.started = time.time()
+        self.requests = 0
+        self.queries = 0
+        self.batches = 0
+        self.errors = 0
+
+    def record(self, seconds: float, queries: int = 1):
+        with self._lock:
+            self._latencies.append(seconds)
+            self.requests += 1
+            self.queries += queries
+
+    def record_batch(self):
+        with self._lock:
+            self.batches += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "queries": self.queries,
+                "batches": self.batches,
+                "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+                "errors": self.errors,
+            }
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e3, 3)
+
+        stats["latency_ms"] = {f"p{p}": percentile(p) for p in (50, 90, 95, 99)}
+        stats["latency_ms"]["max"] = round(latencies[-1] * 1e3, 3) if latencies else None
+        return stats
+
+
+class QueryBatcher:
+    """
+    Collects single queries arriving on concurrent HTTP threads and answers
+    them in batches on one worker thread: the first waiting query opens a
+    batch, which closes after batch_window_ms or max_batch_size queries.
+    Keeps ATPEngine single-threaded (its template cache is not locked).
+    """
+
+    def __init__(self, engine: ATPEngine, stats: LatencyStats, batch_window_ms: float = 2.0, max_batch_size: int = 256):
+        self.engine = engine
+        self.stats = stats
+        self.batch_window = batch_window_ms / 1e3
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="atp_batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, queries: list) -> Future:
+        """Queues a list of queries; the future resolves to their results."""
+        future = Future()
+        self._queue.put((queries, future))
+        return future
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.perf_counter() + self.batch_window
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            try:
+                results = self.engine.query_batch([q for queries, _ in pending for q in queries])
+            except Exception as e:
+                self.stats.record_error()
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.stats.record_batch()
+            pos = 0
+            for queries, future in pending:
+                future.set_result(results[pos:pos + len(queries)])
+                pos += len(queries)
+
+
+class ATPRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health
+    GET  /stats
+    GET  /availability?item_id=..&plant=..
+    POST /atp          {"fg_id", "plant", "qty", ["so_id"], ["max_qty"]}
+    POST /atp/batch    {"queries": [...]}
+    """
+
+    server_version = "ATPService/1.0"
+
+    def log_message(self, format, *args):
+        self.server.logger.debug("ATP %s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        elif url.path == "/availability":
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if "item_id" not in params or "plant" not in params:
+                self._send_json(400, {"error": "item_id and plant are required"})
+                return
+            self._send_json(200, self.server.engine.item_availability(params["item_id"], params["plant"]))
+        else:
+            self._send_json(404, {"error": f"Unknown path: {url.path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        path = urlparse(self.path).path
+        try:
+            payload = self._read_json()
+        except (ValueError, UnicodeDecodeError) as e:
+            self.server.stats.record_error()
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+
+        if path == "/atp":
+            queries, single = [payload], True
+        elif path == "/atp/batch":
+            if not isinstance(payload, dict) or not isinstance(payload.get("queries"), list):
+                self._send_json(400, {"error": "Expected {\"queries\": [...]}"})
+                return
+            queries, single = payload["queries"], False
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+            return
+
+        try:
+            results = self.server.batcher.submit(queries).result()
+        except Exception as e:
+            self.server.logger.error("ATP query failed: %s", str(e), exc_info=True)
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, results[0] if single else {"results": results})
+        self.server.stats.record(time.perf_counter() - start, len(queries))
+
+
+class ATPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, engine: ATPEngine, logger, batch_window_ms=2.0, max_batch_size=256):
+        super().__init__(address, ATPRequestHandler)
+        self.engine = engine
+        self.logger = logger
+        self.stats = LatencyStats()
+        self.batcher = QueryBatcher(engine, self.stats, batch_window_ms, max_batch_size)
@@ -0,0 +1,44 @@
+import argparse
+from pathlib import Path
+import polars as pl
+import yaml
+
+from common.shortage_index import ShortageIndex
+
+# --------------------------------------------------
+# Resolve paths
+# --------------------------------------------------
+BASE_DIR = Path(__file__).resolve().parent
+CONFIG_PATH = BASE_DIR / "config" / "config.yaml"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Impact of a component shortage, from the shortage index of the last run "
+                    "(component_allocation.shortage_index: true)."
+    )
+    parser.add_argument("item_id")
+    parser.add_argument("plant")
+    parser.add_argument("--index-dir", help="Folder with the index files (default: component phase output_path)")
+    parser.add_argument("--limit", type=int, default=50, help="Rows to print per table")
+    args = parser.parse_args()
+
+    if args.index_dir:
+        index_dir = Path(args.index_dir)
+    else:
+        with open(CONFIG_PATH, "r") as f:
+            config = yaml.safe_load(f)
+        index_dir = Path(config["base_path"]) / config["phases"]["component_allocation"]["output_path"]
+
+    impact = ShortageIndex.load(index_dir).impact(args.item_id, args.plant)
+
+    print(f"Shortage impact | Item={impact['item_id']} | Plant={impact['plant']}")
+    print(f"Blocked SOs={impact['blocked_so_count']} | Total shortfall={impact['total_shortfall']}")
+    print(f"Used in {len(impact['affected_roots'])} finished good(s): {impact['affected_roots'][:args.limit]}")
+    with pl.Config(tbl_rows=args.limit, fmt_str_lengths=120):
+        print(impact["blocked_orders"].head(args.limit))
+        print(impact["where_used"].head(args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import gzip
+import logging.handlers
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG_COMPRESSIONS = ("gzip", "zstd", "none")
+_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+# One background thread compresses the rotated segments of every handler in
+# rotation order, so pruning never races a segment still being compressed
+_compressor = None
+_compressor_lock = threading.Lock()
+
+
+def _compress_executor() -> ThreadPoolExecutor:
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log_compress")
+        return _compressor
+
+
+def available_compression(compression: str) -> str:
+    """compression if usable here: zstd needs the optional zstandard package, gzip is used otherwise."""
+    compression = str(compression or "none").lower()
+    if compression not in LOG_COMPRESSIONS:
+        raise ValueError(f"Unsupported log compression: {compression} (expected one of {LOG_COMPRESSIONS})")
+    if compression == "zstd" and zstandard is None:
+        return "gzip"
+    return compression
+
+
+def _compress_file(path: Path, compression: str) -> Path:
+    if compression == "none":
+        return path
+    target = path.with_name(path.name + _SUFFIXES[compression])
+    with open(path, "rb") as src:
+        if compression == "gzip":
+            with gzip.open(target, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            with open(target, "wb") as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+    path.unlink()
+    return target
+
+
+class CompressingRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    File handler rolling over when the file reaches max_bytes or has been
+    open for interval_s (0 disables either trigger). The full file is renamed
+    to a numbered segment (<stem>.001.log, .002, ...) and compressed on a
+    background thread, so logging never waits for compression; only the
+    newest backup_count segments are kept (0 keeps all).
+
+    Segments are never renamed once written, unlike RotatingFileHandler's
+    shifting backups, so the compressor can work on them while the run goes on.
+    """
+
+    def __init__(self, filename, max_bytes: int = 0, interval_s: float = 0, backup_count: int = 0,
+                 compression: str = "gzip", encoding=None):
+        super().__init__(filename, mode="a", encoding=encoding, delay=False)
+        self.max_bytes = max(0, int(max_bytes))
+        self.interval_s = max(0.0, float(interval_s))
+        self.backup_count = max(0, int(backup_count))
+        self.compression = available_compression(compression)
+        self.segment = 0
+        self._segments = []
+        self._pending = []
+        self._rollover_at = self._next_rollover()
+
+    def _next_rollover(self):
+        return time.time() + self.interval_s if self.interval_s else None
+
+    def shouldRollover(self, record) -> bool:
+        if self._rollover_at is not None and time.time() >= self._rollover_at:
+            return True
+        if self.max_bytes:
+            if self.stream is None:
+                self.stream = self._open()
+            size = self.stream.tell()
+            # Never rotate an empty file, even for a record above max_bytes
+            return size > 0 and size + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        base = Path(self.baseFilename)
+        self.segment += 1
+        segment = base.with_name(f"{base.stem}.{self.segment:03d}{base.suffix}")
+        if base.exists() and base.stat().st_size:
+            os.replace(base, segment)
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(_compress_executor().submit(self._finish_segment, segment))
+
+        self.stream = self._open()
+        self._rollover_at = self._next_rollover()
+
+    def _finish_segment(self, segment: Path):
+        # Runs on the compressor thread only, so _segments needs no lock
+        self._segments.append(_compress_file(segment, self.compression))
+        if self.backup_count:
+            while len(self._segments) > self.backup_count:
+                self._segments.pop(0).unlink(missing_ok=True)
+
+    def close(self):
+        wait(self._pending)
+        super().close()
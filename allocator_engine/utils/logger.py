@@ -1,8 +1,9 @@
-from asyncio.log import logger
 import logging
 from pathlib import Path
 from datetime import datetime
 
+from utils.log_rotation import CompressingRotatingFileHandler, available_compression
+
 LOG_LEVELS = {
     "DEBUG": logging.DEBUG,
     "INFO": logging.INFO,
@@ -10,13 +11,68 @@ LOG_LEVELS = {
     "ERROR": logging.ERROR,
 }
 
-class EngineLogger:
-    def __init__(self, base_path: str, client: str = "UNKNOWN", level: str = "INFO"):
+# Logger categories with their own level (logging.categories in config.yaml):
+# pipeline = AllocationPipeline / EngineLogger itself, stock = StockPreparer
+# and StockManager, allocator = order / component allocation strategies
+LOG_CATEGORIES = ("pipeline", "stock", "allocator")
+
+
+class CategoryLogger:
+    """
+    EngineLogger's logging methods over one category's logging.Logger. The
+    category logger hands records to the run's handlers; only its level is
+    its own, so a hot-path category can be silenced on its own.
+    """
+
+    def __init__(self, logger: logging.Logger, run_ts: str | None = None):
+        self.logger = logger
+        self.run_ts = run_ts
+
+    # ---------------- PUBLIC METHODS ----------------
+    def info(self, msg: str, *args):
+        self.logger.info(msg, *args)
+
+    def warning(self, msg: str, *args):
+        self.logger.warning(msg, *args)
+
+    def error(self, msg: str, *args, exc_info=False):
+        self.logger.error(msg, *args, exc_info=exc_info)
+
+    def debug(self, msg: str, *args):
+        self.logger.debug(msg, *args)
+
+    def critical(self, msg: str, *args, exc_info=False):
+        self.logger.critical(msg, *args, exc_info=exc_info)
+
+    def exception(self, msg: str, *args):
+        self.logger.exception(msg, *args)
+
+
+class EngineLogger(CategoryLogger):
+    def __init__(self, base_path: str, client: str = "UNKNOWN", level: str = "INFO",
+                 console_level: str | None = None, categories: dict | None = None, rotation: dict | None = None):
+        """
+        :param level: file log level (and default of every category)
+        :param console_level: console level, default level; the console only
+            shows what the file would get, so it can only be quieter
+        :param categories: {category: level} overrides, see LOG_CATEGORIES
+        :param rotation: {max_mb, interval_min, backup_count, compression}
+            for the run log (None = one unbounded file)
+        """
         self.base_path = Path(base_path)
         self.client = client
 
         self.level_name = level.upper()
         self.level = LOG_LEVELS.get(self.level_name, logging.INFO)
+        self.console_level = LOG_LEVELS.get(str(console_level or self.level_name).upper(), self.level)
+        unknown = set(categories or {}) - set(LOG_CATEGORIES)
+        if unknown:
+            raise ValueError(f"Unknown logging categories: {sorted(unknown)} (expected some of {LOG_CATEGORIES})")
+        self.category_levels = {
+            name: LOG_LEVELS.get(str((categories or {}).get(name) or self.level_name).upper(), self.level)
+            for name in LOG_CATEGORIES
+        }
+        self.rotation = rotation
 
         self.run_dt = datetime.now()
         self.run_date = self.run_dt.strftime("%d-%m-%Y")
@@ -28,14 +84,32 @@ class EngineLogger:
         self.normal_log_file = self.log_dir / f"allocator_engine_{self.run_ts}.log"
         self.error_log_file = self.log_dir / f"Error_{self.run_ts}.log"
 
-        self.logger = self._setup_logger()
+        super().__init__(self._setup_logger(), self.run_ts)
+        self._categories = {}
 
         self._write_run_header()
+        if rotation and str(rotation.get("compression", "gzip")).lower() == "zstd" \
+                and available_compression("zstd") != "zstd":
+            self.warning("zstd log compression needs the zstandard package; rotated logs are gzip-compressed.")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """EngineLogger for a loaded config.yaml (base_path, client and the logging block)."""
+        logging_cfg = config.get("logging", {}) or {}
+        rotation = logging_cfg.get("rotation") or {}
+        return cls(
+            base_path=config["base_path"],
+            client=config.get("client", "UNKNOWN"),
+            level=logging_cfg.get("level", "INFO"),
+            console_level=logging_cfg.get("console_level"),
+            categories=logging_cfg.get("categories"),
+            rotation=rotation if rotation.get("enabled", False) else None,
+        )
 
     # ---------------- SETUP ----------------
     def _setup_logger(self):
         logger = logging.getLogger(f"allocator_engine_{self.run_ts}")
-        logger.setLevel(self.level)
+        logger.setLevel(self.category_levels["pipeline"])
         logger.propagate = False
 
         formatter = logging.Formatter(
@@ -43,8 +117,18 @@ class EngineLogger:
             datefmt="%Y-%m-%d %H:%M:%S"
         )
 
-        normal_handler = logging.FileHandler(self.normal_log_file, mode="a")
-        normal_handler.setLevel(self.level)
+        # Levels are decided by the (category) loggers; handlers take all
+        # they are given, except the console and the error file
+        if self.rotation:
+            normal_handler = CompressingRotatingFileHandler(
+                self.normal_log_file,
+                max_bytes=float(self.rotation.get("max_mb") or 0) * 1024 * 1024,
+                interval_s=float(self.rotation.get("interval_min") or 0) * 60,
+                backup_count=self.rotation.get("backup_count") or 0,
+                compression=self.rotation.get("compression", "gzip"),
+            )
+        else:
+            normal_handler = logging.FileHandler(self.normal_log_file, mode="a")
         normal_handler.setFormatter(formatter)
 
         error_handler = logging.FileHandler(self.error_log_file, mode="a")
@@ -52,7 +136,7 @@ class EngineLogger:
         error_handler.setFormatter(formatter)
 
         console_handler = logging.StreamHandler()
-        console_handler.setLevel(self.level)
+        console_handler.setLevel(self.console_level)
         console_handler.setFormatter(formatter)
 
         logger.addHandler(normal_handler)
@@ -61,6 +145,17 @@ class EngineLogger:
 
         return logger
 
+    def category(self, name: str) -> CategoryLogger:
+        """Logger of one category (see LOG_CATEGORIES); pipeline is this logger itself."""
+        if name not in LOG_CATEGORIES:
+            raise ValueError(f"Unknown logging category: {name} (expected one of {LOG_CATEGORIES})")
+        if name == "pipeline":
+            return self
+        if name not in self._categories:
+            child = self.logger.getChild(name)
+            child.setLevel(self.category_levels[name])
+            self._categories[name] = CategoryLogger(child, self.run_ts)
+        return self._categories[name]
 
     # ---------------- HEADER / FOOTER ----------------
     def _write_run_header(self):
@@ -79,22 +174,13 @@ class EngineLogger:
         )
         self.logger.info(footer, extra={"end": "\n"})
 
-    # ---------------- PUBLIC METHODS ----------------
-    def info(self, msg: str, *args):
-        self.logger.info(msg, *args)
+    def close(self):
+        """Flushes and detaches the run's handlers (another run may reuse the logger name in this process)."""
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
 
-    def warning(self, msg: str, *args):
-        self.logger.warning(msg, *args)
-
-    def error(self, msg: str, exc_info=False, *args):
-        self.logger.error(msg, exc_info=exc_info, *args)
-
-    def debug(self, msg: str, *args):
-        self.logger.debug(msg, *args)
-
-    def critical(self, msg: str, exc_info=False, *args):
-        self.logger.critical(msg, exc_info=exc_info, *args)
-
-    def exception(self, msg: str, *args):
-        self.logger.exception(msg, *args)
 
+def category_logger(logger, name: str):
+    """logger's category name when it is an EngineLogger; any other logger is used as is."""
+    return logger.category(name) if isinstance(logger, EngineLogger) else logger
@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+class MemoryBudgetError(RuntimeError):
+    """Raised when a stage's memory report exceeds a configured budget."""
+
+
+def deep_sizeof(obj, sample_size: int = 1000, _seen=None) -> int:
+    """
+    Approximate deep size in bytes of obj: the object itself plus everything
+    reachable through containers, __dict__ and __slots__. Objects shared by
+    reference are counted once.
+
+    Containers with more than sample_size entries are estimated: an evenly
+    strided sample of sample_size entries is measured and scaled to the
+    full length, so large dicts cost O(sample_size), not O(n).
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, _CONTAINERS):
+        entries = obj.items() if isinstance(obj, dict) else obj
+        n = len(obj)
+        if n == 0:
+            return size
+        step = max(1, n // sample_size) if sample_size else 1
+        measured = count = 0
+        for i, entry in enumerate(entries):
+            if i % step:
+                continue
+            if isinstance(obj, dict):
+                measured += deep_sizeof(entry[0], sample_size, seen) + deep_sizeof(entry[1], sample_size, seen)
+            else:
+                measured += deep_sizeof(entry, sample_size, seen)
+            count += 1
+        return size + (measured * n // count if step > 1 else measured)
+
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), sample_size, seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), sample_size, seen)
+    return size
+
+
+def frame_size(df) -> int:
+    """Estimated in-memory size of a Polars frame (0 for None)."""
+    return int(df.estimated_size()) if df is not None else 0
+
+
+def total_bytes(report: dict) -> int:
+    return sum(v for k, v in report.items() if k.endswith("_bytes") and isinstance(v, int))
+
+
+def process_memory() -> dict:
+    """
+    Current and peak resident set size of this process in bytes.
+    Values are None where the platform does not expose them.
+    """
+    rss = peak = None
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+        import os
+        rss = pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        peak = peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    return {"rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+def format_bytes(n) -> str:
+    if n is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+
+
+def check_memory_budget(name: str, used_bytes, budgets_mb: dict, stage: str) -> None:
+    """Raises MemoryBudgetError if used_bytes exceeds budgets_mb[name] (MB; missing/null = no limit)."""
+    budget = (budgets_mb or {}).get(name)
+    if budget is None or used_bytes is None:
+        return
+    if used_bytes > float(budget) * 1024 * 1024:
+        raise MemoryBudgetError(
+            f"Memory budget exceeded after {stage}: {name} uses {format_bytes(used_bytes)} "
+            f"(budget {budget} MB)"
+        )
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+class ProgressReporter:
+    """
+    Heartbeats for long allocation loops: SOs done / total, BOM nodes
+    visited, orders/s, consumes/s and ETA, logged and appended as one JSON
+    line per heartbeat to metrics_path (for external monitors to tail).
+
+    Rate-limited by time: advance() only adds to counters and compares the
+    clock with the next deadline, so calling it once per SO costs nothing
+    noticeable. Rates are measured over the last interval; the ETA uses the
+    average order rate since start. Safe to call from worker threads.
+    """
+
+    def __init__(self, logger, phase: str, total_orders: int, interval_s: float = 10.0,
+                 metrics_path=None, consumes=None, run_id=None):
+        """
+        consumes: callable returning the number of stock consumes so far
+        (e.g. StockManager.consumes), read at heartbeats only.
+        """
+        self.logger = logger
+        self.phase = phase
+        self.total_orders = int(total_orders)
+        self.interval_s = max(0.0, float(interval_s))
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+        self._consumes = consumes or (lambda: 0)
+        self.run_id = run_id
+
+        self.orders_done = 0
+        self.nodes_visited = 0
+        self._extra_consumes = 0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._next = self._start + self.interval_s
+        self._last = (self._start, 0, self._consumes())
+        self._consumes_start = self._last[2]
+
+        if self.metrics_path is not None:
+            self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def advance(self, orders: int = 1, nodes: int = 0, consumes: int = 0) -> None:
+        """consumes: stock consumes the consumes callable cannot see (made in worker processes)."""
+        with self._lock:
+            self.orders_done += orders
+            self.nodes_visited += nodes
+            self._extra_consumes += consumes
+            now = time.monotonic()
+            if now < self._next:
+                return
+            self._next = now + self.interval_s
+            self._heartbeat(now, final=False)
+
+    def finish(self) -> dict:
+        """Emits the final heartbeat (always, whatever the interval) and returns it."""
+        with self._lock:
+            return self._heartbeat(time.monotonic(), final=True)
+
+    def _heartbeat(self, now: float, final: bool) -> dict:
+        consumes = self._consumes() - self._consumes_start + self._extra_consumes
+        last_t, last_orders, last_consumes = self._last
+        window = now - last_t
+        elapsed = now - self._start
+        self._last = (now, self.orders_done, consumes)
+
+        remaining = max(0, self.total_orders - self.orders_done)
+        avg_rate = self.orders_done / elapsed if elapsed > 0 else 0.0
+        record = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "run": self.run_id,
+            "phase": self.phase,
+            "final": final,
+            "elapsed_s": round(elapsed, 3),
+            "orders_done": self.orders_done,
+            "orders_total": self.total_orders,
+            "pct": round(100.0 * self.orders_done / self.total_orders, 2) if self.total_orders else 100.0,
+            "nodes_visited": self.nodes_visited,
+            "consumes": consumes,
+            "orders_per_s": round((self.orders_done - last_orders) / window, 1) if window > 0 else None,
+            "consumes_per_s": round((consumes - last_consumes) / window, 1) if window > 0 else None,
+            "eta_s": 0.0 if final or not remaining else (round(remaining / avg_rate, 1) if avg_rate > 0 else None),
+        }
+
+        self.logger.info(
+            "Progress | %s | SOs %d/%d (%.1f%%) | Nodes=%d | Consumes=%d | %s SO/s | %s consumes/s | ETA %s%s",
+            self.phase, record["orders_done"], record["orders_total"], record["pct"], record["nodes_visited"],
+            record["consumes"], record["orders_per_s"], record["consumes_per_s"],
+            "n/a" if record["eta_s"] is None else f"{record['eta_s']}s", " | done" if final else ""
+        )
+        if self.metrics_path is not None:
+            with open(self.metrics_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
@@ -1,5 +1,16 @@
 import polars as pl
 import re
+from functools import lru_cache
+
+# dtype names accepted in the `schemas:` config
+READ_DTYPES = {
+    "str": pl.Utf8,
+    "string": pl.Utf8,
+    "categorical": pl.Categorical,
+    "float": pl.Float64,
+    "int": pl.Int64,
+    "date": pl.Date,
+}
 
 class SchemaResolver:
 
@@ -15,6 +26,114 @@ class SchemaResolver:
         col = re.sub(r"\s+", " ", col)
         return col
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _normalized_columns(columns: tuple) -> dict:
+        return {SchemaResolver._normalize(c): c for c in columns}
+
+    @staticmethod
+    def normalized_columns(columns) -> dict:
+        """
+        {normalized name: actual name} of a header. Cached per header, so
+        preflight, read overrides and resolve normalize each file's columns
+        once. The returned dict is shared: do not modify it.
+        """
+        return SchemaResolver._normalized_columns(tuple(columns))
+
+    @staticmethod
+    def column_name(spec) -> str:
+        """
+        Schema entries are either a plain column name or a mapping
+        {column: <name>, dtype: <dtype>, categories: [...]}
+        """
+        if isinstance(spec, dict):
+            return spec["column"]
+        return spec
+
+    @staticmethod
+    def read_dtype(spec):
+        """
+        Polars dtype requested for a schema entry, or None to let Polars infer.
+        `enum` requires a `categories` list.
+        """
+        if not isinstance(spec, dict) or not spec.get("dtype"):
+            return None
+
+        dtype_name = str(spec["dtype"]).strip().lower()
+        if dtype_name == "enum":
+            categories = spec.get("categories")
+            if not categories:
+                raise ValueError(
+                    f"Schema column '{spec['column']}' uses dtype 'enum' without categories"
+                )
+            return pl.Enum([str(c) for c in categories])
+
+        if dtype_name not in READ_DTYPES:
+            raise ValueError(
+                f"Unsupported dtype '{spec['dtype']}' for schema column '{spec['column']}'. "
+                f"Expected one of {sorted(READ_DTYPES) + ['enum']}"
+            )
+        return READ_DTYPES[dtype_name]
+
+    @staticmethod
+    def uses_categorical(schemas: dict) -> bool:
+        for schema_cfg in schemas.values():
+            for spec in schema_cfg.values():
+                dtype = SchemaResolver.read_dtype(spec)
+                if dtype == pl.Categorical or isinstance(dtype, pl.Enum):
+                    return True
+        return False
+
+    @staticmethod
+    def read_overrides(header_cols: list, schema_cfg: dict, required_keys: list) -> dict:
+        """
+        Maps the actual CSV header names of required columns to their
+        configured dtypes, so the CSV reader parses them directly.
+        Columns that cannot be matched are left to `resolve` to report.
+        """
+        normalized_header = SchemaResolver.normalized_columns(header_cols)
+
+        overrides = {}
+        for key in required_keys:
+            spec = schema_cfg.get(key)
+            if spec is None:
+                continue
+            dtype = SchemaResolver.read_dtype(spec)
+            actual_col = normalized_header.get(
+                SchemaResolver._normalize(SchemaResolver.column_name(spec))
+            )
+            if dtype is not None and actual_col is not None:
+                overrides[actual_col] = dtype
+        return overrides
+
+    @staticmethod
+    def strip_key_exprs(df: pl.DataFrame, cols: list) -> list:
+        """
+        Strip expressions for key columns.
+        Categorical columns are only round-tripped through Utf8 when one of
+        their values actually carries surrounding whitespace.
+        """
+        exprs = []
+        for c in cols:
+            dtype = df.schema[c]
+            if dtype == pl.Categorical or isinstance(dtype, pl.Enum):
+                values = df[c].unique().drop_nulls().cast(pl.Utf8)
+                if (values == values.str.strip_chars()).all():
+                    continue
+                exprs.append(pl.col(c).cast(pl.Utf8).str.strip_chars().cast(pl.Categorical))
+            else:
+                exprs.append(pl.col(c).cast(pl.Utf8).str.strip_chars())
+        return exprs
+
+    @staticmethod
+    def present_keys(columns, schema_cfg: dict, keys: list) -> list:
+        """Those of keys that are configured in schema_cfg and present in columns."""
+        normalized = SchemaResolver.normalized_columns(columns)
+        return [
+            k for k in keys
+            if k in schema_cfg and SchemaResolver._normalize(SchemaResolver.column_name(schema_cfg[k])) in normalized
+        ]
+
     @staticmethod
     def resolve(
         df: pl.DataFrame,
@@ -38,16 +157,13 @@ class SchemaResolver:
             raise ValueError("Invalid schema configuration")
 
         # Build normalized lookup of dataframe columns
-        df_cols = df.columns
-        normalized_df_cols = {
-            SchemaResolver._normalize(c): c for c in df_cols
-        }
+        normalized_df_cols = SchemaResolver.normalized_columns(df.columns)
 
         rename_map = {}
 
         # Resolve required columns
         for key in required_keys:
-            expected_col = schema_cfg[key]
+            expected_col = SchemaResolver.column_name(schema_cfg[key])
             norm_expected = SchemaResolver._normalize(expected_col)
 
             if norm_expected not in normalized_df_cols: